@@ -0,0 +1,81 @@
+from src.browser_profile import BrowserProfile
+from dotenv import load_dotenv
+from playwright.sync_api import sync_playwright
+import argparse
+import logging
+import os
+import statistics
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _profile(name):
+    """Construye el perfil indicado ignorando los ajustes del .env."""
+    os.environ["BROWSER_PROFILE"] = name
+    for var in ("BROWSER_HEADLESS", "BROWSER_BLOCK_RESOURCES", "BROWSER_BLOCK_HOSTS",
+                "BROWSER_VIEWPORT"):
+        os.environ.pop(var, None)
+    profile = BrowserProfile.from_env(default_viewport={"width": 1366, "height": 768})
+    # Ambas mediciones sin ventana para comparar solo el efecto del bloqueo
+    profile.headless = True
+    return profile
+
+
+def measure(playwright, profile, url, runs):
+    """Carga la URL ``runs`` veces y devuelve tiempos (s) y bytes por carga."""
+    browser = playwright.chromium.launch(headless=profile.headless, channel="chrome")
+    timings = []
+    transferred = []
+    try:
+        for _ in range(runs):
+            # Contexto nuevo en cada carga para no medir la caché
+            context = browser.new_context(viewport=profile.viewport)
+            profile.apply(context)
+            page = context.new_page()
+            finished = []
+            page.on("requestfinished", finished.append)
+
+            start = time.monotonic()
+            page.goto(url, wait_until="load")
+            timings.append(time.monotonic() - start)
+
+            total = 0
+            for request in finished:
+                sizes = request.sizes()
+                total += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+            transferred.append(total)
+            context.close()
+    finally:
+        browser.close()
+    return timings, transferred
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Compara la carga de una página con y sin el perfil de producción"
+    )
+    parser.add_argument("url", nargs="?", default=os.getenv("ERP_URL"))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    if not args.url:
+        raise ValueError("Indique la URL a medir o configure ERP_URL")
+
+    with sync_playwright() as playwright:
+        for name in ("default", "production"):
+            timings, transferred = measure(playwright, _profile(name), args.url, args.runs)
+            logger.info(
+                f"Perfil {name:<10} carga p50 {statistics.median(timings) * 1000:.0f} ms, "
+                f"máx {max(timings) * 1000:.0f} ms, "
+                f"{statistics.mean(transferred) / 1024:.1f} KiB transferidos por carga"
+            )
+
+
+if __name__ == "__main__":
+    # Configuración de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    main()
@@ -0,0 +1,157 @@
+from src.captcha_solver import CaptchaSolver, DEFAULT_WHITELIST, preprocess_variants
+from PIL import Image, ImageDraw
+import argparse
+import io
+import logging
+import os
+import random
+import statistics
+import time
+import pytesseract
+
+logger = logging.getLogger(__name__)
+
+
+def load_corpus(directory):
+    """Lee las imágenes del corpus; el nombre del fichero (sin extensión) es la respuesta."""
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp")):
+            with open(os.path.join(directory, name), "rb") as f:
+                corpus.append((os.path.splitext(name)[0].upper(), f.read()))
+    return corpus
+
+
+def synthetic_corpus(count, length=5, seed=0):
+    """Genera captchas sencillos con ruido cuando no hay un corpus local."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        label = "".join(rng.choice(DEFAULT_WHITELIST) for _ in range(length))
+        image = Image.new("L", (160, 50), 255)
+        draw = ImageDraw.Draw(image)
+        for _ in range(200):
+            draw.point((rng.randrange(160), rng.randrange(50)), fill=rng.randrange(256))
+        draw.text((20, 18), " ".join(label), fill=0)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        corpus.append((label, buffer.getvalue()))
+    return corpus
+
+
+def solve_legacy(solver, images):
+    """Ruta anterior: un proceso de tesseract por captcha, sin restricciones."""
+    return [
+        solver.clean_text(pytesseract.image_to_string(Image.open(io.BytesIO(image)).convert("L")))
+        for image in images
+    ]
+
+
+def measure_preprocessing(corpus):
+    """Tiempo medio (ms) de generar las variantes de un captcha."""
+    timings = []
+    for _, image in corpus:
+        start = time.monotonic()
+        preprocess_variants(image)
+        timings.append((time.monotonic() - start) * 1000)
+    logger.info(
+        f"Preprocesamiento: {statistics.mean(timings):.1f} ms de media, "
+        f"p95 {sorted(timings)[int(len(timings) * 0.95)]:.1f} ms por captcha"
+    )
+
+
+def measure_accuracy(solver, corpus):
+    """Aciertos y latencia de escala de grises + 1 OCR frente a variantes + votación."""
+    baseline = []
+    start = time.monotonic()
+    for _, image in corpus:
+        gray = Image.open(io.BytesIO(image)).convert("L")
+        baseline.append(solver.clean_text(solver.engine.recognize([gray])[0]))
+    baseline_elapsed = time.monotonic() - start
+
+    start = time.monotonic()
+    voted = [solver.solve_with_confidence(image) for _, image in corpus]
+    voted_elapsed = time.monotonic() - start
+
+    labels = [label for label, _ in corpus]
+    for name, answers, elapsed in (
+        ("solo escala de grises", baseline, baseline_elapsed),
+        ("variantes + votación", [text for text, _ in voted], voted_elapsed),
+    ):
+        correct = sum(answer == label for answer, label in zip(answers, labels))
+        logger.info(
+            f"{name}: {correct}/{len(corpus)} aciertos ({correct / len(corpus):.0%}), "
+            f"{elapsed * 1000 / len(corpus):.0f} ms por captcha"
+        )
+
+    confident = [
+        text == label
+        for (text, confidence), label in zip(voted, labels)
+        if confidence >= solver.min_confidence
+    ]
+    if confident:
+        logger.info(
+            f"Con confianza >= {solver.min_confidence:.0%}: {sum(confident)}/{len(confident)} "
+            f"aciertos; {len(corpus) - len(confident)} captchas se volverían a pedir"
+        )
+
+
+def measure(name, solve, corpus, batch_size):
+    """Resuelve el corpus en lotes y devuelve captchas/s y aciertos."""
+    start = time.monotonic()
+    answers = []
+    for offset in range(0, len(corpus), batch_size):
+        answers.extend(solve([image for _, image in corpus[offset:offset + batch_size]]))
+    elapsed = time.monotonic() - start
+    correct = sum(answer == label for (label, _), answer in zip(corpus, answers))
+    logger.info(
+        f"{name}: {len(corpus)} captchas en {elapsed:.2f}s -> "
+        f"{len(corpus) / elapsed:.1f} captchas/s, {correct}/{len(corpus)} aciertos"
+    )
+    return len(corpus) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compara captchas/s del OCR por captcha con el motor persistente"
+    )
+    parser.add_argument("--corpus", help="Carpeta con imágenes nombradas con su respuesta")
+    parser.add_argument("--count", type=int, default=100, help="Captchas sintéticos sin --corpus")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--engine", choices=["auto", "tesserocr", "cli"], default="auto")
+    parser.add_argument(
+        "--mode",
+        choices=["speed", "accuracy"],
+        default="speed",
+        help="speed: captchas/s por motor; accuracy: aciertos del preprocesamiento y la votación",
+    )
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    solver = CaptchaSolver(engine=args.engine)
+    try:
+        if args.mode == "accuracy":
+            measure_preprocessing(corpus)
+            measure_accuracy(solver, corpus)
+            return
+        legacy = measure(
+            "pytesseract por captcha",
+            lambda images: solve_legacy(solver, images),
+            corpus,
+            args.batch_size,
+        )
+        # Calentar el motor antes de medir
+        solver.solve_batch([corpus[0][1]])
+        persistent = measure("motor persistente", solver.solve_batch, corpus, args.batch_size)
+        logger.info(f"Mejora: x{persistent / legacy:.1f}")
+    finally:
+        solver.close()
+
+
+if __name__ == "__main__":
+    # Configuración de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    main()
@@ -0,0 +1,84 @@
+from standin_server import StandInDataprev, StandInERP
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _configure(erp, dataprev, directory, mode):
+    """Apunta los clientes a los servidores locales con estado aislado en ``directory``."""
+    os.environ.update(
+        {
+            "ERP_URL": erp.url,
+            "ERP_USER": "bench",
+            "ERP_PASSWORD": "bench",
+            "DATAPREV_URL": dataprev.url,
+            "DATAPREV_USER": "bench",
+            "DATAPREV_PASSWORD": "bench",
+            "AUTOMATION_MODE": mode,
+            "SESSION_CACHE": "false",
+            "LEDGER_PATH": os.path.join(directory, "ledger.db"),
+            "RUN_REPORT_DIR": os.path.join(directory, "reports"),
+        }
+    )
+    # Nunca enviar correos desde el benchmark
+    for var in ("SMTP_SERVER", "SMTP_PORT", "SMTP_USER", "SMTP_PASSWORD"):
+        os.environ.pop(var, None)
+
+
+def run(rows, latency_ms, mode):
+    """Ejecuta un ciclo completo contra los servidores locales y mide el throughput."""
+    # Importar después de configurar el entorno que leen los clientes
+    import main
+
+    erp = StandInERP(rows=rows, latency_ms=latency_ms).start()
+    dataprev = StandInDataprev(latency_ms=latency_ms).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            _configure(erp, dataprev, directory, mode)
+            start = time.monotonic()
+            summary = main.main(batch_size=0)
+            elapsed = time.monotonic() - start
+    finally:
+        erp.shutdown()
+        dataprev.shutdown()
+
+    processed = summary["processed"] if summary else 0
+    return {
+        "rows": rows,
+        "processed": processed,
+        "failed": summary["failed"] if summary else 0,
+        "elapsed": elapsed,
+        "per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "requests": erp.requests + dataprev.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mide beneficiarios/s de extremo a extremo contra el ERP y Dataprev simulados"
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency-ms", type=int, default=50)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    args = parser.parse_args()
+
+    results = [run(rows, args.latency_ms, args.mode) for rows in args.rows]
+    for result in results:
+        logger.info(
+            f"{result['rows']:>5} filas: {result['processed']} procesados, "
+            f"{result['failed']} con error en {result['elapsed']:.1f}s -> "
+            f"{result['per_second']:.2f} beneficiarios/s ({result['requests']} peticiones HTTP)"
+        )
+
+
+if __name__ == "__main__":
+    # Configuración de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    main()
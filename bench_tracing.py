@@ -0,0 +1,50 @@
+from bench_pipeline import run
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def measure(tracing, rows, latency_ms, mode, repeats):
+    """Repite el ciclo completo con la traza activada o no y devuelve las duraciones."""
+    os.environ["TRACE_ENABLED"] = "true" if tracing else "false"
+    return [run(rows, latency_ms, mode)["elapsed"] for _ in range(repeats)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compara la duración del ciclo con la traza de Playwright activada y sin ella"
+    )
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--latency-ms", type=int, default=50)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["TRACE_DIR"] = os.path.join(directory, "traces")
+        # Alternar el orden evita favorecer a la segunda serie por la caché del navegador
+        without = measure(False, args.rows, args.latency_ms, args.mode, args.repeats)
+        with_tracing = measure(True, args.rows, args.latency_ms, args.mode, args.repeats)
+        without += measure(False, args.rows, args.latency_ms, args.mode, args.repeats)
+        with_tracing += measure(True, args.rows, args.latency_ms, args.mode, args.repeats)
+
+    base = statistics.median(without)
+    traced = statistics.median(with_tracing)
+    logger.info(f"Sin traza: mediana {base:.2f}s ({len(without)} ciclos de {args.rows} filas)")
+    logger.info(
+        f"Con traza: mediana {traced:.2f}s ({len(with_tracing)} ciclos de {args.rows} filas)"
+    )
+    logger.info(f"Sobrecoste de la traza: {(traced - base) / base:+.1%}")
+
+
+if __name__ == "__main__":
+    # Configuración de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    main()
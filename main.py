@@ -1,7 +1,17 @@
+import os
+import argparse
+import asyncio
 import logging
 from dotenv import load_dotenv
+from src.async_dataprev_client import AsyncDataprevClient
+from src.async_erp_client import AsyncERPClient
+from src.batch_processor import run_cycle, run_cycle_async
+from src.browser_manager import AsyncBrowserManager, BrowserManager
 from src.dataprev_client import DataprevClient
 from src.erp_client import ERPClient
+from src.instrumentation import timer
+from src.retry import RetryPolicy
+from src.scheduler import AutomationScheduler
 
 # Configuración de logging
 logging.basicConfig(
@@ -10,63 +20,99 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def main():
+def main(batch_size=None):
+    if batch_size is None:
+        batch_size = int(os.getenv("BATCH_SIZE", "0"))
+    if os.getenv("AUTOMATION_MODE", "sync").lower() == "async":
+        return asyncio.run(main_async(batch_size))
+
+    erp_client = None
+    dataprev_client = None
+    timer.reset()
     try:
         logger.info("Iniciando proceso de automatización")
 
-        # Inicializar clientes
-        erp_client = ERPClient()
-        dataprev_client = DataprevClient()
+        # Inicializar clientes sobre un único navegador, cada uno con su contexto
+        browser_manager = BrowserManager()
+        erp_client = ERPClient(browser_manager=browser_manager)
+        dataprev_client = DataprevClient(browser_manager=browser_manager)
+        erp_client.ledger.prune()
 
-        # Login en ambos sistemas
+        # Login en ambos sistemas, reintentando solo el login que falle
+        retry = RetryPolicy()
         logger.info("Iniciando login en ERP...")
-        erp_client.login()
+        retry.call(erp_client.login, name="erp.login")
 
         logger.info("Iniciando login en Dataprev...")
-        dataprev_client.login()
+        retry.call(dataprev_client.login, name="dataprev.login")
 
-        # Obtener beneficiarios del ERP
-        logger.info("Obteniendo lista de beneficiarios...")
-        beneficiaries = erp_client.get_beneficiaries()
-        logger.info(f"Se encontraron {len(beneficiaries)} beneficiarios para procesar")
+        # Obtener y procesar los beneficiarios del ERP
+        return run_cycle(erp_client, dataprev_client, batch_size=batch_size)
 
-        if not beneficiaries:
-            logger.info("No se encontraron beneficiarios para procesar")
-            return
+    except Exception as e:
+        logger.error(f"Error en el proceso principal: {str(e)}")
+        raise
+    finally:
+        # Cerrar sesiones
+        try:
+            if erp_client:
+                erp_client.logout()
+            if dataprev_client:
+                dataprev_client.logout()
+        except Exception as e:
+            logger.error(f"Error cerrando sesiones: {str(e)}")
+        timer.write_report()
 
-        # Procesar solo el primer beneficiario
-        first_beneficiary = beneficiaries[0]
-        logger.info(
-            f"Procesando primer beneficiario con CPF: {first_beneficiary['cpf']}"
-        )
 
-        # Obtener número de beneficio
-        logger.info("Obteniendo número de beneficio...")
-        processed_beneficiary = erp_client.process_beneficiary_details(
-            first_beneficiary
-        )
-        logger.info(
-            f"Número de beneficio obtenido: {processed_beneficiary['benefit_number']}"
+async def main_async(batch_size=0):
+    """Versión asíncrona de ``main`` con ERP y Dataprev en un mismo event loop."""
+    browser_manager = AsyncBrowserManager()
+    erp_client = AsyncERPClient(browser_manager=browser_manager)
+    dataprev_client = AsyncDataprevClient(browser_manager=browser_manager)
+    erp_client.ledger.prune()
+    timer.reset()
+    try:
+        logger.info("Iniciando proceso de automatización (modo asíncrono)")
+
+        # Ambos logins en paralelo
+        retry = RetryPolicy()
+        await asyncio.gather(
+            retry.call_async(erp_client.login, name="erp.login"),
+            retry.call_async(dataprev_client.login, name="dataprev.login"),
         )
 
-        # Verificar en Dataprev
-        logger.info("Verificando beneficiario en Dataprev...")
-        dataprev_client.check_eligibility(processed_beneficiary)
-        logger.info("Submit realizado en Dataprev. Deteniendo el proceso...")
+        return await run_cycle_async(erp_client, dataprev_client, batch_size=batch_size)
 
     except Exception as e:
         logger.error(f"Error en el proceso principal: {str(e)}")
         raise
     finally:
-        # Cerrar sesiones
-        try:
-            erp_client.logout()
-            dataprev_client.logout()
-        except Exception as e:
-            logger.error(f"Error cerrando sesiones: {str(e)}")
+        await asyncio.gather(
+            erp_client.logout(), dataprev_client.logout(), return_exceptions=True
+        )
+        timer.write_report()
+
+
+def main_daemon():
+    """Ejecuta ciclos periódicos hasta recibir Ctrl+C."""
+    scheduler = AutomationScheduler()
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        logger.info("Deteniendo el planificador...")
 
 
 if __name__ == "__main__":
     # Cargar variables de entorno
     load_dotenv()
-    main()
+    parser = argparse.ArgumentParser(description="Automatización ERP - Dataprev")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Ejecutar ciclos periódicos manteniendo navegadores y sesiones abiertos",
+    )
+    args = parser.parse_args()
+    if args.daemon:
+        main_daemon()
+    else:
+        main()
@@ -0,0 +1,125 @@
+import os
+import csv
+import io
+import logging
+import urllib.request
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Lee los identificadores de la sesión APEX de los campos ocultos de la página
+APEX_SESSION_JS = """() => {
+    const value = id => {
+        const item = document.getElementById(id);
+        return item ? item.value : null;
+    };
+    return {
+        app_id: value("pFlowId"),
+        page_id: value("pFlowStepId"),
+        session_id: value("pInstance"),
+    };
+}"""
+
+
+class ApexReportClient:
+    """Descarga el informe de beneficiarios directamente del endpoint CSV de APEX.
+
+    Reutiliza las cookies de la sesión autenticada del navegador, de modo que
+    los datos se obtienen sin renderizar la página ni navegar por el menú.
+    """
+
+    def __init__(self, base_url, app_id, session_id, cookies, page_id=None, timeout=30):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.app_id = app_id
+        self.session_id = session_id
+        self.page_id = page_id or os.getenv("ERP_REPORT_PAGE_ID")
+        self.cookies = cookies
+        self.timeout = timeout
+        self.cpf_column = os.getenv("ERP_REPORT_CPF_COLUMN", "CPF")
+        self.date_column = os.getenv("ERP_REPORT_DATE_COLUMN", "Data")
+        self.benefit_column = os.getenv("ERP_REPORT_BENEFIT_COLUMN", "Número Benefício")
+
+    @classmethod
+    def from_page(cls, page, page_id=None):
+        """Crea el cliente a partir de una página de Playwright ya autenticada."""
+        return cls.from_session(
+            page.evaluate(APEX_SESSION_JS), page.url, page.context.cookies(), page_id
+        )
+
+    @classmethod
+    def from_session(cls, session, page_url, cookies, page_id=None):
+        """Crea el cliente con los datos de sesión leídos con ``APEX_SESSION_JS``."""
+        if not session["app_id"] or not session["session_id"]:
+            raise Exception("No se encontró la sesión de APEX en la página actual")
+
+        base_url = os.getenv("ERP_APEX_BASE_URL")
+        if not base_url:
+            base_url = page_url.split("f?p=")[0]
+        return cls(
+            base_url,
+            session["app_id"],
+            session["session_id"],
+            cookies,
+            page_id=page_id,
+        )
+
+    def csv_url(self):
+        """URL de descarga CSV del informe (REQUEST=CSV)."""
+        if not self.page_id:
+            raise Exception("ERP_REPORT_PAGE_ID no está configurado")
+        return f"{self.base_url}f?p={self.app_id}:{self.page_id}:{self.session_id}:CSV::::"
+
+    def _cookie_header(self, url):
+        """Construye la cabecera Cookie con las cookies válidas para la URL."""
+        host = urlsplit(url).hostname or ""
+        pairs = []
+        for cookie in self.cookies:
+            domain = cookie.get("domain", "").lstrip(".")
+            if not domain or host == domain or host.endswith("." + domain):
+                pairs.append(f"{cookie['name']}={cookie['value']}")
+        return "; ".join(pairs)
+
+    def _download(self, url):
+        """Descarga el contenido de la URL con la sesión del navegador."""
+        request = urllib.request.Request(url, headers={"Cookie": self._cookie_header(url)})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            content_type = response.headers.get("Content-Type", "")
+            body = response.read()
+
+        if "html" in content_type:
+            # APEX devuelve la página de login cuando la sesión expiró
+            raise Exception("El endpoint CSV devolvió HTML; la sesión de APEX no es válida")
+
+        try:
+            return body.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            return body.decode("latin-1")
+
+    def fetch_rows(self):
+        """Descarga el informe y devuelve cada fila como diccionario."""
+        text = self._download(self.csv_url())
+        try:
+            dialect = csv.Sniffer().sniff(text[:2048], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return list(csv.DictReader(io.StringIO(text), dialect=dialect))
+
+    def fetch_records(self):
+        """Devuelve registros compactos con CPF, fecha y número de beneficio."""
+        rows = self.fetch_rows()
+        if rows and self.cpf_column not in rows[0]:
+            raise Exception(
+                f"La columna '{self.cpf_column}' no existe en el informe: {list(rows[0])}"
+            )
+
+        records = []
+        for row in rows:
+            records.append(
+                {
+                    "cpf": (row.get(self.cpf_column) or "").strip(),
+                    "date": (row.get(self.date_column) or "").strip(),
+                    "benefit_number": (row.get(self.benefit_column) or "").strip() or None,
+                }
+            )
+        logger.info(f"Informe APEX descargado por HTTP: {len(records)} filas")
+        return records
@@ -0,0 +1,307 @@
+import os
+import asyncio
+import logging
+import time
+from urllib.parse import urljoin
+from playwright.async_api import async_playwright
+from src.dataprev_client import LOGGED_IN_SELECTOR, LOGIN_FORM_SELECTOR
+from src.browser_profile import BrowserProfile
+from src.instrumentation import timed
+from src.retry import RetryPolicy
+from src.session_store import SessionStore
+from src.tracing import AsyncTraceRecorder, traced
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDataprevClient:
+    """Equivalente de ``DataprevClient`` sobre ``playwright.async_api``."""
+
+    def __init__(self, browser_manager=None):
+        self.url = os.getenv("DATAPREV_URL")
+        self.user = os.getenv("DATAPREV_USER")
+        self.password = os.getenv("DATAPREV_PASSWORD")
+        self.browser_manager = browser_manager
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.tracer = None
+        self.page = None
+        self.profile = BrowserProfile.from_env(
+            default_viewport={"width": 1920, "height": 1080}
+        )
+        self.session_store = SessionStore("dataprev")
+        self.restored_session = False
+        self._relogin_lock = None
+        self._session_generation = 0
+        self.retry_policy = RetryPolicy()
+
+    async def _setup_browser(self) -> None:
+        """Configura el navegador con los parámetros correctos."""
+        try:
+            if self.browser_manager:
+                # Navegador compartido: este cliente solo crea su propio contexto
+                self.browser = await self.browser_manager.acquire()
+            else:
+                self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.chromium.launch(
+                    headless=self.profile.headless,
+                    channel="chrome",  # Usar Chrome instalado en el sistema
+                    args=(
+                        [] if self.profile.headless else ["--start-maximized"]
+                    ) + [
+                        "--disable-blink-features=AutomationControlled",
+                        "--no-sandbox",
+                    ],
+                )
+            storage_state = self.session_store.load()
+            self.restored_session = storage_state is not None
+            self.context = await self.browser.new_context(
+                storage_state=storage_state,
+                viewport=self.profile.viewport,
+                user_agent=(
+                    "Mozilla/5.0 "
+                    "(Macintosh; Intel Mac OS X 10_15_7) "
+                    "AppleWebKit/537.36 "
+                    "(KHTML, like Gecko) "
+                    "Chrome/119.0.0.0 "
+                    "Safari/537.36"
+                ),
+            )
+            await self.profile.apply_async(self.context)
+            self.tracer = AsyncTraceRecorder(self.context, "dataprev")
+            await self.tracer.start()
+            self.page = await self.context.new_page()
+
+            # Timeouts más largos para todas las páginas del contexto, también las del pool
+            self.context.set_default_timeout(60000)  # 60 segundos
+            self.context.set_default_navigation_timeout(60000)  # 60 segundos
+
+        except Exception as e:
+            logger.error(f"Error configurando el navegador: {str(e)}")
+            await self.cleanup()
+            raise
+
+    @timed("dataprev.login")
+    async def login(self) -> None:
+        """Inicia sesión en Dataprev."""
+        if not self.browser:
+            await self._setup_browser()
+        await self._authenticate()
+
+    @traced("dataprev.login")
+    async def _authenticate(self) -> None:
+        """Restaura la sesión guardada o envía el formulario de login."""
+        try:
+            if self.restored_session and await self._probe_session():
+                logger.info("Sesión guardada válida, se omite el login en Dataprev")
+                return
+
+            logger.info(f"Navegando a {self.url}")
+            await self.page.goto(self.url, wait_until="domcontentloaded")
+
+            logger.info("Ingresando credenciales...")
+            username_input = await self.page.wait_for_selector(LOGIN_FORM_SELECTOR)
+            await username_input.fill(self.user)
+
+            password_input = await self.page.wait_for_selector('input[name="password"]')
+            await password_input.fill(self.password)
+
+            logger.info("Enviando formulario...")
+            login_button = await self.page.wait_for_selector('button[type="submit"]')
+            await login_button.click()
+
+            logger.info("Verificando login exitoso...")
+            await self.page.wait_for_selector(LOGGED_IN_SELECTOR)
+
+            if "login" in self.page.url:
+                raise Exception(
+                    "Login fallido - Redirigido de vuelta a la página de login"
+                )
+
+            self.session_store.save(await self.context.storage_state())
+            logger.info("Login exitoso en Dataprev")
+
+        except Exception as e:
+            logger.error(f"Error en login de Dataprev: {str(e)}")
+            raise
+
+    async def _probe_session(self) -> bool:
+        """Comprueba con una sola navegación si la sesión restaurada sigue activa."""
+        self.restored_session = False
+        try:
+            await self.page.goto(self.url, wait_until="domcontentloaded")
+            await self.page.wait_for_selector(LOGGED_IN_SELECTOR, state="attached", timeout=5000)
+            return not await self._is_login_page()
+        except Exception:
+            logger.info("La sesión guardada de Dataprev ya no es válida")
+            self.session_store.clear()
+            return False
+
+    async def _is_login_page(self, page=None) -> bool:
+        """Indica si la página muestra el formulario de login."""
+        page = page or self.page
+        return "login" in page.url or await page.query_selector(LOGIN_FORM_SELECTOR) is not None
+
+    async def ensure_session(self, page=None) -> None:
+        """Reautentica si la página fue redirigida al login.
+
+        Varias consultas concurrentes pueden detectar la expiración a la vez;
+        el lock garantiza un único login.
+        """
+        if self._relogin_lock is None:
+            self._relogin_lock = asyncio.Lock()
+        if not await self._is_login_page(page):
+            return
+        generation = self._session_generation
+        async with self._relogin_lock:
+            # Si otra tarea ya reautenticó mientras esperábamos, no se repite
+            if generation == self._session_generation:
+                logger.info("Sesión de Dataprev expirada, reautenticando...")
+                self.session_store.clear()
+                await self.login()
+                self._session_generation += 1
+
+    async def recover(self) -> None:
+        """Devuelve el cliente a un estado conocido tras un fallo.
+
+        Si la página se cerró se abre de nuevo y se inicia sesión; si no, se
+        vuelve a la página inicial y se reautentica si la sesión caducó.
+        """
+        if self.page is None or self.page.is_closed():
+            await self.cleanup()
+            await self.login()
+            return
+        await self.page.goto(self.url, wait_until="domcontentloaded")
+        await self.ensure_session()
+
+    @timed("dataprev.check_benefit")
+    @traced("dataprev.check_benefit")
+    async def check_benefit(self, cpf: str, benefit_number: str, page=None) -> dict:
+        """Consulta el estado de un beneficio específico.
+
+        Sin ``page`` se usa la página principal; las consultas concurrentes
+        pasan cada una su propia página del mismo contexto.
+        """
+        page = page or self.page
+        try:
+            logger.info(f"Consultando beneficio {benefit_number} para CPF {cpf}")
+            await page.goto(self.query_url, wait_until="commit")
+
+            await (await page.wait_for_selector('input[name="cpf"]')).fill(cpf)
+            await (await page.wait_for_selector('input[name="benefit_number"]')).fill(
+                benefit_number
+            )
+            await (await page.wait_for_selector('button[type="submit"]')).click()
+            await page.wait_for_selector('.benefit-status', state="attached")
+
+            return {
+                "cpf": cpf,
+                "benefit_number": benefit_number,
+                "status": await page.text_content('.benefit-status'),
+                "details": await page.text_content('.benefit-details'),
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
+        except Exception as e:
+            logger.error(f"Error consultando beneficio: {str(e)}")
+            raise
+
+    async def check_benefits(self, items, concurrency=None, retries=None) -> list:
+        """Consulta varios beneficios concurrentemente, cada uno en su página.
+
+        Como máximo ``concurrency`` consultas están en curso a la vez; una
+        consulta fallida se reintenta en una página nueva hasta ``retries``
+        veces (por defecto RETRY_ATTEMPTS - 1), con espera exponencial con
+        jitter. Si no se puede recuperar la sesión tras un fallo, la consulta
+        queda como fallida sin afectar a las demás. Los resultados se
+        devuelven en el mismo orden que ``items``.
+        """
+        concurrency = concurrency or int(os.getenv("DATAPREV_CONCURRENCY", "4"))
+        if retries is None:
+            retries = self.retry_policy.attempts - 1
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def check(cpf, benefit_number):
+            async with semaphore:
+                for attempt in range(retries + 1):
+                    page = None
+                    try:
+                        page = await self.context.new_page()
+                        return await self.check_benefit(cpf, benefit_number, page=page)
+                    except Exception as e:
+                        error = e
+                        logger.error(
+                            f"Error consultando beneficio {benefit_number} "
+                            f"(intento {attempt + 1}): {str(e)}"
+                        )
+                        try:
+                            await self.ensure_session(page)
+                        except Exception as recover_error:
+                            # Sin sesión no tiene sentido reintentar: el fallo queda en su resultado
+                            logger.error(
+                                f"No se pudo recuperar la sesión de Dataprev: {str(recover_error)}"
+                            )
+                            break
+                    finally:
+                        if page is not None:
+                            await page.close()
+                    if attempt < retries:
+                        await asyncio.sleep(self.retry_policy.delay(attempt))
+                return {
+                    "cpf": cpf,
+                    "benefit_number": benefit_number,
+                    "status": None,
+                    "details": None,
+                    "error": str(error),
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+
+        return await asyncio.gather(*(check(cpf, number) for cpf, number in items))
+
+    @property
+    def query_url(self):
+        """URL absoluta de la página de consulta."""
+        return urljoin(self.url, "/consulta")
+
+    @timed("dataprev.logout")
+    async def logout(self):
+        """Cierra la sesión y el navegador."""
+        try:
+            if self.page:
+                logout_button = await self.page.wait_for_selector('a[href="/logout"]')
+                await logout_button.click()
+                await self.page.wait_for_load_state("networkidle")
+        except Exception as e:
+            logger.error(f"Error en logout de Dataprev: {str(e)}")
+        finally:
+            # Liberar el navegador aunque falle el cierre de sesión
+            await self.cleanup()
+
+    async def cleanup(self) -> None:
+        """Limpia los recursos de Playwright de manera segura."""
+        try:
+            if self.page and not self.page.is_closed():
+                await self.page.close()
+            if self.tracer:
+                # Descarta los fragmentos retenidos antes de cerrar el contexto
+                await self.tracer.stop()
+            if self.context:
+                await self.context.close()
+            if self.browser_manager:
+                # El navegador solo se cierra cuando lo libera el último cliente
+                if self.browser:
+                    await self.browser_manager.release()
+            else:
+                if self.browser:
+                    await self.browser.close()
+                if self.playwright:
+                    await self.playwright.stop()
+        except Exception as e:
+            logger.error(f"Error durante la limpieza: {str(e)}")
+        finally:
+            self.page = None
+            self.tracer = None
+            self.context = None
+            self.browser = None
+            self.playwright = None
@@ -0,0 +1,644 @@
+import os
+import asyncio
+import logging
+from playwright.async_api import async_playwright
+from src.apex_report_client import APEX_SESSION_JS, ApexReportClient
+from src.erp_client import (
+    EXPAND_DATAPREV_NODE_JS,
+    EXTRACT_CHANGED_ROWS_JS,
+    EXTRACT_ROWS_JS,
+    LOGGED_IN_SELECTOR,
+    FRESH_REPORT_TBODY_SELECTOR,
+    LOGIN_FORM_SELECTOR,
+    MARK_STALE_JS,
+    MAX_REPORT_PAGES,
+    MAX_ROWS_PER_PAGE_JS,
+    NEXT_PAGE_JS,
+    NEXT_PAGE_SELECTOR,
+    REPORT_ID,
+    REPORT_TBODY_SELECTOR,
+    ROWS_PER_PAGE_SELECTOR,
+    exclude_from_watermark,
+    filter_report_records,
+    filter_table_rows,
+    incremental_watermark,
+    merge_report_pages,
+    unfinished_beneficiaries,
+)
+from src.readiness import AsyncReadinessWaiter
+from src.browser_profile import BrowserProfile
+from src.instrumentation import step, timed
+from src.ledger import ProcessedLedger
+from src.session_store import SessionStore
+from src.tracing import AsyncTraceRecorder, traced
+
+logger = logging.getLogger(__name__)
+
+
+async def _aiter(items):
+    """Recorre una lista ya descargada como iterador asíncrono."""
+    for item in items:
+        yield item
+
+
+class AsyncERPClient:
+    """Equivalente de ``ERPClient`` sobre ``playwright.async_api``.
+
+    Expone los mismos métodos como corrutinas para poder solapar la
+    extracción del ERP con las consultas a Dataprev en un mismo event loop.
+    """
+
+    def __init__(self, browser_manager=None, ledger=None):
+        self.url = os.getenv("ERP_URL")
+        self.user = os.getenv("ERP_USER")
+        self.password = os.getenv("ERP_PASSWORD")
+        self.browser_manager = browser_manager
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.tracer = None
+        self.page = None
+        self.waiter = None
+        # Registro persistente de CPF procesados (SQLite)
+        self.ledger = ledger or ProcessedLedger()
+        self.profile = BrowserProfile.from_env(
+            default_viewport={"width": 1366, "height": 768}
+        )
+        self.headless = self.profile.headless
+        self.use_http_report = os.getenv("ERP_HTTP_REPORT", "false").lower() == "true"
+        self.incremental = os.getenv("ERP_INCREMENTAL", "false").lower() == "true"
+        self._pending_watermark = None
+        self._report_open = False
+        self.next_page_selector = os.getenv("ERP_REPORT_NEXT_SELECTOR", NEXT_PAGE_SELECTOR)
+        self.rows_per_page_selector = os.getenv(
+            "ERP_REPORT_ROWS_PER_PAGE_SELECTOR", ROWS_PER_PAGE_SELECTOR
+        )
+        self.session_store = SessionStore("erp")
+        self.restored_session = False
+        self._relogin_lock = None
+        self._session_generation = 0
+
+    async def _setup_browser(self) -> None:
+        """Configura el navegador con los parámetros correctos."""
+        try:
+            if self.browser_manager:
+                # Navegador compartido: este cliente solo crea su propio contexto
+                self.browser = await self.browser_manager.acquire()
+            else:
+                self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.chromium.launch(
+                    headless=self.headless,
+                    channel="chrome",  # Usar Chrome instalado en el sistema
+                    args=[
+                        "--disable-blink-features=AutomationControlled",
+                        "--no-sandbox",
+                    ],
+                )
+            storage_state = self.session_store.load()
+            self.restored_session = storage_state is not None
+            self.context = await self.browser.new_context(
+                storage_state=storage_state,
+                viewport=self.profile.viewport,
+                user_agent=(
+                    "Mozilla/5.0 "
+                    "(Windows NT 10.0; Win64; x64) "
+                    "AppleWebKit/537.36 "
+                    "(KHTML, like Gecko) "
+                    "Chrome/119.0.0.0 "
+                    "Safari/537.36"
+                ),
+            )
+            await self.profile.apply_async(self.context)
+            self.tracer = AsyncTraceRecorder(self.context, "erp")
+            await self.tracer.start()
+            self.page = await self.context.new_page()
+
+            # Timeouts más largos para todas las páginas del contexto, también las del pool
+            self.context.set_default_timeout(60000)  # 60 segundos
+            self.context.set_default_navigation_timeout(60000)  # 60 segundos
+            self.waiter = AsyncReadinessWaiter(self.page)
+
+        except Exception as e:
+            logger.error(f"Error configurando el navegador: {str(e)}")
+            await self.cleanup()
+            raise
+
+    @timed("erp.login")
+    async def login(self) -> None:
+        """Inicia sesión en el ERP."""
+        if not self.browser:
+            await self._setup_browser()
+        await self._authenticate()
+
+    @traced("erp.login")
+    async def _authenticate(self) -> None:
+        """Restaura la sesión guardada o envía el formulario de login."""
+        try:
+            if self.restored_session and await self._probe_session():
+                logger.info("Sesión guardada válida, se omite el login en ERP")
+                return
+
+            logger.info(f"Navegando a {self.url}")
+            await self.page.goto(self.url, wait_until="networkidle")
+
+            logger.info("Ingresando credenciales...")
+            username_input = await self.page.wait_for_selector('//*[@id="P101_USERNAME"]')
+            await username_input.fill(self.user)
+
+            password_input = await self.page.wait_for_selector('//*[@id="P101_PASSWORD"]')
+            await password_input.fill(self.password)
+
+            logger.info("Enviando formulario...")
+            login_button = await self.page.wait_for_selector('//*[@id="B224579857434482981"]')
+            await login_button.click()
+            await self.page.wait_for_load_state("networkidle")
+
+            logger.info("Verificando login exitoso...")
+            await self.page.wait_for_selector(LOGGED_IN_SELECTOR)
+
+            if "login" in self.page.url:
+                raise Exception(
+                    "Login fallido - Redirigido de vuelta a la página de login"
+                )
+
+            self.session_store.save(await self.context.storage_state())
+            logger.info("Login exitoso en ERP")
+
+        except Exception as e:
+            logger.error(f"Error en login de ERP: {str(e)}")
+            raise
+
+    async def _probe_session(self) -> bool:
+        """Comprueba con una sola navegación si la sesión restaurada sigue activa."""
+        self.restored_session = False
+        try:
+            await self.page.goto(self.url, wait_until="domcontentloaded")
+            await self.page.wait_for_selector(LOGGED_IN_SELECTOR, state="attached", timeout=5000)
+            return not await self._is_login_page()
+        except Exception:
+            logger.info("La sesión guardada de ERP ya no es válida")
+            self.session_store.clear()
+            return False
+
+    async def _is_login_page(self, page=None) -> bool:
+        """Indica si la página muestra el formulario de login."""
+        page = page or self.page
+        return "login" in page.url or await page.query_selector(LOGIN_FORM_SELECTOR) is not None
+
+    async def ensure_session(self) -> None:
+        """Vuelve a iniciar sesión si el ERP redirigió al login."""
+        if await self._is_login_page():
+            logger.info("Sesión de ERP expirada, reautenticando...")
+            self.session_store.clear()
+            await self.login()
+
+    async def recover(self) -> None:
+        """Devuelve el cliente a un estado conocido tras un fallo.
+
+        Si la página se cerró se abre de nuevo y se inicia sesión. Mientras se
+        recorre el informe la sesión se comprueba en otra pestaña para no
+        mover la página principal; si no, se vuelve a la página inicial y se
+        reautentica si la sesión caducó.
+        """
+        if self.page is None or self.page.is_closed():
+            await self.cleanup()
+            await self.login()
+            return
+        if self._report_open:
+            await self._check_session_in_new_page()
+            return
+        await self.page.goto(self.url, wait_until="domcontentloaded")
+        await self.ensure_session()
+
+    async def _check_session_in_new_page(self) -> None:
+        """Comprueba la sesión en una pestaña aparte y reautentica si caducó."""
+        page = await self.context.new_page()
+        try:
+            await page.goto(self.url, wait_until="domcontentloaded")
+            expired = await self._is_login_page(page)
+        finally:
+            await page.close()
+        if expired:
+            await self._relogin()
+
+    async def get_beneficiaries(self):
+        """Obtiene la lista completa de beneficiarios del día."""
+        beneficiaries = [beneficiary async for beneficiary in await self.iter_beneficiaries()]
+        logger.info(f"Encontrados {len(beneficiaries)} beneficiarios nuevos para hoy")
+        return beneficiaries
+
+    async def iter_beneficiaries(self):
+        """Versión asíncrona de ``ERPClient.iter_beneficiaries``.
+
+        Devuelve un iterador asíncrono que lee el informe página a página.
+        """
+        await self.ensure_session()
+        if self.use_http_report:
+            try:
+                return _aiter(await self._get_beneficiaries_http())
+            except Exception as e:
+                logger.warning(
+                    f"No se pudo obtener el informe por HTTP, usando la interfaz: {str(e)}"
+                )
+
+        try:
+            self.waiter.reset()
+
+            await self._open_report_menu()
+
+            logger.info("Esperando que la tabla cargue...")
+            with step("erp.table_load"):
+                table = await self.waiter.selector(
+                    "tabla de beneficiarios",
+                    REPORT_TBODY_SELECTOR,
+                    state="attached",
+                    timeout=30000,
+                )
+                await self.waiter.apex_idle("carga de la tabla")
+        except Exception as e:
+            logger.error(f"Error obteniendo beneficiarios: {str(e)}")
+            raise
+
+        if self.incremental:
+            return self._stream_incremental(table)
+        return self._stream_beneficiaries(table)
+
+    async def _stream_beneficiaries(self, table):
+        """Produce los beneficiarios pendientes de cada página del informe."""
+        async for page, rows in self._iter_report_pages(table, self._extract_rows):
+            logger.info(f"Procesando {len(rows)} filas de la tabla...")
+            async for beneficiary in self._resolve_modal_rows(page, self._filter_rows(rows)):
+                yield beneficiary
+
+    async def _resolve_modal_rows(self, page, beneficiaries):
+        """Versión asíncrona de ``ERPClient._resolve_modal_rows``.
+
+        Al resolverse dentro de la extracción, la paginación del informe
+        nunca avanza mientras un diálogo modal está abierto.
+        """
+        for beneficiary in beneficiaries:
+            if not (beneficiary.get("benefit_number") or beneficiary.get("dialog_url")):
+                try:
+                    details = await self.process_beneficiary_details(beneficiary, page=page)
+                    beneficiary["benefit_number"] = details["benefit_number"]
+                except Exception as e:
+                    beneficiary["error"] = str(e)
+            yield beneficiary
+
+    @timed("erp.menu_navigation")
+    @traced("erp.menu_navigation")
+    async def _open_report_menu(self):
+        """Abre el informe de beneficiarios desde el menú lateral de APEX."""
+        logger.info("Navegando al menú de beneficiarios...")
+        await self.page.click('//*[@id="t_MenuNav_0"]')
+        await self.waiter.apex_idle("carga del menú")
+
+        logger.info("Haciendo click en el botón de navegación...")
+        try:
+            await self.waiter.selector(
+                "botón de navegación", "#t_Button_navControl", state="attached"
+            )
+            await self.page.locator("#t_Button_navControl").click(force=True, timeout=5000)
+            await self.waiter.attribute(
+                "botón expandido",
+                "#t_Button_navControl",
+                "aria-expanded",
+                "true",
+                timeout=5000,
+            )
+        except Exception as e:
+            logger.error(f"Error al interactuar con el botón: {str(e)}")
+            raise Exception("No se pudo activar el botón de navegación")
+
+        logger.info("Esperando que aparezca el TreeView...")
+        try:
+            await self.waiter.selector(
+                "TreeView visible",
+                'div.a-TreeView#t_TreeNav[aria-hidden="false"]',
+                timeout=5000,
+            )
+        except Exception as e:
+            logger.error(f"TreeView no apareció o no está visible: {str(e)}")
+            raise Exception("TreeView no apareció después del click")
+
+        logger.info("Haciendo click en el nodo Dataprev...")
+        if not await self.page.evaluate(EXPAND_DATAPREV_NODE_JS):
+            logger.error("No se pudo hacer click en el nodo Dataprev")
+            raise Exception("No se pudo expandir el nodo Dataprev")
+
+        try:
+            await self.waiter.selector("nodo de beneficiarios", "#t_TreeNav_2", timeout=5000)
+        except Exception:
+            logger.info("El nodo Dataprev no se expandió, reintentando con click...")
+            await self.page.click('//*[@id="t_TreeNav_1"]')
+            await self.waiter.selector("nodo de beneficiarios", "#t_TreeNav_2")
+
+        await self.page.click('//*[@id="t_TreeNav_2"]')
+
+    @timed("erp.http_report")
+    async def _get_beneficiaries_http(self):
+        """Obtiene los beneficiarios del día desde el endpoint CSV de APEX."""
+        logger.info("Descargando informe de beneficiarios por HTTP...")
+        report = ApexReportClient.from_session(
+            await self.page.evaluate(APEX_SESSION_JS),
+            self.page.url,
+            await self.context.cookies(),
+        )
+        # La descarga es bloqueante; se ejecuta fuera del event loop
+        records = await asyncio.to_thread(report.fetch_records)
+        beneficiaries = filter_report_records(records, self.ledger)
+        logger.info(f"Encontrados {len(beneficiaries)} beneficiarios nuevos para hoy")
+        return beneficiaries
+
+    async def _stream_incremental(self, table):
+        """Versión asíncrona de ``ERPClient._stream_incremental``."""
+        watermark = self.ledger.get_watermark(REPORT_ID)
+        self._pending_watermark = None
+        results = []
+        changed = {}
+        seen = set()
+
+        async def extract(tbody):
+            return await self._extract_changed_rows(tbody, watermark)
+
+        async for page, result in self._iter_report_pages(table, extract):
+            rows = result.get("rows", [])
+            changed.update((row[4], row[1]) for row in rows)
+            results.append({**result, "rows": []})
+            beneficiaries = self._filter_rows([row[:4] for row in rows])
+            seen.update(beneficiary["cpf"] for beneficiary in beneficiaries)
+            async for beneficiary in self._resolve_modal_rows(page, beneficiaries):
+                yield beneficiary
+
+        self._pending_watermark = incremental_watermark(
+            merge_report_pages(results, watermark), watermark, changed
+        )
+        for beneficiary in unfinished_beneficiaries(self.ledger, seen):
+            yield beneficiary
+
+    @timed("erp.row_extraction")
+    async def _extract_rows(self, table):
+        """Extrae todas las filas de una página del informe en una sola evaluación."""
+        return await table.evaluate(EXTRACT_ROWS_JS)
+
+    @timed("erp.row_extraction")
+    async def _extract_changed_rows(self, table, watermark):
+        """Evalúa ``EXTRACT_CHANGED_ROWS_JS`` sobre una página del informe."""
+        return await table.evaluate(
+            EXTRACT_CHANGED_ROWS_JS,
+            {
+                "row_count": watermark["row_count"],
+                "checksum": watermark["checksum"],
+                "hashes": list(watermark["row_hashes"]),
+            },
+        )
+
+    async def _iter_report_pages(self, table, extract):
+        """Versión asíncrona de ``ERPClient._iter_report_pages``."""
+        page = self.page
+        prefetch = None
+        self._report_open = True
+        try:
+            table = await self._maximize_rows_per_page(table)
+            for number in range(1, MAX_REPORT_PAGES + 1):
+                link = await page.evaluate(NEXT_PAGE_JS, self.next_page_selector)
+                loading = None
+                if link["url"]:
+                    prefetch = await self.context.new_page()
+                    # La página siguiente carga mientras se extrae la actual
+                    loading = asyncio.create_task(prefetch.goto(link["url"], wait_until="commit"))
+
+                try:
+                    yield page, await extract(table)
+                finally:
+                    if loading is not None:
+                        await loading
+
+                if prefetch is not None:
+                    if page is not self.page:
+                        await page.close()
+                    page, prefetch = prefetch, None
+                    with step("erp.report_page"):
+                        table = await AsyncReadinessWaiter(page).selector(
+                            f"página {number + 1} del informe",
+                            REPORT_TBODY_SELECTOR,
+                            state="attached",
+                            timeout=30000,
+                        )
+                elif link["exists"]:
+                    table = await self._refresh_report(
+                        page,
+                        table,
+                        lambda: page.click(self.next_page_selector),
+                        f"página {number + 1} del informe",
+                    )
+                else:
+                    if number > 1:
+                        logger.info(f"Informe recorrido en {number} páginas")
+                    return
+            logger.warning(f"Se alcanzó el límite de {MAX_REPORT_PAGES} páginas del informe")
+        finally:
+            self._report_open = False
+            for extra in (page, prefetch):
+                if extra is not None and extra is not self.page and not extra.is_closed():
+                    await extra.close()
+
+    async def _maximize_rows_per_page(self, table):
+        """Selecciona la opción con más filas por página, si el informe la ofrece."""
+        value = await self.page.evaluate(MAX_ROWS_PER_PAGE_JS, self.rows_per_page_selector)
+        if not value:
+            return table
+        logger.info(f"Mostrando {value} filas por página en el informe")
+        return await self._refresh_report(
+            self.page,
+            table,
+            lambda: self.page.select_option(self.rows_per_page_selector, value),
+            "filas por página",
+        )
+
+    @timed("erp.report_page")
+    @traced("erp.report_page")
+    async def _refresh_report(self, page, table, action, name):
+        """Ejecuta ``action`` (corrutina) y espera a que el informe se renderice de nuevo."""
+        waiter = self.waiter if page is self.page else AsyncReadinessWaiter(page)
+        await table.evaluate(MARK_STALE_JS)
+        await action()
+        table = await waiter.selector(
+            name, FRESH_REPORT_TBODY_SELECTOR, state="attached", timeout=30000
+        )
+        await waiter.apex_idle(name)
+        return table
+
+    def commit_watermark(self, exclude_cpfs=()):
+        """Guarda la marca de agua de la última extracción incremental."""
+        if self._pending_watermark is None:
+            return
+        self.ledger.save_watermark(
+            REPORT_ID, exclude_from_watermark(self._pending_watermark, exclude_cpfs)
+        )
+        self._pending_watermark = None
+
+    def _filter_rows(self, rows):
+        """Filtra las filas del día que todavía no fueron procesadas."""
+        return filter_table_rows(rows, self.ledger, self.page.url)
+
+    @timed("erp.dialog_read")
+    @traced("erp.dialog_read")
+    async def process_beneficiary_details(self, beneficiary, page=None):
+        """Procesa los detalles de un beneficiario específico.
+
+        Sin URL de diálogo se abre el diálogo modal en ``page``, la página del
+        informe donde está su botón (por defecto la principal).
+        """
+        try:
+            logger.info(f"Procesando detalles para CPF: {beneficiary['cpf']}")
+
+            if beneficiary.get("benefit_number"):
+                return {
+                    "cpf": beneficiary["cpf"],
+                    "benefit_number": beneficiary["benefit_number"],
+                }
+
+            if beneficiary.get("dialog_url"):
+                # Sin diálogo modal: la página del diálogo se abre en una pestaña propia
+                benefit_number = await self._read_dialog_page(beneficiary["dialog_url"])
+            else:
+                page = page or self.page
+                waiter = self.waiter if page is self.page else AsyncReadinessWaiter(page)
+                await page.click(f'#{beneficiary["dialog_id"]}')
+                await waiter.selector("diálogo abierto", ".modal-dialog")
+                field = await waiter.selector(
+                    "número de beneficio", '//*[@id="P73_NUMERO_BENEFICIO_DISPLAY"]'
+                )
+                benefit_number = (await field.inner_text()).strip()
+                await page.click(".modal-dialog .close")
+                await waiter.selector("diálogo cerrado", ".modal-dialog", state="hidden")
+
+            self.ledger.record_benefits({beneficiary["cpf"]: benefit_number})
+
+            logger.info(f"Beneficio encontrado: {benefit_number}")
+            return {"cpf": beneficiary["cpf"], "benefit_number": benefit_number}
+
+        except Exception as e:
+            logger.error(f"Error procesando detalles del beneficiario: {str(e)}")
+            raise
+
+    @timed("erp.dialog_page")
+    @traced("erp.dialog_page")
+    async def _read_dialog_page(self, dialog_url):
+        """Lee el número de beneficio cargando la página del diálogo."""
+        page = await self.context.new_page()
+        try:
+            await page.goto(dialog_url, wait_until="commit")
+            try:
+                field = await page.wait_for_selector(
+                    '//*[@id="P73_NUMERO_BENEFICIO_DISPLAY"]',
+                    state="attached",
+                    timeout=self.waiter.default_timeout,
+                )
+            except Exception:
+                if not await self._is_login_page(page):
+                    raise
+                # La sesión caducó a mitad del lote: reautenticar y reintentar
+                await self._relogin()
+                await page.goto(dialog_url, wait_until="commit")
+                field = await page.wait_for_selector(
+                    '//*[@id="P73_NUMERO_BENEFICIO_DISPLAY"]', state="attached"
+                )
+            return (await field.inner_text()).strip()
+        finally:
+            await page.close()
+
+    async def _relogin(self) -> None:
+        """Reautentica una sola vez aunque varias tareas detecten la expiración."""
+        if self._relogin_lock is None:
+            self._relogin_lock = asyncio.Lock()
+        generation = self._session_generation
+        async with self._relogin_lock:
+            # Si otra tarea ya reautenticó mientras esperábamos, no se repite
+            if generation == self._session_generation:
+                logger.info("Sesión de ERP expirada durante el lote, reautenticando...")
+                self.session_store.clear()
+                await self.login()
+                self._session_generation += 1
+
+    async def get_benefit_numbers(self, beneficiaries, concurrency=None):
+        """Resuelve los números de beneficio de una lista completa de beneficiarios.
+
+        Las páginas de diálogo se cargan en paralelo, con un máximo de
+        ``concurrency`` a la vez; los beneficiarios sin URL pasan por el modal
+        uno a uno. Devuelve un diccionario CPF -> número de beneficio.
+        """
+        concurrency = concurrency or int(os.getenv("ERP_DIALOG_CONCURRENCY", "4"))
+        await self.ensure_session()
+        semaphore = asyncio.Semaphore(concurrency)
+        benefit_numbers = {}
+
+        async def resolve(beneficiary):
+            try:
+                if beneficiary.get("dialog_url"):
+                    async with semaphore:
+                        details = await self.process_beneficiary_details(beneficiary)
+                else:
+                    details = await self.process_beneficiary_details(beneficiary)
+                benefit_numbers[details["cpf"]] = details["benefit_number"]
+            except Exception as e:
+                logger.error(f"No se pudo resolver el beneficio de {beneficiary['cpf']}: {str(e)}")
+
+        by_modal = [b for b in beneficiaries if not b.get("dialog_url")]
+        await asyncio.gather(
+            *(resolve(b) for b in beneficiaries if b.get("dialog_url")),
+            self._resolve_sequentially(resolve, by_modal),
+        )
+        logger.info(
+            f"Resueltos {len(benefit_numbers)}/{len(beneficiaries)} números de beneficio"
+        )
+        return benefit_numbers
+
+    async def _resolve_sequentially(self, resolve, beneficiaries):
+        """Resuelve uno a uno los beneficiarios que comparten la página principal."""
+        for beneficiary in beneficiaries:
+            await resolve(beneficiary)
+
+    @timed("erp.logout")
+    async def logout(self):
+        """Cierra la sesión y el navegador."""
+        try:
+            if self.page:
+                await self.page.click("#logout-button")
+        except Exception as e:
+            logger.error(f"Error en logout de ERP: {str(e)}")
+        finally:
+            # Liberar el navegador aunque falle el cierre de sesión
+            await self.cleanup()
+
+    async def cleanup(self) -> None:
+        """Limpia los recursos de Playwright de manera segura."""
+        try:
+            if self.page and not self.page.is_closed():
+                await self.page.close()
+            if self.tracer:
+                # Descarta los fragmentos retenidos antes de cerrar el contexto
+                await self.tracer.stop()
+            if self.context:
+                await self.context.close()
+            if self.browser_manager:
+                # El navegador solo se cierra cuando lo libera el último cliente
+                if self.browser:
+                    await self.browser_manager.release()
+            else:
+                if self.browser:
+                    await self.browser.close()
+                if self.playwright:
+                    await self.playwright.stop()
+        except Exception as e:
+            logger.error(f"Error durante la limpieza: {str(e)}")
+        finally:
+            self.page = None
+            self.waiter = None
+            self.tracer = None
+            self.context = None
+            self.browser = None
+            self.playwright = None
+            # Cierra la conexión SQLite; se reabre si el cliente vuelve a usarse
+            self.ledger.close()
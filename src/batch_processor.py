@@ -0,0 +1,446 @@
+import os
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from src.notification_manager import NotificationManager
+from src.pipeline import Pipeline, Stage
+from src.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+def _record_failure(summary, cpf, error):
+    """Registra el fallo de un beneficiario sin detener el lote."""
+    logger.error(f"Error procesando beneficiario {cpf}: {str(error)}")
+    summary["failed"] += 1
+    summary["failures"].append({"cpf": cpf, "error": str(error)})
+    NotificationManager.send_error_notification(
+        f"Error procesando beneficiario {cpf}", str(error)
+    )
+
+
+def _emit(progress, summary, pending, start):
+    """Envía al callback de progreso una instantánea de los contadores."""
+    if progress is None:
+        return
+    elapsed = time.monotonic() - start
+    progress(
+        {
+            "total": summary["total"],
+            "processed": summary["processed"],
+            "failed": summary["failed"],
+            "pending": pending,
+            "elapsed": elapsed,
+            "per_minute": summary["processed"] * 60 / elapsed if elapsed > 0 else 0.0,
+        }
+    )
+
+
+def _take(beneficiaries, count, summary):
+    """Saca hasta ``count`` beneficiarios del iterador y los suma al total del lote."""
+    items = list(itertools.islice(beneficiaries, count))
+    summary["total"] += len(items)
+    return items
+
+
+def _limit(beneficiaries, count):
+    """Como ``islice``, pero al llegar a ``count`` pide un elemento más a la fuente.
+
+    Si el informe tenía justo ``count`` pendientes, esa lectura de más deja
+    terminar el generador, que así deja pendiente su marca de agua. Si
+    quedaban más, el elemento leído se descarta: sin marca de agua nueva se
+    extrae de nuevo en el siguiente ciclo.
+    """
+    for index, beneficiary in enumerate(beneficiaries):
+        if index >= count:
+            return
+        yield beneficiary
+
+
+def _until_stopped(beneficiaries, stop_event):
+    """Deja de pedir beneficiarios a la fuente en cuanto se activa ``stop_event``.
+
+    Leer un beneficiario del informe puede abrir su diálogo modal, así que
+    la parada se comprueba antes de cada lectura y no solo entre tandas.
+    """
+    while not stop_event.is_set():
+        try:
+            beneficiary = next(beneficiaries)
+        except StopIteration:
+            return
+        yield beneficiary
+
+
+def _close(beneficiaries):
+    """Cierra el generador del informe para liberar las pestañas abiertas."""
+    close = getattr(beneficiaries, "close", None)
+    if close is not None:
+        close()
+
+
+def process_batch(
+    erp_client, dataprev_client, beneficiaries, batch_size=0, stop_event=None, progress=None
+):
+    """Procesa un lote de beneficiarios aislando los errores de cada uno.
+
+    ``beneficiaries`` puede ser una lista o el iterador de
+    ``ERPClient.iter_beneficiaries``: los beneficiarios se leen a medida que
+    hacen falta, con un búfer de como máximo BENEFICIARY_BUFFER elementos,
+    así que la extracción avanza al ritmo de Dataprev. Si ``batch_size`` es
+    mayor que 0 solo se procesan los primeros ``batch_size`` beneficiarios;
+    el resto queda para la siguiente ejecución.
+
+    El lote avanza en tandas del tamaño del pool de Dataprev. ``stop_event``
+    se comprueba antes de leer cada beneficiario, antes de cada consulta de
+    detalle en el ERP y entre tandas; los beneficiarios ya leídos y no
+    iniciados quedan aplazados. Tras cada tanda se llama a ``progress`` con
+    los contadores actuales.
+    Cada paso que falla se reintenta con back-off (``RetryPolicy``) y cada
+    tanda queda guardada en el registro, de modo que una ejecución
+    interrumpida continúa donde se quedó.
+    """
+    source = iter(beneficiaries)
+    beneficiaries = source
+    if stop_event is not None:
+        beneficiaries = _until_stopped(source, stop_event)
+    if batch_size and batch_size > 0:
+        beneficiaries = _limit(beneficiaries, batch_size)
+
+    summary = _new_summary(0)
+    start = time.monotonic()
+    chunk_size = max(1, int(os.getenv("DATAPREV_CONCURRENCY", "4")))
+    buffer_size = max(chunk_size, int(os.getenv("BENEFICIARY_BUFFER", str(chunk_size * 4))))
+    buffer = deque()
+    exhausted = False
+    retry = RetryPolicy()
+
+    try:
+        while True:
+            if not exhausted:
+                try:
+                    items = _take(beneficiaries, buffer_size - len(buffer), summary)
+                except Exception as e:
+                    # Sin marca de agua pendiente, lo no leído se extrae en el próximo ciclo
+                    logger.error(f"Error leyendo el informe de beneficiarios: {str(e)}")
+                    NotificationManager.send_error_notification(
+                        "Error leyendo el informe de beneficiarios", str(e)
+                    )
+                    items = []
+                exhausted = len(items) < buffer_size - len(buffer)
+                buffer.extend(items)
+            if not buffer:
+                break
+            if stop_event is not None and stop_event.is_set():
+                summary["deferred"].extend(beneficiary["cpf"] for beneficiary in buffer)
+                logger.info(f"Lote detenido: {len(buffer)} beneficiarios aplazados")
+                break
+            chunk = [buffer.popleft() for _ in range(min(chunk_size, len(buffer)))]
+            _process_chunk(erp_client, dataprev_client, chunk, summary, retry, stop_event)
+            _emit(progress, summary, len(buffer), start)
+    finally:
+        _close(source)
+
+    return _finish_summary(summary, start)
+
+
+def _process_chunk(erp_client, dataprev_client, beneficiaries, summary, retry, stop_event=None):
+    """Resuelve y verifica una tanda de beneficiarios.
+
+    Si se activa ``stop_event`` mientras se resuelven los números, los
+    beneficiarios que aún necesitaban su consulta de detalle quedan aplazados.
+    """
+    # Diálogos modales que ya fallaron al leerse en su página del informe
+    for beneficiary in beneficiaries:
+        if beneficiary.get("error"):
+            _record_failure(summary, beneficiary["cpf"], beneficiary["error"])
+    beneficiaries = [beneficiary for beneficiary in beneficiaries if not beneficiary.get("error")]
+
+    # Resolver los números de beneficio de la tanda de una vez
+    try:
+        benefit_numbers = retry.call(
+            erp_client.get_benefit_numbers, beneficiaries, recover=erp_client.recover
+        )
+    except Exception as e:
+        logger.error(f"No se pudieron resolver los números de beneficio de la tanda: {str(e)}")
+        benefit_numbers = {}
+
+    to_check = []
+    for beneficiary in beneficiaries:
+        cpf = beneficiary["cpf"]
+        benefit_number = benefit_numbers.get(cpf)
+        if not benefit_number:
+            if stop_event is not None and stop_event.is_set():
+                summary["deferred"].append(cpf)
+                continue
+            try:
+                benefit_number = retry.call(
+                    erp_client.process_beneficiary_details,
+                    beneficiary,
+                    recover=erp_client.recover,
+                )["benefit_number"]
+            except Exception as e:
+                _record_failure(summary, cpf, e)
+                continue
+        to_check.append((cpf, benefit_number))
+
+    # Verificar en Dataprev con el pool de páginas
+    logger.info(f"Verificando {len(to_check)} beneficiarios en Dataprev...")
+    try:
+        results = retry.call(
+            dataprev_client.check_benefits, to_check, recover=dataprev_client.recover
+        )
+    except Exception as e:
+        results = [
+            {"cpf": cpf, "benefit_number": benefit_number, "status": None, "error": str(e)}
+            for cpf, benefit_number in to_check
+        ]
+    for result in results:
+        if result.get("error"):
+            _record_failure(summary, result["cpf"], result["error"])
+            continue
+        summary["results"].append(result)
+        summary["processed"] += 1
+
+    # Guardar la tanda en el registro de procesados en una sola transacción
+    erp_client.ledger.record_results(results)
+
+
+async def process_batch_async(
+    erp_client, dataprev_client, beneficiaries, batch_size=0, stop_event=None, progress=None
+):
+    """Procesa el lote como un pipeline de etapas con colas acotadas.
+
+    Etapas: extracción del informe (``beneficiaries``, una lista o el
+    iterador asíncrono de ``AsyncERPClient.iter_beneficiaries``) ->
+    resolución del número de beneficio (ERP_DIALOG_CONCURRENCY workers) ->
+    consulta en Dataprev (DATAPREV_CONCURRENCY workers, cada uno con su
+    página) -> registro del resultado. Cada cola admite PIPELINE_QUEUE_SIZE
+    elementos (por defecto el doble de workers de la etapa), así que una
+    etapa lenta frena a las anteriores hasta la lectura del informe. Cuando
+    se activa ``stop_event`` la lectura se detiene y los beneficiarios que
+    esperan en la cola de resolución quedan aplazados; los que ya tienen su
+    número siguen hasta Dataprev. El resumen incluye en ``stages`` la
+    utilización y la profundidad de cola de cada etapa.
+    """
+    summary = _new_summary(0)
+    start = time.monotonic()
+    queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "0"))
+    retry = RetryPolicy()
+    # Los beneficiarios del informe llegan con los diálogos modales ya leídos en
+    # su página; los de una lista ya leída los abren en la página principal
+    modal_lock = asyncio.Lock()
+
+    async def extract():
+        try:
+            async for beneficiary in _aiter(beneficiaries):
+                # El límite se comprueba con el siguiente elemento ya pedido: si el
+                # informe se agotó justo en ``batch_size`` su marca de agua queda pendiente
+                if batch_size and batch_size > 0 and summary["total"] >= batch_size:
+                    break
+                if stop_event is not None and stop_event.is_set():
+                    # Ya leído del informe: cuenta en el lote y queda aplazado
+                    summary["total"] += 1
+                    summary["deferred"].append(beneficiary["cpf"])
+                    logger.info("Lote detenido: los beneficiarios restantes quedan aplazados")
+                    break
+                summary["total"] += 1
+                yield beneficiary
+        except Exception as e:
+            logger.error(f"Error leyendo el informe de beneficiarios: {str(e)}")
+            NotificationManager.send_error_notification(
+                "Error leyendo el informe de beneficiarios", str(e)
+            )
+        finally:
+            aclose = getattr(beneficiaries, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def resolve(beneficiary, _):
+        if stop_event is not None and stop_event.is_set():
+            # Leído pero sin empezar: se aplaza como el búfer de la versión síncrona
+            summary["deferred"].append(beneficiary["cpf"])
+            return None
+        if beneficiary.get("error"):
+            _record_failure(summary, beneficiary["cpf"], beneficiary["error"])
+            return None
+        try:
+            if beneficiary.get("benefit_number") or beneficiary.get("dialog_url"):
+                details = await retry.call_async(
+                    erp_client.process_beneficiary_details,
+                    beneficiary,
+                    recover=erp_client.recover,
+                )
+            else:
+                async with modal_lock:
+                    details = await retry.call_async(
+                        erp_client.process_beneficiary_details,
+                        beneficiary,
+                        recover=erp_client.recover,
+                    )
+        except Exception as e:
+            _record_failure(summary, beneficiary["cpf"], e)
+            return None
+        return details["cpf"], details["benefit_number"]
+
+    @asynccontextmanager
+    async def dataprev_page():
+        # Lista de un elemento para poder cambiar la página tras un fallo
+        slot = [await dataprev_client.context.new_page()]
+        try:
+            yield slot
+        finally:
+            await slot[0].close()
+
+    async def check(item, slot):
+        cpf, benefit_number = item
+
+        async def reset_page():
+            await dataprev_client.ensure_session(slot[0])
+            # La página puede haber quedado en un estado inconsistente
+            await slot[0].close()
+            slot[0] = await dataprev_client.context.new_page()
+
+        try:
+            return await retry.call_async(
+                lambda: dataprev_client.check_benefit(cpf, benefit_number, page=slot[0]),
+                name="dataprev.check_benefit",
+                recover=reset_page,
+            )
+        except Exception as e:
+            _record_failure(summary, cpf, e)
+            return {"cpf": cpf, "benefit_number": benefit_number, "status": None, "error": str(e)}
+
+    async def record(result, _):
+        if not result.get("error"):
+            summary["results"].append(result)
+            summary["processed"] += 1
+        # Punto de control por beneficiario para reanudar tras una caída
+        erp_client.ledger.record_results([result])
+        _emit(progress, summary, pipeline.pending(), start)
+
+    pipeline = Pipeline(
+        extract(),
+        [
+            Stage(
+                "erp.resolve",
+                resolve,
+                workers=int(os.getenv("ERP_DIALOG_CONCURRENCY", "4")),
+                queue_size=queue_size,
+            ),
+            Stage(
+                "dataprev.check",
+                check,
+                workers=int(os.getenv("DATAPREV_CONCURRENCY", "4")),
+                queue_size=queue_size,
+                context=dataprev_page,
+            ),
+            Stage("ledger.record", record, queue_size=queue_size),
+        ],
+        source_name="erp.extraction",
+    )
+    summary["stages"] = await pipeline.run()
+    pipeline.log_stats(summary["stages"])
+    return _finish_summary(summary, start)
+
+
+async def _aiter(beneficiaries):
+    """Recorre por igual listas e iteradores asíncronos de beneficiarios."""
+    if hasattr(beneficiaries, "__aiter__"):
+        async for beneficiary in beneficiaries:
+            yield beneficiary
+    else:
+        for beneficiary in beneficiaries:
+            yield beneficiary
+
+
+def _new_summary(total):
+    """Crea el resumen vacío de un lote."""
+    return {
+        "total": total,
+        "processed": 0,
+        "failed": 0,
+        "results": [],
+        "failures": [],
+        "deferred": [],
+        "elapsed": 0.0,
+        "per_minute": 0.0,
+    }
+
+
+def _finish_summary(summary, start):
+    """Completa el resumen con la duración y el throughput del lote."""
+    summary["elapsed"] = time.monotonic() - start
+    if summary["elapsed"] > 0:
+        summary["per_minute"] = summary["processed"] * 60 / summary["elapsed"]
+    return summary
+
+
+def unfinished_cpfs(summary):
+    """CPF del lote que deben volver a extraerse: fallidos y aplazados."""
+    return [failure["cpf"] for failure in summary["failures"]] + summary["deferred"]
+
+
+def log_summary(summary):
+    """Registra el resumen de throughput y fallos del lote."""
+    logger.info(
+        f"Resumen del lote: {summary['processed']}/{summary['total']} procesados, "
+        f"{summary['failed']} con error en {summary['elapsed']:.1f}s "
+        f"({summary['per_minute']:.1f} beneficiarios/min)"
+    )
+    for failure in summary["failures"]:
+        logger.info(f"  Fallo CPF {failure['cpf']}: {failure['error']}")
+
+
+def run_cycle(erp_client, dataprev_client, batch_size=0, stop_event=None, progress=None):
+    """Ejecuta un ciclo completo sobre clientes ya autenticados.
+
+    Procesa los beneficiarios pendientes a medida que se leen del informe y
+    confirma la marca de agua. Devuelve el resumen o None si no había
+    pendientes.
+    """
+    logger.info("Obteniendo lista de beneficiarios...")
+    beneficiaries = RetryPolicy().call(
+        erp_client.iter_beneficiaries, recover=erp_client.recover
+    )
+    summary = process_batch(
+        erp_client,
+        dataprev_client,
+        beneficiaries,
+        batch_size=batch_size,
+        stop_event=stop_event,
+        progress=progress,
+    )
+    return _finish_cycle(erp_client, summary)
+
+
+async def run_cycle_async(
+    erp_client, dataprev_client, batch_size=0, stop_event=None, progress=None
+):
+    """Versión asíncrona de ``run_cycle``."""
+    logger.info("Obteniendo lista de beneficiarios...")
+    beneficiaries = await RetryPolicy().call_async(
+        erp_client.iter_beneficiaries, recover=erp_client.recover
+    )
+    summary = await process_batch_async(
+        erp_client,
+        dataprev_client,
+        beneficiaries,
+        batch_size=batch_size,
+        stop_event=stop_event,
+        progress=progress,
+    )
+    return _finish_cycle(erp_client, summary)
+
+
+def _finish_cycle(erp_client, summary):
+    """Confirma la marca de agua y registra el resumen del ciclo."""
+    if not summary["total"]:
+        logger.info("No se encontraron beneficiarios para procesar")
+        erp_client.commit_watermark()
+        return None
+    erp_client.commit_watermark(exclude_cpfs=unfinished_cpfs(summary))
+    log_summary(summary)
+    return summary
@@ -0,0 +1,181 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+from playwright.async_api import async_playwright
+from playwright.sync_api import sync_playwright
+from src.browser_profile import BrowserProfile
+
+try:
+    import psutil
+except ImportError:  # sin psutil la memoria se lee de /proc
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+LAUNCH_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+]
+
+
+def _proc_resident_bytes(root):
+    """Memoria residente (bytes) de ``root`` y sus descendientes leída de /proc."""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children = {}
+    rss = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{name}/statm") as f:
+                statm = f.read()
+        except OSError:
+            # El proceso terminó mientras se recorría /proc
+            continue
+        # El nombre del proceso va entre paréntesis y puede contener espacios
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(name))
+        rss[int(name)] = int(statm.split()[1]) * page_size
+    total = 0
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        total += rss.get(pid, 0)
+        pending.extend(children.get(pid, []))
+    return total
+
+
+def resident_memory_mb():
+    """Memoria residente (MB) de este proceso y sus hijos (driver y Chrome).
+
+    Usa psutil si está instalado y, si no, lee /proc (Linux). Devuelve None
+    si no hay ninguna de las dos fuentes.
+    """
+    if psutil is None:
+        if not os.path.isdir("/proc"):
+            return None
+        return _proc_resident_bytes(os.getpid()) / (1024 * 1024)
+    process = psutil.Process(os.getpid())
+    total = 0
+    for proc in [process] + process.children(recursive=True):
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+
+class BrowserManager:
+    """Comparte un único proceso de navegador entre varios clientes.
+
+    Cada cliente obtiene el navegador con ``acquire()`` y crea su propio
+    contexto aislado; ``release()`` solo cierra el navegador cuando el último
+    cliente lo libera.
+    """
+
+    def __init__(self, headless=None):
+        if headless is None:
+            headless = BrowserProfile.from_env().headless
+        self.headless = headless
+        self.playwright = None
+        self.browser = None
+        self.refcount = 0
+        self.startup_seconds = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Devuelve el navegador compartido, lanzándolo si es necesario."""
+        with self._lock:
+            if self.browser is None:
+                start = time.monotonic()
+                self.playwright = sync_playwright().start()
+                self.browser = self.playwright.chromium.launch(
+                    headless=self.headless,
+                    channel="chrome",  # Usar Chrome instalado en el sistema
+                    args=LAUNCH_ARGS,
+                )
+                self.startup_seconds = time.monotonic() - start
+                self.report()
+            self.refcount += 1
+            return self.browser
+
+    def release(self):
+        """Libera una referencia y cierra el navegador si era la última."""
+        with self._lock:
+            if self.refcount == 0:
+                return
+            self.refcount -= 1
+            if self.refcount == 0:
+                self._close()
+
+    def _close(self):
+        """Cierra el navegador y el driver de Playwright."""
+        try:
+            if self.browser:
+                self.browser.close()
+            if self.playwright:
+                self.playwright.stop()
+        except Exception as e:
+            logger.error(f"Error cerrando el navegador compartido: {str(e)}")
+        finally:
+            self.browser = None
+            self.playwright = None
+
+    def report(self):
+        """Registra el tiempo de arranque y la memoria residente."""
+        memory = resident_memory_mb()
+        memory_text = f"{memory:.0f} MB" if memory is not None else "no disponible"
+        logger.info(
+            f"Navegador compartido iniciado en {self.startup_seconds:.2f}s; "
+            f"memoria residente: {memory_text}"
+        )
+
+
+class AsyncBrowserManager(BrowserManager):
+    """Versión de ``BrowserManager`` para ``playwright.async_api``."""
+
+    def __init__(self, headless=None):
+        super().__init__(headless=headless)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Devuelve el navegador compartido, lanzándolo si es necesario."""
+        async with self._lock:
+            if self.browser is None:
+                start = time.monotonic()
+                self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.chromium.launch(
+                    headless=self.headless,
+                    channel="chrome",  # Usar Chrome instalado en el sistema
+                    args=LAUNCH_ARGS,
+                )
+                self.startup_seconds = time.monotonic() - start
+                self.report()
+            self.refcount += 1
+            return self.browser
+
+    async def release(self):
+        """Libera una referencia y cierra el navegador si era la última."""
+        async with self._lock:
+            if self.refcount == 0:
+                return
+            self.refcount -= 1
+            if self.refcount == 0:
+                await self._close()
+
+    async def _close(self):
+        """Cierra el navegador y el driver de Playwright."""
+        try:
+            if self.browser:
+                await self.browser.close()
+            if self.playwright:
+                await self.playwright.stop()
+        except Exception as e:
+            logger.error(f"Error cerrando el navegador compartido: {str(e)}")
+        finally:
+            self.browser = None
+            self.playwright = None
@@ -0,0 +1,94 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Recursos que el perfil de producción no descarga
+PRODUCTION_BLOCKED_RESOURCES = "image,font,media"
+PRODUCTION_BLOCKED_HOSTS = (
+    "google-analytics.com,googletagmanager.com,doubleclick.net,hotjar.com"
+)
+PRODUCTION_VIEWPORT = "1280x720"
+
+
+def _split(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class BrowserProfile:
+    """Parámetros del navegador según el entorno de ejecución.
+
+    El perfil ``production`` ejecuta sin ventana, bloquea imágenes, fuentes,
+    multimedia y analítica y usa un viewport más pequeño. Cada valor puede
+    ajustarse por separado con variables de entorno.
+    """
+
+    def __init__(self, name, headless, blocked_resources, blocked_hosts, viewport):
+        self.name = name
+        self.headless = headless
+        self.blocked_resources = set(blocked_resources)
+        self.blocked_hosts = list(blocked_hosts)
+        self.viewport = viewport
+
+    @classmethod
+    def from_env(cls, default_viewport=None):
+        """Construye el perfil a partir de BROWSER_PROFILE y sus variables asociadas."""
+        name = os.getenv("BROWSER_PROFILE", "default").lower()
+        production = name == "production"
+
+        headless = os.getenv("BROWSER_HEADLESS", "true" if production else "false")
+        resources = os.getenv(
+            "BROWSER_BLOCK_RESOURCES", PRODUCTION_BLOCKED_RESOURCES if production else ""
+        )
+        hosts = os.getenv("BROWSER_BLOCK_HOSTS", PRODUCTION_BLOCKED_HOSTS if production else "")
+        viewport = os.getenv("BROWSER_VIEWPORT", PRODUCTION_VIEWPORT if production else "")
+
+        if viewport:
+            width, height = (int(value) for value in viewport.lower().split("x"))
+            viewport = {"width": width, "height": height}
+        else:
+            viewport = default_viewport
+
+        return cls(
+            name,
+            headless.lower() == "true",
+            _split(resources),
+            _split(hosts),
+            viewport,
+        )
+
+    @property
+    def blocks_requests(self):
+        return bool(self.blocked_resources or self.blocked_hosts)
+
+    def should_block(self, request):
+        """Indica si la petición debe abortarse según el perfil."""
+        if request.resource_type in self.blocked_resources:
+            return True
+        return any(host in request.url for host in self.blocked_hosts)
+
+    def apply(self, context):
+        """Registra el bloqueo de recursos en un contexto de ``sync_api``."""
+        if not self.blocks_requests:
+            return
+
+        def handle(route):
+            if self.should_block(route.request):
+                route.abort()
+            else:
+                route.continue_()
+
+        context.route("**/*", handle)
+
+    async def apply_async(self, context):
+        """Registra el bloqueo de recursos en un contexto de ``async_api``."""
+        if not self.blocks_requests:
+            return
+
+        async def handle(route):
+            if self.should_block(route.request):
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await context.route("**/*", handle)
@@ -1,50 +1,352 @@
+import os
 import logging
+import queue
+import subprocess
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pytesseract
 from PIL import Image
 import io
 
+try:
+    import tesserocr
+except ImportError:  # tesserocr es opcional (requirements-ocr.txt); sin él se usa el binario
+    tesserocr = None
+
 logger = logging.getLogger(__name__)
 
+# Caracteres que pueden aparecer en los captchas
+DEFAULT_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+# Modo de segmentación de tesseract: una sola línea de texto
+SINGLE_LINE_PSM = 7
+# Factor de ampliación antes del OCR (tesseract prefiere trazos de 20-30 px)
+UPSCALE = 3
 
-class CaptchaSolver:
-    def __init__(self):
-        # Configurar pytesseract si es necesario
-        # pytesseract.pytesseract.tesseract_cmd = r'path_to_tesseract'
-        pass
 
-    def preprocess_image(self, image):
-        """Preprocesa la imagen del captcha para mejorar el reconocimiento."""
+def stretch_contrast(gray):
+    """Estira el rango de grises entre los percentiles 2 y 98."""
+    low, high = np.percentile(gray, (2, 98))
+    if high <= low:
+        return gray
+    return np.clip((gray - low) * (255.0 / (high - low)), 0, 255)
+
+
+def median_filter(gray, size=3):
+    """Filtro de mediana ``size`` x ``size`` para quitar el ruido de puntos."""
+    pad = size // 2
+    padded = np.pad(gray, pad, mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (size, size))
+    return np.median(windows, axis=(-2, -1))
+
+
+def otsu_threshold(gray):
+    """Umbral de Otsu calculado sobre el histograma de la imagen."""
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(float)
+    levels = np.arange(256)
+    weight = np.cumsum(histogram)
+    mean = np.cumsum(histogram * levels)
+    total_weight, total_mean = weight[-1], mean[-1]
+    background = weight[:-1]
+    foreground = total_weight - background
+    valid = (background > 0) & (foreground > 0)
+    variance = np.zeros(255)
+    mean_background = mean[:-1][valid] / background[valid]
+    mean_foreground = (total_mean - mean[:-1][valid]) / foreground[valid]
+    variance[valid] = (
+        background[valid] * foreground[valid] * (mean_background - mean_foreground) ** 2
+    )
+    return int(np.argmax(variance))
+
+
+def adaptive_threshold(gray, block=15, offset=10):
+    """Tinta = píxeles más oscuros que la media de su vecindario menos ``offset``."""
+    pad = block // 2
+    padded = np.pad(gray, pad, mode="edge")
+    integral = np.pad(padded.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    height, width = gray.shape
+    sums = (
+        integral[block:block + height, block:block + width]
+        - integral[:height, block:block + width]
+        - integral[block:block + height, :width]
+        + integral[:height, :width]
+    )
+    return gray < sums / (block * block) - offset
+
+
+def remove_lines(ink, thickness=2):
+    """Borra las líneas horizontales finas que cruzan el captcha.
+
+    Un píxel de tinta se borra si no hay tinta ``thickness + 1`` píxeles por
+    encima ni por debajo, es decir, si forma parte de un trazo horizontal
+    más fino que los caracteres.
+    """
+    distance = thickness + 1
+    above = np.zeros_like(ink)
+    below = np.zeros_like(ink)
+    above[distance:] = ink[:-distance]
+    below[:-distance] = ink[distance:]
+    return ink & (above | below)
+
+
+def preprocess_variants(image_bytes):
+    """Genera en una pasada las variantes binarizadas y ampliadas del captcha.
+
+    Devuelve una lista de pares (nombre, imagen PIL) con texto negro sobre
+    blanco: umbral de Otsu, Otsu sin líneas, umbral adaptativo y la imagen en
+    grises con el contraste estirado.
+    """
+    gray = np.asarray(Image.open(io.BytesIO(image_bytes)).convert("L"), dtype=float)
+    gray = median_filter(stretch_contrast(gray))
+    # Si el fondo es oscuro se invierte para que la tinta sea siempre oscura
+    if np.median(gray) < 128:
+        gray = 255 - gray
+    otsu = gray < otsu_threshold(gray)
+    variants = [
+        ("otsu", otsu),
+        ("otsu_sin_lineas", remove_lines(otsu)),
+        ("adaptativo", remove_lines(adaptive_threshold(gray))),
+        ("contraste", gray),
+    ]
+    images = []
+    for name, array in variants:
+        if array.dtype == bool:
+            array = np.where(array, 0, 255)
+        array = array.astype(np.uint8).repeat(UPSCALE, axis=0).repeat(UPSCALE, axis=1)
+        images.append((name, Image.fromarray(array)))
+    return images
+
+
+def vote(answers):
+    """Elige la respuesta más repetida y su confianza (fracción de votos).
+
+    Las respuestas vacías no votan pero cuentan en el total; con empate gana
+    la de la variante anterior en la lista.
+    """
+    counts = Counter(answer for answer in answers if answer)
+    if not counts:
+        return "", 0.0
+    best = max(counts, key=lambda answer: (counts[answer], -answers.index(answer)))
+    return best, counts[best] / len(answers)
+
+
+def _regroup(texts, groups):
+    """Reparte la lista plana ``texts`` con la forma de ``groups`` (lista de listas)."""
+    result = []
+    offset = 0
+    for group in groups:
+        result.append(texts[offset:offset + len(group)])
+        offset += len(group)
+    return result
+
+
+class TesserocrEngine:
+    """OCR en proceso con la API de tesseract cargada una sola vez.
+
+    Mantiene ``workers`` instancias de ``PyTessBaseAPI`` (no son seguras entre
+    hilos) y reparte un lote entre ellas; tesserocr libera el GIL durante el
+    reconocimiento, así que las instancias trabajan en paralelo.
+    """
+
+    def __init__(self, whitelist, psm, workers):
+        self.workers = workers
+        self._apis = queue.Queue()
+        for _ in range(workers):
+            api = tesserocr.PyTessBaseAPI(psm=psm)
+            api.SetVariable("tessedit_char_whitelist", whitelist)
+            self._apis.put(api)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+
+    def _recognize_one(self, image):
+        api = self._apis.get()
         try:
-            # Convertir bytes a imagen PIL
-            img = Image.open(io.BytesIO(image))
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        finally:
+            self._apis.put(api)
+
+    def recognize(self, images):
+        return list(self._executor.map(self._recognize_one, images))
 
-            # Convertir a escala de grises
-            img = img.convert("L")
+    def recognize_captchas(self, groups):
+        """Reconoce las variantes de varios captchas; sin coste de arranque por imagen."""
+        return _regroup(self.recognize([image for group in groups for image in group]), groups)
 
-            # Aumentar el contraste
-            # Aquí puedes agregar más preprocesamiento según sea necesario
+    def close(self):
+        self._executor.shutdown()
+        while not self._apis.empty():
+            self._apis.get().End()
 
-            return img
+
+class TesseractBatchEngine:
+    """OCR con el binario de tesseract, un proceso por grupo de imágenes.
+
+    En vez de lanzar tesseract por cada imagen, el lote se divide en como
+    máximo ``workers`` grupos y cada grupo se reconoce con una sola
+    invocación que recibe la lista de imágenes; el texto de cada imagen llega
+    separado por un salto de página. Las variantes de un mismo captcha nunca
+    se reparten entre grupos, así que un captcha suelto cuesta un solo
+    proceso. Los grupos se ejecutan en paralelo en un pool de hilos que se
+    mantiene abierto entre lotes.
+    """
+
+    def __init__(self, whitelist, psm, workers):
+        self.workers = workers
+        self.config = ["--psm", str(psm), "-c", f"tessedit_char_whitelist={whitelist}"]
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+
+    def _recognize_group(self, images):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for index, image in enumerate(images):
+                path = os.path.join(directory, f"{index}.png")
+                image.save(path)
+                paths.append(path)
+            listing = os.path.join(directory, "images.txt")
+            with open(listing, "w", encoding="utf-8") as f:
+                f.write("\n".join(paths))
+            output = subprocess.run(
+                [pytesseract.pytesseract.tesseract_cmd, listing, "stdout", *self.config],
+                capture_output=True,
+                check=True,
+            ).stdout.decode("utf-8")
+        texts = output.split("\f")
+        return (texts + [""] * len(images))[: len(images)]
+
+    def recognize(self, images):
+        return [texts[0] for texts in self.recognize_captchas([[image] for image in images])]
+
+    def recognize_captchas(self, groups):
+        """Reconoce las variantes de varios captchas, repartiendo solo captchas enteros."""
+        size = max(1, -(-len(groups) // self.workers))
+        chunks = [groups[start:start + size] for start in range(0, len(groups), size)]
+        flat = [[image for group in chunk for image in group] for chunk in chunks]
+        results = self._executor.map(self._recognize_group, flat)
+        return [
+            texts
+            for chunk, texts_of_chunk in zip(chunks, results)
+            for texts in _regroup(texts_of_chunk, chunk)
+        ]
+
+    def close(self):
+        self._executor.shutdown()
+
+
+class CaptchaSolver:
+    def __init__(self, engine=None, whitelist=None, psm=None, workers=None):
+        self.whitelist = whitelist or os.getenv("CAPTCHA_WHITELIST", DEFAULT_WHITELIST)
+        self.psm = psm if psm is not None else int(os.getenv("CAPTCHA_PSM", str(SINGLE_LINE_PSM)))
+        self.workers = workers or int(os.getenv("CAPTCHA_WORKERS", str(os.cpu_count() or 1)))
+        # Fracción mínima de variantes que deben coincidir para fiarse de la respuesta
+        self.min_confidence = float(os.getenv("CAPTCHA_MIN_CONFIDENCE", "0.5"))
+        # Motor de OCR: auto (tesserocr si está instalado), tesserocr o cli
+        engine = engine or os.getenv("CAPTCHA_ENGINE", "auto")
+        self._engine_name = engine
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        """Motor de OCR, creado en el primer uso y reutilizado después."""
+        with self._lock:
+            if self._engine is None:
+                self._engine = self._create_engine()
+            return self._engine
+
+    def _create_engine(self):
+        use_tesserocr = self._engine_name == "tesserocr" or (
+            self._engine_name == "auto" and tesserocr is not None
+        )
+        if use_tesserocr:
+            if tesserocr is None:
+                raise RuntimeError("CAPTCHA_ENGINE=tesserocr requiere instalar tesserocr")
+            logger.info(f"OCR de captchas con tesserocr ({self.workers} instancias)")
+            return TesserocrEngine(self.whitelist, self.psm, self.workers)
+        logger.info(
+            f"OCR de captchas con el binario de tesseract ({self.workers} procesos por lote)"
+        )
+        return TesseractBatchEngine(self.whitelist, self.psm, self.workers)
+
+    def preprocess_image(self, image):
+        """Preprocesa la imagen del captcha para mejorar el reconocimiento.
+
+        Devuelve la variante principal (umbral de Otsu sin líneas, ampliada).
+        """
+        try:
+            return dict(preprocess_variants(image))["otsu_sin_lineas"]
 
         except Exception as e:
             logger.error(f"Error en preprocesamiento de imagen: {str(e)}")
             raise
 
+    @staticmethod
+    def clean_text(text):
+        """Limpia el texto reconocido."""
+        return text.strip().replace(" ", "").upper()
+
     def solve(self, image_bytes):
         """Resuelve el captcha usando OCR."""
-        try:
-            # Preprocesar imagen
-            processed_image = self.preprocess_image(image_bytes)
+        return self.solve_batch([image_bytes])[0]
+
+    def solve_batch(self, images):
+        """Resuelve varios captchas en una sola llamada al motor de OCR."""
+        return [text for text, _ in self.solve_batch_with_confidence(images)]
 
-            # Realizar OCR
-            text = pytesseract.image_to_string(processed_image)
+    def solve_with_confidence(self, image_bytes):
+        """Resuelve el captcha y devuelve (texto, confianza entre 0 y 1)."""
+        return self.solve_batch_with_confidence([image_bytes])[0]
 
-            # Limpiar resultado
-            text = text.strip().replace(" ", "").upper()
+    def solve_batch_with_confidence(self, images):
+        """Reconoce todas las variantes de todos los captchas y vota por captcha.
 
-            logger.info("Captcha resuelto exitosamente")
-            return text
+        Las variantes se envían juntas al motor de OCR, que reparte los
+        captchas entre sus workers sin separar las variantes de cada uno; la
+        confianza es la fracción de variantes que coinciden.
+        """
+        try:
+            # Preprocesar imágenes
+            variants = [
+                [image for _, image in preprocess_variants(image)] for image in images
+            ]
+
+            # Realizar OCR de todas las variantes a la vez
+            answers = [
+                vote([self.clean_text(text) for text in texts])
+                for texts in self.engine.recognize_captchas(variants)
+            ]
+
+            logger.info(f"{len(answers)} captchas resueltos exitosamente")
+            return answers
 
         except Exception as e:
             logger.error(f"Error resolviendo captcha: {str(e)}")
             raise
+
+    def solve_until_confident(self, fetch_image, attempts=None):
+        """Pide captchas nuevos a ``fetch_image`` hasta alcanzar la confianza mínima.
+
+        Así una respuesta dudosa se descarta antes de enviar el formulario. Si
+        ningún intento llega a CAPTCHA_MIN_CONFIDENCE se devuelve el mejor.
+        """
+        attempts = attempts or int(os.getenv("CAPTCHA_ATTEMPTS", "3"))
+        best = ("", 0.0)
+        for attempt in range(attempts):
+            text, confidence = self.solve_with_confidence(fetch_image())
+            if confidence > best[1]:
+                best = (text, confidence)
+            if confidence >= self.min_confidence:
+                break
+            logger.info(
+                f"Captcha con confianza baja ({confidence:.0%}, intento {attempt + 1}), "
+                "pidiendo otro"
+            )
+        return best
+
+    def close(self):
+        """Libera el motor de OCR."""
+        with self._lock:
+            if self._engine is not None:
+                self._engine.close()
+                self._engine = None
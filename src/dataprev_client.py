@@ -1,36 +1,62 @@
 import os
 import logging
 import time
+from urllib.parse import urljoin
 from playwright.sync_api import sync_playwright
+from src.browser_profile import BrowserProfile
+from src.instrumentation import step, timed
+from src.retry import RetryPolicy
+from src.session_store import SessionStore
+from src.tracing import TraceRecorder, traced
 
 logger = logging.getLogger(__name__)
 
+# Elemento presente solo con la sesión iniciada
+LOGGED_IN_SELECTOR = ".dashboard-container"
+LOGIN_FORM_SELECTOR = 'input[name="username"]'
+
 
 class DataprevClient:
-    def __init__(self):
+    def __init__(self, browser_manager=None):
         self.url = os.getenv("DATAPREV_URL")
         self.user = os.getenv("DATAPREV_USER")
         self.password = os.getenv("DATAPREV_PASSWORD")
+        self.browser_manager = browser_manager
         self.playwright = None
         self.browser = None
         self.context = None
+        self.tracer = None
         self.page = None
+        self.profile = BrowserProfile.from_env(
+            default_viewport={"width": 1920, "height": 1080}
+        )
+        self.session_store = SessionStore("dataprev")
+        self.restored_session = False
+        self.retry_policy = RetryPolicy()
 
     def _setup_browser(self) -> None:
         """Configura el navegador con los parámetros correctos."""
         try:
-            self.playwright = sync_playwright().start()
-            self.browser = self.playwright.chromium.launch(
-                headless=False,
-                channel="chrome",  # Usar Chrome instalado en el sistema
-                args=[
-                    "--start-maximized",
-                    "--disable-blink-features=AutomationControlled",
-                    "--no-sandbox",
-                ],
-            )
+            if self.browser_manager:
+                # Navegador compartido: este cliente solo crea su propio contexto
+                self.browser = self.browser_manager.acquire()
+            else:
+                self.playwright = sync_playwright().start()
+                self.browser = self.playwright.chromium.launch(
+                    headless=self.profile.headless,
+                    channel="chrome",  # Usar Chrome instalado en el sistema
+                    args=(
+                        [] if self.profile.headless else ["--start-maximized"]
+                    ) + [
+                        "--disable-blink-features=AutomationControlled",
+                        "--no-sandbox",
+                    ],
+                )
+            storage_state = self.session_store.load()
+            self.restored_session = storage_state is not None
             self.context = self.browser.new_context(
-                viewport={"width": 1920, "height": 1080},
+                storage_state=storage_state,
+                viewport=self.profile.viewport,
                 user_agent=(
                     "Mozilla/5.0 "
                     "(Macintosh; Intel Mac OS X 10_15_7) "
@@ -40,63 +66,113 @@ class DataprevClient:
                     "Safari/537.36"
                 ),
             )
+            self.profile.apply(self.context)
+            self.tracer = TraceRecorder(self.context, "dataprev")
+            self.tracer.start()
             self.page = self.context.new_page()
 
-            # Configurar timeouts más largos
-            self.page.set_default_timeout(60000)  # 60 segundos
-            self.page.set_default_navigation_timeout(60000)  # 60 segundos
+            # Timeouts más largos para todas las páginas del contexto, también las del pool
+            self.context.set_default_timeout(60000)  # 60 segundos
+            self.context.set_default_navigation_timeout(60000)  # 60 segundos
 
         except Exception as e:
             logger.error(f"Error configurando el navegador: {str(e)}")
             self.cleanup()
             raise
 
+    @timed("dataprev.login")
     def login(self) -> None:
         """Inicia sesión en Dataprev."""
+        if not self.browser:
+            self._setup_browser()
+        self._authenticate()
+
+    @traced("dataprev.login")
+    def _authenticate(self) -> None:
+        """Restaura la sesión guardada o envía el formulario de login."""
         try:
-            if not self.browser:
-                self._setup_browser()
+            if self.restored_session and self._probe_session():
+                logger.info("Sesión guardada válida, se omite el login en Dataprev")
+                return
 
             # Navegar a la página inicial
             logger.info(f"Navegando a {self.url}")
-            self.page.goto(self.url, wait_until="networkidle")
+            self.page.goto(self.url, wait_until="domcontentloaded")
 
             # Esperar y llenar credenciales
             logger.info("Ingresando credenciales...")
-            username_input = self.page.wait_for_selector('input[name="username"]')
-            time.sleep(1.5)  # Pausa para simular comportamiento humano
+            username_input = self.page.wait_for_selector(LOGIN_FORM_SELECTOR)
             username_input.fill(self.user)
 
             password_input = self.page.wait_for_selector('input[name="password"]')
-            time.sleep(1)  # Pausa para simular comportamiento humano
             password_input.fill(self.password)
 
             # Click en el botón de login
             logger.info("Enviando formulario...")
-            time.sleep(1)  # Pausa para simular comportamiento humano
             login_button = self.page.wait_for_selector('button[type="submit"]')
             login_button.click()
-            self.page.wait_for_load_state("networkidle")
 
             # Verificar login exitoso
             logger.info("Verificando login exitoso...")
             # Ajustar este selector según la página de Dataprev
-            self.page.wait_for_selector('.dashboard-container')
+            self.page.wait_for_selector(LOGGED_IN_SELECTOR)
 
             if "login" in self.page.url:
                 raise Exception(
                     "Login fallido - Redirigido de vuelta a la página de login"
                 )
 
+            self.session_store.save(self.context.storage_state())
             logger.info("Login exitoso en Dataprev")
 
         except Exception as e:
             logger.error(f"Error en login de Dataprev: {str(e)}")
             raise
 
+    def _probe_session(self) -> bool:
+        """Comprueba con una sola navegación si la sesión restaurada sigue activa."""
+        self.restored_session = False
+        try:
+            self.page.goto(self.url, wait_until="domcontentloaded")
+            self.page.wait_for_selector(LOGGED_IN_SELECTOR, state="attached", timeout=5000)
+            return not self._is_login_page()
+        except Exception:
+            logger.info("La sesión guardada de Dataprev ya no es válida")
+            self.session_store.clear()
+            return False
+
+    def _is_login_page(self, page=None) -> bool:
+        """Indica si la página muestra el formulario de login."""
+        page = page or self.page
+        return "login" in page.url or page.query_selector(LOGIN_FORM_SELECTOR) is not None
+
+    def ensure_session(self) -> None:
+        """Vuelve a iniciar sesión si Dataprev redirigió al login."""
+        if self._is_login_page():
+            logger.info("Sesión de Dataprev expirada, reautenticando...")
+            self.session_store.clear()
+            self.login()
+
+    def recover(self) -> None:
+        """Devuelve el cliente a un estado conocido tras un fallo.
+
+        Si la página se cerró se abre de nuevo y se inicia sesión; si no, se
+        vuelve a la página inicial y se reautentica si la sesión caducó.
+        """
+        if self.page is None or self.page.is_closed():
+            self.cleanup()
+            self.login()
+            return
+        self.page.goto(self.url, wait_until="domcontentloaded")
+        self.ensure_session()
+
+    @timed("dataprev.check_benefit")
+    @traced("dataprev.check_benefit")
     def check_benefit(self, cpf: str, benefit_number: str) -> dict:
         """Consulta el estado de un beneficio específico."""
         try:
+            self.ensure_session()
+
             # Navegar a la página de consulta
             logger.info("Navegando a la página de consulta...")
             self.page.click('a[href="/consulta"]')
@@ -104,36 +180,149 @@ class DataprevClient:
 
             # Llenar formulario de consulta
             logger.info(f"Consultando beneficio {benefit_number} para CPF {cpf}")
-            
-            cpf_input = self.page.wait_for_selector('input[name="cpf"]')
-            time.sleep(1)
-            cpf_input.fill(cpf)
-
-            benefit_input = self.page.wait_for_selector('input[name="benefit_number"]')
-            time.sleep(1)
-            benefit_input.fill(benefit_number)
-
-            # Enviar consulta
-            submit_button = self.page.wait_for_selector('button[type="submit"]')
-            time.sleep(1)
-            submit_button.click()
+            self._submit_query(self.page, cpf, benefit_number)
             self.page.wait_for_load_state("networkidle")
 
-            # Extraer resultado
-            result = {
-                "cpf": cpf,
-                "benefit_number": benefit_number,
-                "status": self.page.text_content('.benefit-status'),
-                "details": self.page.text_content('.benefit-details'),
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-            }
-
-            return result
+            return self._read_result(self.page, cpf, benefit_number)
 
         except Exception as e:
             logger.error(f"Error consultando beneficio: {str(e)}")
             raise
 
+    @traced("dataprev.check_benefits")
+    def check_benefits(self, items, concurrency=None, retries=None) -> list:
+        """Consulta varios beneficios en paralelo con un pool de páginas.
+
+        ``items`` es una lista de pares (cpf, benefit_number). Las páginas del
+        pool comparten el contexto autenticado; en cada ronda se lanzan todas
+        las navegaciones y envíos antes de esperar ningún resultado, de modo
+        que la latencia de Dataprev se solapa. Una página que falla se
+        reemplaza por una nueva y su consulta se reintenta hasta ``retries``
+        veces (por defecto RETRY_ATTEMPTS - 1) sin detener el resto, con una
+        espera exponencial con jitter antes de cada ronda de reintentos. Los
+        resultados se devuelven en el mismo orden que ``items``. Todo el lote
+        se graba como un paso de la traza, que se vuelca si alguna consulta
+        falla.
+        """
+        concurrency = concurrency or int(os.getenv("DATAPREV_CONCURRENCY", "4"))
+        if retries is None:
+            retries = self.retry_policy.attempts - 1
+        self.ensure_session()
+        results = [None] * len(items)
+        attempts = [0] * len(items)
+        pending = list(range(len(items)))
+        pool = [self.context.new_page() for _ in range(min(concurrency, len(items)))]
+
+        backoff = 0
+        try:
+            while pending:
+                if backoff and any(attempts[index] for index in pending[:len(pool)]):
+                    # Ronda de reintentos: esperar antes de volver a consultar
+                    time.sleep(backoff)
+                    backoff = 0
+                wave = list(zip(pool, pending[:len(pool)]))
+                pending = pending[len(pool):]
+                errors = {}
+
+                # Fase 1: abrir el formulario en todas las páginas
+                with step("dataprev.wave.open_form"):
+                    for slot, (page, index) in enumerate(wave):
+                        try:
+                            page.goto(self.query_url, wait_until="commit")
+                        except Exception as e:
+                            errors[slot] = e
+
+                # Fase 2: llenar y enviar sin esperar la respuesta
+                with step("dataprev.wave.submit"):
+                    for slot, (page, index) in enumerate(wave):
+                        if slot in errors:
+                            continue
+                        cpf, benefit_number = items[index]
+                        try:
+                            self._submit_query(page, cpf, benefit_number, no_wait_after=True)
+                        except Exception as e:
+                            errors[slot] = e
+
+                # Fase 3: recoger los resultados
+                with step("dataprev.wave.wait_result"):
+                    for slot, (page, index) in enumerate(wave):
+                        if slot in errors:
+                            continue
+                        cpf, benefit_number = items[index]
+                        try:
+                            page.wait_for_selector('.benefit-status', state="attached")
+                            results[index] = self._read_result(page, cpf, benefit_number)
+                        except Exception as e:
+                            errors[slot] = e
+
+                if any(self._is_login_page(pool[slot]) for slot in errors):
+                    # La sesión caducó: se reautentica una vez y las consultas se reintentan
+                    logger.info("Sesión de Dataprev expirada durante el lote, reautenticando...")
+                    self.session_store.clear()
+                    self.login()
+
+                for slot, error in errors.items():
+                    index = wave[slot][1]
+                    cpf, benefit_number = items[index]
+                    attempts[index] += 1
+                    logger.error(
+                        f"Error consultando beneficio {benefit_number} "
+                        f"(intento {attempts[index]}): {str(error)}"
+                    )
+                    if self.tracer:
+                        # El error no se propaga: se marca para volcar la traza del lote
+                        self.tracer.fail("dataprev.check_benefits", error)
+                    pool[slot] = self._replace_page(pool[slot])
+                    if attempts[index] <= retries:
+                        pending.append(index)
+                        backoff = max(backoff, self.retry_policy.delay(attempts[index] - 1))
+                    else:
+                        results[index] = {
+                            "cpf": cpf,
+                            "benefit_number": benefit_number,
+                            "status": None,
+                            "details": None,
+                            "error": str(error),
+                            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        }
+        finally:
+            for page in pool:
+                if not page.is_closed():
+                    page.close()
+
+        return results
+
+    @property
+    def query_url(self):
+        """URL absoluta de la página de consulta."""
+        return urljoin(self.url, "/consulta")
+
+    def _replace_page(self, page):
+        """Cierra una página del pool que falló y abre una nueva en su lugar."""
+        try:
+            if not page.is_closed():
+                page.close()
+        except Exception as e:
+            logger.error(f"Error cerrando página del pool: {str(e)}")
+        return self.context.new_page()
+
+    def _submit_query(self, page, cpf, benefit_number, no_wait_after=False):
+        """Llena y envía el formulario de consulta en la página indicada."""
+        page.wait_for_selector('input[name="cpf"]').fill(cpf)
+        page.wait_for_selector('input[name="benefit_number"]').fill(benefit_number)
+        page.wait_for_selector('button[type="submit"]').click(no_wait_after=no_wait_after)
+
+    def _read_result(self, page, cpf, benefit_number):
+        """Extrae el resultado de la consulta de la página indicada."""
+        return {
+            "cpf": cpf,
+            "benefit_number": benefit_number,
+            "status": page.text_content('.benefit-status'),
+            "details": page.text_content('.benefit-details'),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    @timed("dataprev.logout")
     def logout(self):
         """Cierra la sesión y el navegador."""
         try:
@@ -141,25 +330,36 @@ class DataprevClient:
                 logout_button = self.page.wait_for_selector('a[href="/logout"]')
                 logout_button.click()
                 self.page.wait_for_load_state("networkidle")
-            self.cleanup()
         except Exception as e:
             logger.error(f"Error en logout de Dataprev: {str(e)}")
+        finally:
+            # Liberar el navegador aunque falle el cierre de sesión
+            self.cleanup()
 
     def cleanup(self) -> None:
         """Limpia los recursos de Playwright de manera segura."""
         try:
             if self.page and not self.page.is_closed():
                 self.page.close()
+            if self.tracer:
+                # Descarta los fragmentos retenidos antes de cerrar el contexto
+                self.tracer.stop()
             if self.context:
                 self.context.close()
-            if self.browser:
-                self.browser.close()
-            if self.playwright:
-                self.playwright.stop()
+            if self.browser_manager:
+                # El navegador solo se cierra cuando lo libera el último cliente
+                if self.browser:
+                    self.browser_manager.release()
+            else:
+                if self.browser:
+                    self.browser.close()
+                if self.playwright:
+                    self.playwright.stop()
         except Exception as e:
             logger.error(f"Error durante la limpieza: {str(e)}")
         finally:
             self.page = None
+            self.tracer = None
             self.context = None
             self.browser = None
             self.playwright = None
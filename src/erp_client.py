@@ -1,40 +1,321 @@
 import os
+import hashlib
 import logging
 import time
+from urllib.parse import urljoin
 from playwright.sync_api import sync_playwright
+from src.apex_report_client import ApexReportClient
+from src.readiness import ReadinessWaiter
+from src.browser_profile import BrowserProfile
+from src.instrumentation import step, timed
+from src.ledger import ProcessedLedger
+from src.session_store import SessionStore
+from src.tracing import TraceRecorder, traced
 
 logger = logging.getLogger(__name__)
 
+# Elemento presente solo con la sesión iniciada
+LOGGED_IN_SELECTOR = '//*[@id="224579043665482962"]/li[1]'
+LOGIN_FORM_SELECTOR = "#P101_USERNAME"
+
+# Identificador del informe de beneficiarios para la marca de agua incremental
+REPORT_ID = "36052098998664950"
+REPORT_TBODY_SELECTOR = f'//*[@id="{REPORT_ID}_orig"]/tbody'
+# tbody que todavía no se marcó como obsoleto antes de paginar
+FRESH_REPORT_TBODY_SELECTOR = (
+    f'//*[@id="{REPORT_ID}_orig"]/tbody[not(@data-auto-dataprev-stale)]'
+)
+
+# Controles de paginación de los informes clásicos e interactivos de APEX
+NEXT_PAGE_SELECTOR = ".t-Report-paginationLink--next, .a-IRR-button--next"
+ROWS_PER_PAGE_SELECTOR = f"select[id='{REPORT_ID}_row_select'], select.a-IRR-rowSelector"
+# Límite de seguridad para no recorrer una paginación rota indefinidamente
+MAX_REPORT_PAGES = 1000
+
+MARK_STALE_JS = "tbody => tbody.setAttribute('data-auto-dataprev-stale', '1')"
+
+# Estado del enlace "siguiente": si existe y, cuando es un enlace normal, su URL
+NEXT_PAGE_JS = """selector => {
+    const link = document.querySelector(selector);
+    if (!link || link.disabled || link.getAttribute("aria-disabled") === "true") {
+        return { exists: false, url: null };
+    }
+    const href = link.getAttribute("href") || "";
+    const isUrl = href !== "" && !href.startsWith("#")
+        && !href.toLowerCase().startsWith("javascript:");
+    return { exists: true, url: isUrl ? link.href : null };
+}"""
+
+# Devuelve la opción con más filas por página si no es la seleccionada
+MAX_ROWS_PER_PAGE_JS = """selector => {
+    const select = document.querySelector(selector);
+    if (!select) {
+        return null;
+    }
+    let best = null;
+    for (const option of select.options) {
+        const rows = option.value.toLowerCase() === "all"
+            ? Infinity : parseInt(option.value, 10);
+        if (!isNaN(rows) && (best === null || rows > best.rows)) {
+            best = { value: option.value, rows: rows };
+        }
+    }
+    return best && best.value !== select.value ? best.value : null;
+}"""
+
+# Expande el nodo Dataprev del menú de árbol de APEX
+EXPAND_DATAPREV_NODE_JS = """() => {
+    const node = document.getElementById('t_TreeNav_1');
+    if (node) {
+        const toggle = node.querySelector('.a-TreeView-toggle');
+        if (toggle) {
+            toggle.click();
+            return true;
+        }
+    }
+    return false;
+}"""
+
+# Lee las columnas 1 (botón de diálogo), 5 (CPF) y 9 (fecha) de una fila como
+# registro compacto [dialog_id, cpf, fecha, url del diálogo]
+_ROW_RECORD_JS = """row => {
+    const cell = index => row.cells[index - 1];
+    const button = cell(1) ? cell(1).querySelector("button") : null;
+    let dialogUrl = null;
+    if (button) {
+        const source = [
+            button.getAttribute("data-url"),
+            button.getAttribute("onclick"),
+            button.getAttribute("href"),
+        ].join(" ");
+        const match = source.match(/f\\?p=[^'"\\s]+/);
+        dialogUrl = match ? match[0] : null;
+    }
+    return [
+        button ? button.id : null,
+        cell(5) ? cell(5).innerText.trim() : null,
+        cell(9) ? cell(9).innerText.trim() : null,
+        dialogUrl,
+    ];
+}"""
+
+# Extrae todas las filas de la tabla en una única evaluación
+EXTRACT_ROWS_JS = "tbody => Array.from(tbody.rows, %s)" % _ROW_RECORD_JS
+
+# Calcula un hash por fila y un checksum de la tabla; si el checksum coincide
+# con la marca anterior no devuelve filas, y si no solo devuelve las filas
+# cuyo hash no se conocía, con el hash como quinto elemento del registro
+EXTRACT_CHANGED_ROWS_JS = """(tbody, watermark) => {
+    const toRecord = %s;
+    const hash = text => {
+        let h = 0x811c9dc5;
+        for (let i = 0; i < text.length; i++) {
+            h ^= text.charCodeAt(i);
+            h = Math.imul(h, 0x01000193);
+        }
+        return (h >>> 0).toString(16).padStart(8, "0");
+    };
+    const rows = Array.from(tbody.rows);
+    const hashes = rows.map(row => hash(row.textContent));
+    const checksum = hash(hashes.join(""));
+    if (checksum === watermark.checksum && rows.length === watermark.row_count) {
+        return { row_count: rows.length, checksum: checksum, unchanged: true };
+    }
+    const known = new Set(watermark.hashes);
+    const changed = [];
+    rows.forEach((row, index) => {
+        if (!known.has(hashes[index])) {
+            changed.push(toRecord(row).concat([hashes[index]]));
+        }
+    });
+    return {
+        row_count: rows.length,
+        checksum: checksum,
+        unchanged: false,
+        hashes: hashes,
+        rows: changed,
+    };
+}""" % _ROW_RECORD_JS
+
+
+def filter_table_rows(rows, ledger, page_url):
+    """Convierte las filas del día pendientes en el registro en beneficiarios.
+
+    La fecha se filtra en Python y el registro se consulta una sola vez para
+    todas las filas restantes.
+    """
+    today = time.strftime("%d/%m/%Y")
+    rows = [row for row in rows if row[0] and row[1] and row[2] == today]
+    pending = ledger.pending(cpf for _, cpf, _, _ in rows)
+    beneficiaries = []
+    for dialog_id, cpf, _, dialog_url in rows:
+        if cpf not in pending:
+            continue
+        beneficiary = {"cpf": cpf, "dialog_id": dialog_id}
+        if pending[cpf]:
+            # Número resuelto en una ejecución anterior que no llegó a Dataprev
+            beneficiary["benefit_number"] = pending[cpf]
+        if dialog_url:
+            beneficiary["dialog_url"] = urljoin(page_url, dialog_url.replace("\\u0026", "&"))
+        beneficiaries.append(beneficiary)
+    return beneficiaries
+
+
+def incremental_watermark(result, watermark, changed):
+    """Marca de agua resultante de una extracción incremental (todavía sin guardar).
+
+    ``result`` es el resultado de ``EXTRACT_CHANGED_ROWS_JS`` (o de
+    ``merge_report_pages``) y ``changed`` relaciona el hash de cada fila
+    nueva o modificada con su CPF.
+    """
+    if result["unchanged"]:
+        logger.info("El informe no cambió desde la última consulta, se omite la extracción")
+        return watermark
+    row_hashes = {
+        row_hash: watermark["row_hashes"].get(row_hash) for row_hash in result["hashes"]
+    }
+    row_hashes.update(changed)
+    logger.info(f"{len(changed)} filas nuevas o modificadas de {result['row_count']}")
+    return {
+        "row_count": result["row_count"],
+        "checksum": result["checksum"],
+        "row_hashes": row_hashes,
+    }
+
+
+def unfinished_beneficiaries(ledger, seen=()):
+    """Beneficiarios con número resuelto que todavía no pasaron por Dataprev."""
+    return [
+        {"cpf": cpf, "dialog_id": None, "benefit_number": benefit_number}
+        for cpf, benefit_number in ledger.unfinished().items()
+        if cpf not in seen
+    ]
+
+
+def merge_report_pages(results, watermark):
+    """Combina los resultados de ``EXTRACT_CHANGED_ROWS_JS`` de varias páginas.
+
+    Con una sola página el resultado se usa tal cual. Con varias, el checksum
+    del informe se compone con los de cada página, de modo que nunca coincide
+    con el de una página suelta.
+    """
+    if len(results) == 1:
+        return results[0]
+    hashes = []
+    rows = []
+    checksums = []
+    for result in results:
+        if result["unchanged"]:
+            # La página coincide con un informe anterior de una sola página
+            hashes.extend(watermark["row_hashes"])
+        else:
+            hashes.extend(result["hashes"])
+            rows.extend(result["rows"])
+        checksums.append(result["checksum"])
+    row_count = sum(result["row_count"] for result in results)
+    checksum = "p:" + hashlib.sha1("".join(checksums).encode("utf-8")).hexdigest()
+    unchanged = checksum == watermark["checksum"] and row_count == watermark["row_count"]
+    return {
+        "row_count": row_count,
+        "checksum": checksum,
+        "unchanged": unchanged,
+        "hashes": hashes,
+        "rows": [] if unchanged else rows,
+    }
+
+
+def exclude_from_watermark(watermark, cpfs):
+    """Quita de la marca de agua las filas de los CPF indicados.
+
+    Así esas filas vuelven a considerarse nuevas en la siguiente consulta.
+    """
+    cpfs = set(cpfs)
+    if not cpfs:
+        return watermark
+    return {
+        "row_count": watermark["row_count"],
+        # Sin checksum la siguiente consulta no puede darse por "sin cambios"
+        "checksum": None,
+        "row_hashes": {
+            row_hash: cpf for row_hash, cpf in watermark["row_hashes"].items() if cpf not in cpfs
+        },
+    }
+
+
+def filter_report_records(records, ledger):
+    """Convierte los registros del informe HTTP del día pendientes en beneficiarios."""
+    today = time.strftime("%d/%m/%Y")
+    records = [record for record in records if record["cpf"] and record["date"] == today]
+    pending = ledger.pending(record["cpf"] for record in records)
+    beneficiaries = []
+    for record in records:
+        if record["cpf"] not in pending:
+            continue
+        benefit_number = record["benefit_number"] or pending[record["cpf"]]
+        if not benefit_number:
+            raise Exception(
+                f"El informe no trae el número de beneficio del CPF {record['cpf']}"
+            )
+        beneficiaries.append(
+            {"cpf": record["cpf"], "dialog_id": None, "benefit_number": benefit_number}
+        )
+    return beneficiaries
+
 
 class ERPClient:
-    def __init__(self):
+    def __init__(self, browser_manager=None, ledger=None):
         self.url = os.getenv("ERP_URL")
         self.user = os.getenv("ERP_USER")
         self.password = os.getenv("ERP_PASSWORD")
+        self.browser_manager = browser_manager
         self.playwright = None
         self.browser = None
         self.context = None
+        self.tracer = None
         self.page = None
-        self.processed_cpfs = set()
-        self.headless = False  # Agregar propiedad headless
+        self.waiter = None
+        # Registro persistente de CPF procesados (SQLite)
+        self.ledger = ledger or ProcessedLedger()
+        self.profile = BrowserProfile.from_env(
+            default_viewport={"width": 1366, "height": 768}
+        )
+        self.headless = self.profile.headless
+        # Descarga directa del informe por HTTP; la interfaz queda como respaldo
+        self.use_http_report = os.getenv("ERP_HTTP_REPORT", "false").lower() == "true"
+        # Extracción incremental: solo filas nuevas o modificadas desde la última consulta
+        self.incremental = os.getenv("ERP_INCREMENTAL", "false").lower() == "true"
+        self._pending_watermark = None
+        # Hay un informe recorriéndose en la página principal
+        self._report_open = False
+        # Controles de paginación del informe (configurables por si cambia la plantilla)
+        self.next_page_selector = os.getenv("ERP_REPORT_NEXT_SELECTOR", NEXT_PAGE_SELECTOR)
+        self.rows_per_page_selector = os.getenv(
+            "ERP_REPORT_ROWS_PER_PAGE_SELECTOR", ROWS_PER_PAGE_SELECTOR
+        )
+        self.session_store = SessionStore("erp")
+        self.restored_session = False
 
     def _setup_browser(self) -> None:
         """Configura el navegador con los parámetros correctos."""
         try:
-            self.playwright = sync_playwright().start()
-            self.browser = self.playwright.chromium.launch(
-                headless=self.headless,
-                channel="chrome",  # Usar Chrome instalado en el sistema
-                args=[
-                    "--disable-blink-features=AutomationControlled",
-                    "--no-sandbox",
-                ],
-            )
+            if self.browser_manager:
+                # Navegador compartido: este cliente solo crea su propio contexto
+                self.browser = self.browser_manager.acquire()
+            else:
+                self.playwright = sync_playwright().start()
+                self.browser = self.playwright.chromium.launch(
+                    headless=self.headless,
+                    channel="chrome",  # Usar Chrome instalado en el sistema
+                    args=[
+                        "--disable-blink-features=AutomationControlled",
+                        "--no-sandbox",
+                    ],
+                )
+            storage_state = self.session_store.load()
+            self.restored_session = storage_state is not None
             self.context = self.browser.new_context(
-                viewport={
-                    "width": 1366,
-                    "height": 768,
-                },  # Resolución estándar de laptop
+                storage_state=storage_state,
+                viewport=self.profile.viewport,
                 user_agent=(
                     "Mozilla/5.0 "
                     "(Windows NT 10.0; Win64; x64) "
@@ -44,22 +325,35 @@ class ERPClient:
                     "Safari/537.36"
                 ),
             )
+            self.profile.apply(self.context)
+            self.tracer = TraceRecorder(self.context, "erp")
+            self.tracer.start()
             self.page = self.context.new_page()
 
-            # Configurar timeouts más largos
-            self.page.set_default_timeout(60000)  # 60 segundos
-            self.page.set_default_navigation_timeout(60000)  # 60 segundos
+            # Timeouts más largos para todas las páginas del contexto, también las del pool
+            self.context.set_default_timeout(60000)  # 60 segundos
+            self.context.set_default_navigation_timeout(60000)  # 60 segundos
+            self.waiter = ReadinessWaiter(self.page)
 
         except Exception as e:
             logger.error(f"Error configurando el navegador: {str(e)}")
             self.cleanup()
             raise
 
+    @timed("erp.login")
     def login(self) -> None:
         """Inicia sesión en el ERP."""
+        if not self.browser:
+            self._setup_browser()
+        self._authenticate()
+
+    @traced("erp.login")
+    def _authenticate(self) -> None:
+        """Restaura la sesión guardada o envía el formulario de login."""
         try:
-            if not self.browser:
-                self._setup_browser()
+            if self.restored_session and self._probe_session():
+                logger.info("Sesión guardada válida, se omite el login en ERP")
+                return
 
             # Navegar a la página inicial
             logger.info(f"Navegando a {self.url}")
@@ -84,213 +378,417 @@ class ERPClient:
 
             # Verificar login exitoso
             logger.info("Verificando login exitoso...")
-            self.page.wait_for_selector('//*[@id="224579043665482962"]/li[1]')
+            self.page.wait_for_selector(LOGGED_IN_SELECTOR)
 
             if "login" in self.page.url:
                 raise Exception(
                     "Login fallido - Redirigido de vuelta a la página de login"
                 )
 
+            self.session_store.save(self.context.storage_state())
             logger.info("Login exitoso en ERP")
 
         except Exception as e:
             logger.error(f"Error en login de ERP: {str(e)}")
             raise
 
-    def get_beneficiaries(self):
-        """Obtiene la lista de beneficiarios del día."""
+    def _probe_session(self) -> bool:
+        """Comprueba con una sola navegación si la sesión restaurada sigue activa."""
+        self.restored_session = False
         try:
-            # Navegar al menú de beneficiarios
-            logger.info("Navegando al menú de beneficiarios...")
-
-            self.page.click('//*[@id="t_MenuNav_0"]')
-            logger.info("1")
-            time.sleep(5)
-            logger.info("2")
-
-            # Esperar que todos los estados de carga se completen
-            logger.info("Esperando carga completa de la página...")
-            self.page.wait_for_load_state("networkidle", timeout=30000)
-            self.page.wait_for_load_state("domcontentloaded", timeout=30000)
-            self.page.wait_for_load_state("load", timeout=30000)
-
-            # Esperar que no haya solicitudes de red pendientes
-            time.sleep(2)
-            self.page.wait_for_load_state("networkidle", timeout=30000)
-
-            # Verificar que el DOM esté estable
-            self.page.evaluate(
-                """() => {
-                return new Promise((resolve) => {
-                    const observer = new MutationObserver((mutations, obs) => {
-                        obs.disconnect();
-                        resolve(true);
-                    });
-
-                    observer.observe(document.body, {
-                        childList: true,
-                        subtree: true,
-                        attributes: true,
-                        characterData: true
-                    });
-
-                    // Si no hay cambios en 5 segundos, consideramos que el DOM está estable
-                    setTimeout(() => {
-                        observer.disconnect();
-                        resolve(true);
-                    }, 5000);
-                });
-            }"""
-            )
-
-            logger.info("2.1")
-
-            logger.info("Haciendo click en el botón de navegación...")
+            self.page.goto(self.url, wait_until="domcontentloaded")
+            self.page.wait_for_selector(LOGGED_IN_SELECTOR, state="attached", timeout=5000)
+            return not self._is_login_page()
+        except Exception:
+            logger.info("La sesión guardada de ERP ya no es válida")
+            self.session_store.clear()
+            return False
+
+    def _is_login_page(self, page=None) -> bool:
+        """Indica si la página muestra el formulario de login."""
+        page = page or self.page
+        return "login" in page.url or page.query_selector(LOGIN_FORM_SELECTOR) is not None
+
+    def ensure_session(self) -> None:
+        """Vuelve a iniciar sesión si el ERP redirigió al login."""
+        if self._is_login_page():
+            logger.info("Sesión de ERP expirada, reautenticando...")
+            self.session_store.clear()
+            self.login()
+
+    def recover(self) -> None:
+        """Devuelve el cliente a un estado conocido tras un fallo.
+
+        Si la página se cerró se abre de nuevo y se inicia sesión. Mientras se
+        recorre el informe la página principal no se mueve, porque su tabla
+        sigue en uso: la sesión se comprueba en otra pestaña. Si no, se
+        vuelve a la página inicial y se reautentica si la sesión caducó.
+        """
+        if self.page is None or self.page.is_closed():
+            self.cleanup()
+            self.login()
+            return
+        if self._report_open:
+            self._check_session_in_new_page()
+            return
+        self.page.goto(self.url, wait_until="domcontentloaded")
+        self.ensure_session()
+
+    def _check_session_in_new_page(self) -> None:
+        """Comprueba la sesión en una pestaña aparte y reautentica si caducó."""
+        page = self.context.new_page()
+        try:
+            page.goto(self.url, wait_until="domcontentloaded")
+            expired = self._is_login_page(page)
+        finally:
+            page.close()
+        if expired:
+            # Sin sesión el informe abierto tampoco puede seguir leyéndose
+            logger.info("Sesión de ERP expirada durante el informe, reautenticando...")
+            self.session_store.clear()
+            self.login()
 
-            # Esperar a que el botón esté presente en el DOM
-            button = self.page.locator('#t_Button_navControl')
-            
+    def get_beneficiaries(self):
+        """Obtiene la lista completa de beneficiarios del día."""
+        beneficiaries = list(self.iter_beneficiaries())
+        logger.info(f"Encontrados {len(beneficiaries)} beneficiarios nuevos para hoy")
+        return beneficiaries
+
+    def iter_beneficiaries(self):
+        """Abre el informe y devuelve un iterador con los beneficiarios del día.
+
+        La navegación hasta la tabla ocurre en esta llamada, de modo que puede
+        reintentarse. Las páginas se leen a medida que se consume el iterador:
+        nunca hay más de una página en memoria y un consumidor lento frena la
+        extracción. En modo incremental la marca de agua solo queda pendiente
+        si el iterador se consume entero.
+        """
+        self.ensure_session()
+        if self.use_http_report:
             try:
-                # Esperar a que el botón esté adjunto al DOM
-                button.wait_for(state="attached", timeout=5000)
-                logger.info("Botón encontrado en el DOM")
-                
-                # Click directo
-                button.click(force=True, timeout=5000)
-                logger.info("Click realizado")
-                
-                # Esperar a que el botón cambie de estado
-                self.page.wait_for_selector('#t_Button_navControl[aria-expanded="true"]', timeout=5000)
-                logger.info("Botón expandido correctamente")
-                
+                return iter(self._get_beneficiaries_http())
             except Exception as e:
-                logger.error(f"Error al interactuar con el botón: {str(e)}")
-                self.page.screenshot(path="debug_nav_button_error.png")
-                raise Exception("No se pudo activar el botón de navegación")
-
-            # Ahora esperar a que el TreeView esté visible
-            logger.info("Esperando que aparezca el TreeView...")
-            try:
-                self.page.wait_for_selector(
-                    'div.a-TreeView#t_TreeNav[aria-hidden="false"]',
-                    state="visible",
-                    timeout=5000,
+                logger.warning(
+                    f"No se pudo obtener el informe por HTTP, usando la interfaz: {str(e)}"
                 )
-                logger.info("TreeView encontrado y visible")
-            except Exception as e:
-                logger.error(f"TreeView no apareció o no está visible: {str(e)}")
-                self.page.screenshot(path="debug_treeview.png")
-                raise Exception("TreeView no apareció después del click")
-
-            # Esperar un momento para que el DOM se estabilice
-            time.sleep(2)
-
-            # Click en el nodo Dataprev usando JavaScript
-            logger.info("Haciendo click en el nodo Dataprev...")
-            dataprev_clicked = self.page.evaluate(
-                """() => {
-                const node = document.getElementById('t_TreeNav_1');
-                if (node) {
-                    const toggle = node.querySelector('.a-TreeView-toggle');
-                    if (toggle) {
-                        toggle.click();
-                        return true;
-                    }
-                }
-                return false;
-            }"""
-            )
 
-            if not dataprev_clicked:
-                logger.error("No se pudo hacer click en el nodo Dataprev")
-                self.page.screenshot(path="debug_dataprev.png")
-                raise Exception("No se pudo expandir el nodo Dataprev")
-
-            # Esperar a que el menú se expanda
-            time.sleep(2)
-
-            data_prev_button = self.page.wait_for_selector('//*[@id="t_TreeNav_1"]')
-            logger.info("6")
-            if not data_prev_button:
-                # self.page.click('//*[@id="t_Button_navControl"]')
-                time.sleep(1)
-                data_prev_button = self.page.wait_for_selector('//*[@id="t_TreeNav_1"]')
-            logger.info("7")
-            data_prev_button.click()
-            self.page.wait_for_load_state("networkidle")
-            logger.info("8")
-            time.sleep(5)
-            # Pausa para simular comportamiento humano
-            self.page.click('//*[@id="t_TreeNav_1"]')
-            logger.info("4")
-            time.sleep(1)
-            self.page.click('//*[@id="t_TreeNav_2"]')
-            self.page.wait_for_load_state("networkidle")
+        try:
+            self.waiter.reset()
+
+            self._open_report_menu()
 
             # Esperar a que la tabla cargue
             logger.info("Esperando que la tabla cargue...")
-            table = self.page.wait_for_selector(
-                '//*[@id="36052098998664950_orig"]/tbody'
+            with step("erp.table_load"):
+                table = self.waiter.selector(
+                    "tabla de beneficiarios",
+                    REPORT_TBODY_SELECTOR,
+                    state="attached",
+                    timeout=30000,
+                )
+                self.waiter.apex_idle("carga de la tabla")
+            logger.info(
+                f"Tiempo total en esperas de carga: {self.waiter.total_seconds():.2f}s"
             )
+        except Exception as e:
+            logger.error(f"Error obteniendo beneficiarios: {str(e)}")
+            raise
 
-            # Obtener todas las filas
-            rows = table.query_selector_all("tr")
-            beneficiaries = []
-            today = time.strftime("%d/%m/%Y")
+        if self.incremental:
+            return self._stream_incremental(table)
+        return self._stream_beneficiaries(table)
 
+    def _stream_beneficiaries(self, table):
+        """Produce los beneficiarios pendientes de cada página del informe."""
+        for page, rows in self._iter_report_pages(table, self._extract_rows):
             logger.info(f"Procesando {len(rows)} filas de la tabla...")
-            for row in rows:
-                date_cell = row.query_selector("td:nth-child(9)")
-                if not date_cell:
-                    continue
-
-                date_text = date_cell.inner_text().strip()
+            yield from self._resolve_modal_rows(page, self._filter_rows(rows))
+
+    def _resolve_modal_rows(self, page, beneficiaries):
+        """Lee en su página del informe el número de los beneficiarios sin URL de diálogo.
+
+        El botón del diálogo modal solo existe mientras esa página del informe
+        está cargada, así que cada uno se resuelve antes de pasar a la
+        siguiente página. Si la lectura falla, el error queda en ``error`` y
+        el lote cuenta al beneficiario como fallido.
+        """
+        for beneficiary in beneficiaries:
+            if not (beneficiary.get("benefit_number") or beneficiary.get("dialog_url")):
+                try:
+                    details = self.process_beneficiary_details(beneficiary, page=page)
+                    beneficiary["benefit_number"] = details["benefit_number"]
+                except Exception as e:
+                    beneficiary["error"] = str(e)
+            yield beneficiary
+
+    @timed("erp.menu_navigation")
+    @traced("erp.menu_navigation")
+    def _open_report_menu(self):
+        """Abre el informe de beneficiarios desde el menú lateral de APEX."""
+        # Navegar al menú de beneficiarios
+        logger.info("Navegando al menú de beneficiarios...")
+
+        self.page.click('//*[@id="t_MenuNav_0"]')
+        self.waiter.apex_idle("carga del menú")
+
+        logger.info("Haciendo click en el botón de navegación...")
+
+        # Esperar a que el botón esté presente en el DOM
+        button = self.page.locator('#t_Button_navControl')
 
-                if date_text == today:
-                    cpf_cell = row.query_selector("td:nth-child(5)")
-                    if not cpf_cell:
-                        continue
-
-                    cpf = cpf_cell.inner_text().strip()
-
-                    if cpf not in self.processed_cpfs:
-                        dialog_button = row.query_selector("td:nth-child(1) button")
-                        if not dialog_button:
-                            continue
+        try:
+            # Esperar a que el botón esté adjunto al DOM
+            self.waiter.selector(
+                "botón de navegación", "#t_Button_navControl", state="attached"
+            )
+            logger.debug("Botón encontrado en el DOM")
+
+            # Click directo
+            button.click(force=True, timeout=5000)
+            logger.debug("Click realizado")
+
+            # Esperar a que el botón cambie de estado
+            self.waiter.attribute(
+                "botón expandido",
+                "#t_Button_navControl",
+                "aria-expanded",
+                "true",
+                timeout=5000,
+            )
+            logger.debug("Botón expandido correctamente")
 
-                        dialog_id = dialog_button.get_attribute("id")
-                        beneficiaries.append({"cpf": cpf, "dialog_id": dialog_id})
+        except Exception as e:
+            logger.error(f"Error al interactuar con el botón: {str(e)}")
+            raise Exception("No se pudo activar el botón de navegación")
 
-            logger.info(
-                f"Encontrados {len(beneficiaries)} beneficiarios nuevos para hoy"
+        # Ahora esperar a que el TreeView esté visible
+        logger.info("Esperando que aparezca el TreeView...")
+        try:
+            self.waiter.selector(
+                "TreeView visible",
+                'div.a-TreeView#t_TreeNav[aria-hidden="false"]',
+                timeout=5000,
             )
-            return beneficiaries
-
+            logger.debug("TreeView encontrado y visible")
         except Exception as e:
-            logger.error(f"Error obteniendo beneficiarios: {str(e)}")
-            raise
+            logger.error(f"TreeView no apareció o no está visible: {str(e)}")
+            raise Exception("TreeView no apareció después del click")
 
-    def process_beneficiary_details(self, beneficiary):
-        """Procesa los detalles de un beneficiario específico."""
+        # Click en el nodo Dataprev usando JavaScript
+        logger.info("Haciendo click en el nodo Dataprev...")
+        dataprev_clicked = self.page.evaluate(EXPAND_DATAPREV_NODE_JS)
+
+        if not dataprev_clicked:
+            logger.error("No se pudo hacer click en el nodo Dataprev")
+            raise Exception("No se pudo expandir el nodo Dataprev")
+
+        # Esperar a que el nodo hijo aparezca al expandirse el menú
+        try:
+            self.waiter.selector("nodo de beneficiarios", "#t_TreeNav_2", timeout=5000)
+        except Exception:
+            logger.info("El nodo Dataprev no se expandió, reintentando con click...")
+            self.page.click('//*[@id="t_TreeNav_1"]')
+            self.waiter.selector("nodo de beneficiarios", "#t_TreeNav_2")
+
+        self.page.click('//*[@id="t_TreeNav_2"]')
+
+    @timed("erp.http_report")
+    def _get_beneficiaries_http(self):
+        """Obtiene los beneficiarios del día desde el endpoint CSV de APEX."""
+        logger.info("Descargando informe de beneficiarios por HTTP...")
+        report = ApexReportClient.from_page(self.page)
+        beneficiaries = filter_report_records(report.fetch_records(), self.ledger)
+        logger.info(f"Encontrados {len(beneficiaries)} beneficiarios nuevos para hoy")
+        return beneficiaries
+
+    @timed("erp.row_extraction")
+    def _extract_rows(self, table):
+        """Devuelve las filas como registros [dialog_id, cpf, fecha, url del diálogo]."""
+        return table.evaluate(EXTRACT_ROWS_JS)
+
+    def _stream_incremental(self, table):
+        """Produce solo las filas nuevas o modificadas respecto a la marca de agua.
+
+        Al terminar el informe deja pendiente la nueva marca de agua y añade
+        los beneficiarios que quedaron a medias en ciclos anteriores.
+        """
+        watermark = self.ledger.get_watermark(REPORT_ID)
+        self._pending_watermark = None
+        results = []
+        changed = {}
+        seen = set()
+        pages = self._iter_report_pages(
+            table, lambda tbody: self._extract_changed_rows(tbody, watermark)
+        )
+        for page, result in pages:
+            rows = result.get("rows", [])
+            changed.update((row[4], row[1]) for row in rows)
+            # Solo los hashes se conservan hasta el final del informe
+            results.append({**result, "rows": []})
+            beneficiaries = self._filter_rows([row[:4] for row in rows])
+            seen.update(beneficiary["cpf"] for beneficiary in beneficiaries)
+            yield from self._resolve_modal_rows(page, beneficiaries)
+
+        self._pending_watermark = incremental_watermark(
+            merge_report_pages(results, watermark), watermark, changed
+        )
+        yield from unfinished_beneficiaries(self.ledger, seen)
+
+    @timed("erp.row_extraction")
+    def _extract_changed_rows(self, table, watermark):
+        """Evalúa ``EXTRACT_CHANGED_ROWS_JS`` sobre una página del informe."""
+        return table.evaluate(
+            EXTRACT_CHANGED_ROWS_JS,
+            {
+                "row_count": watermark["row_count"],
+                "checksum": watermark["checksum"],
+                "hashes": list(watermark["row_hashes"]),
+            },
+        )
+
+    def _iter_report_pages(self, table, extract):
+        """Recorre todas las páginas del informe y devuelve (página, ``extract(tbody)``).
+
+        Primero sube las filas por página al máximo que ofrece el informe; si
+        aun así hay varias páginas, sigue el control "siguiente". Cuando ese
+        control es un enlace normal, la página siguiente empieza a cargarse en
+        otra pestaña mientras se extrae la actual.
+        """
+        page = self.page
+        prefetch = None
+        self._report_open = True
+        try:
+            table = self._maximize_rows_per_page(table)
+            for number in range(1, MAX_REPORT_PAGES + 1):
+                link = page.evaluate(NEXT_PAGE_JS, self.next_page_selector)
+                if link["url"]:
+                    prefetch = self.context.new_page()
+                    prefetch.goto(link["url"], wait_until="commit")
+
+                yield page, extract(table)
+
+                if prefetch is not None:
+                    if page is not self.page:
+                        page.close()
+                    page, prefetch = prefetch, None
+                    with step("erp.report_page"):
+                        table = ReadinessWaiter(page).selector(
+                            f"página {number + 1} del informe",
+                            REPORT_TBODY_SELECTOR,
+                            state="attached",
+                            timeout=30000,
+                        )
+                elif link["exists"]:
+                    table = self._refresh_report(
+                        page,
+                        table,
+                        lambda: page.click(self.next_page_selector),
+                        f"página {number + 1} del informe",
+                    )
+                else:
+                    if number > 1:
+                        logger.info(f"Informe recorrido en {number} páginas")
+                    return
+            logger.warning(f"Se alcanzó el límite de {MAX_REPORT_PAGES} páginas del informe")
+        finally:
+            self._report_open = False
+            for extra in (page, prefetch):
+                if extra is not None and extra is not self.page and not extra.is_closed():
+                    extra.close()
+
+    def _maximize_rows_per_page(self, table):
+        """Selecciona la opción con más filas por página, si el informe la ofrece."""
+        value = self.page.evaluate(MAX_ROWS_PER_PAGE_JS, self.rows_per_page_selector)
+        if not value:
+            return table
+        logger.info(f"Mostrando {value} filas por página en el informe")
+        return self._refresh_report(
+            self.page,
+            table,
+            lambda: self.page.select_option(self.rows_per_page_selector, value),
+            "filas por página",
+        )
+
+    @timed("erp.report_page")
+    @traced("erp.report_page")
+    def _refresh_report(self, page, table, action, name):
+        """Ejecuta ``action`` sobre el informe y espera a que se renderice de nuevo.
+
+        El ``tbody`` actual se marca antes de la acción y la espera termina
+        cuando aparece uno sin marcar, tanto si APEX refresca la región por
+        AJAX como si navega a otra página.
+        """
+        waiter = self.waiter if page is self.page else ReadinessWaiter(page)
+        table.evaluate(MARK_STALE_JS)
+        action()
+        table = waiter.selector(name, FRESH_REPORT_TBODY_SELECTOR, state="attached", timeout=30000)
+        waiter.apex_idle(name)
+        return table
+
+    def commit_watermark(self, exclude_cpfs=()):
+        """Guarda la marca de agua de la última extracción incremental.
+
+        Se llama cuando el lote terminó; los CPF de ``exclude_cpfs`` (fallidos
+        o aplazados) se vuelven a extraer en la siguiente consulta.
+        """
+        if self._pending_watermark is None:
+            return
+        self.ledger.save_watermark(
+            REPORT_ID, exclude_from_watermark(self._pending_watermark, exclude_cpfs)
+        )
+        self._pending_watermark = None
+
+    def _filter_rows(self, rows):
+        """Filtra las filas del día que todavía no fueron procesadas."""
+        return filter_table_rows(rows, self.ledger, self.page.url)
+
+    @timed("erp.dialog_read")
+    @traced("erp.dialog_read")
+    def process_beneficiary_details(self, beneficiary, page=None):
+        """Procesa los detalles de un beneficiario específico.
+
+        Con URL de diálogo la página del diálogo se carga en una pestaña
+        propia; si no, se abre el diálogo modal en ``page``, la página del
+        informe donde está su botón (por defecto la principal).
+        """
         try:
             logger.info(f"Procesando detalles para CPF: {beneficiary['cpf']}")
 
-            # Click en el botón de diálogo
-            self.page.click(f'#{beneficiary["dialog_id"]}')
-            self.page.wait_for_selector(".modal-dialog")
-            time.sleep(1)  # Esperar a que el diálogo se abra completamente
-
-            # Obtener el número de beneficio
-            benefit_number = self.page.inner_text(
-                '//*[@id="P73_NUMERO_BENEFICIO_DISPLAY"]'
-            ).strip()
+            if beneficiary.get("benefit_number"):
+                # El número ya vino en el informe descargado por HTTP
+                return {
+                    "cpf": beneficiary["cpf"],
+                    "benefit_number": beneficiary["benefit_number"],
+                }
 
-            # Cerrar el diálogo
-            self.page.click(".modal-dialog .close")
-            time.sleep(0.5)  # Esperar a que el diálogo se cierre
+            if beneficiary.get("dialog_url"):
+                results, expired = self._read_dialog_pages([beneficiary])
+                if beneficiary["cpf"] not in results:
+                    raise Exception(
+                        "Sesión de ERP expirada al abrir el diálogo"
+                        if expired
+                        else "No se pudo leer el número de beneficio del diálogo"
+                    )
+                benefit_number = results[beneficiary["cpf"]]
+            else:
+                page = page or self.page
+                waiter = self.waiter if page is self.page else ReadinessWaiter(page)
+
+                # Click en el botón de diálogo
+                page.click(f'#{beneficiary["dialog_id"]}')
+                waiter.selector("diálogo abierto", ".modal-dialog")
+
+                # Obtener el número de beneficio en cuanto el campo se renderiza
+                benefit_number = waiter.selector(
+                    "número de beneficio", '//*[@id="P73_NUMERO_BENEFICIO_DISPLAY"]'
+                ).inner_text().strip()
+
+                # Cerrar el diálogo
+                page.click(".modal-dialog .close")
+                waiter.selector("diálogo cerrado", ".modal-dialog", state="hidden")
 
             # Marcar el CPF como procesado
-            self.processed_cpfs.add(beneficiary["cpf"])
+            self.ledger.record_benefits({beneficiary["cpf"]: benefit_number})
 
             logger.info(f"Beneficio encontrado: {benefit_number}")
             return {"cpf": beneficiary["cpf"], "benefit_number": benefit_number}
@@ -299,33 +797,138 @@ class ERPClient:
             logger.error(f"Error procesando detalles del beneficiario: {str(e)}")
             raise
 
+    def get_benefit_numbers(self, beneficiaries, concurrency=None):
+        """Resuelve los números de beneficio de una lista completa de beneficiarios.
+
+        Los números que ya vienen en el informe se usan directamente; los
+        diálogos con URL conocida se cargan en páginas ocultas del mismo
+        contexto en paralelo, y solo el resto pasa por el diálogo modal.
+        Devuelve un diccionario CPF -> número de beneficio; los CPF que no se
+        pudieron resolver no aparecen en el resultado.
+        """
+        concurrency = concurrency or int(os.getenv("ERP_DIALOG_CONCURRENCY", "4"))
+        self.ensure_session()
+        benefit_numbers = {}
+        by_url = []
+        by_modal = []
+        for beneficiary in beneficiaries:
+            if beneficiary.get("benefit_number"):
+                benefit_numbers[beneficiary["cpf"]] = beneficiary["benefit_number"]
+            elif beneficiary.get("dialog_url"):
+                by_url.append(beneficiary)
+            else:
+                by_modal.append(beneficiary)
+
+        for start in range(0, len(by_url), concurrency):
+            chunk = by_url[start:start + concurrency]
+            results, expired = self._read_dialog_pages(chunk)
+            if expired:
+                # La sesión caducó a mitad del lote: reautenticar y repetir el bloque
+                logger.info("Sesión de ERP expirada durante el lote, reautenticando...")
+                self.session_store.clear()
+                self.login()
+                results, _ = self._read_dialog_pages(chunk)
+            benefit_numbers.update(results)
+
+        for beneficiary in by_modal:
+            try:
+                details = self.process_beneficiary_details(beneficiary)
+                benefit_numbers[details["cpf"]] = details["benefit_number"]
+            except Exception as e:
+                logger.error(f"No se pudo resolver el beneficio de {beneficiary['cpf']}: {str(e)}")
+
+        self.ledger.record_benefits(benefit_numbers)
+        logger.info(
+            f"Resueltos {len(benefit_numbers)}/{len(beneficiaries)} números de beneficio"
+        )
+        return benefit_numbers
+
+    @timed("erp.dialog_pages")
+    @traced("erp.dialog_pages")
+    def _read_dialog_pages(self, beneficiaries):
+        """Carga las páginas de diálogo en paralelo y lee el número de beneficio.
+
+        Devuelve los números leídos y si alguna página redirigió al login. Los
+        errores de cada página no se propagan, así que se marcan en la traza.
+        """
+        pages = []
+        results = {}
+        expired = False
+        try:
+            # Las navegaciones se lanzan todas antes de esperar a ninguna
+            for beneficiary in beneficiaries:
+                page = self.context.new_page()
+                pages.append((beneficiary, page))
+                try:
+                    page.goto(beneficiary["dialog_url"], wait_until="commit")
+                except Exception as e:
+                    logger.error(f"Error abriendo diálogo de {beneficiary['cpf']}: {str(e)}")
+                    if self.tracer:
+                        self.tracer.fail("erp.dialog_pages", e)
+
+            for beneficiary, page in pages:
+                try:
+                    field = page.wait_for_selector(
+                        '//*[@id="P73_NUMERO_BENEFICIO_DISPLAY"]',
+                        state="attached",
+                        timeout=self.waiter.default_timeout,
+                    )
+                    results[beneficiary["cpf"]] = field.inner_text().strip()
+                except Exception as e:
+                    if self._is_login_page(page):
+                        expired = True
+                        continue
+                    logger.error(f"Error leyendo beneficio de {beneficiary['cpf']}: {str(e)}")
+                    if self.tracer:
+                        self.tracer.fail("erp.dialog_pages", e)
+        finally:
+            for _, page in pages:
+                if not page.is_closed():
+                    page.close()
+        return results, expired
+
+    @timed("erp.logout")
     def logout(self):
         """Cierra la sesión y el navegador."""
         try:
             if self.page:
                 self.page.click("#logout-button")
-            self.cleanup()
         except Exception as e:
             logger.error(f"Error en logout de ERP: {str(e)}")
+        finally:
+            # Liberar el navegador aunque falle el cierre de sesión
+            self.cleanup()
 
     def cleanup(self) -> None:
         """Limpia los recursos de Playwright de manera segura."""
         try:
             if self.page and not self.page.is_closed():
                 self.page.close()
+            if self.tracer:
+                # Descarta los fragmentos retenidos antes de cerrar el contexto
+                self.tracer.stop()
             if self.context:
                 self.context.close()
-            if self.browser:
-                self.browser.close()
-            if self.playwright:
-                self.playwright.stop()
+            if self.browser_manager:
+                # El navegador solo se cierra cuando lo libera el último cliente
+                if self.browser:
+                    self.browser_manager.release()
+            else:
+                if self.browser:
+                    self.browser.close()
+                if self.playwright:
+                    self.playwright.stop()
         except Exception as e:
             logger.error(f"Error durante la limpieza: {str(e)}")
         finally:
             self.page = None
+            self.waiter = None
+            self.tracer = None
             self.context = None
             self.browser = None
             self.playwright = None
+            # Cierra la conexión SQLite; se reabre si el cliente vuelve a usarse
+            self.ledger.close()
 
     def __del__(self):
         """Destructor para asegurar la limpieza de recursos."""
@@ -1,21 +1,34 @@
 import tkinter as tk
+import logging
+import queue
 import threading
-import time
 import pystray
 from PIL import Image, ImageDraw
+from src.scheduler import AutomationScheduler
+
+logger = logging.getLogger(__name__)
 
 
 class AutomationGUI:
+    POLL_MS = 500
+    # Espera máxima al cerrar la aplicación para que el planificador libere los navegadores
+    STOP_TIMEOUT_SECONDS = 60
+
     def __init__(self):
+        # Eventos publicados por el hilo del planificador
+        self.events = queue.Queue()
+        self.error_count = 0
         self.setup_gui()
         self.is_running = False
+        self.scheduler = None
         self.setup_tray()
+        self.root.after(self.POLL_MS, self.poll_events)
 
     def setup_gui(self):
         """Configura la interfaz gráfica"""
         self.root = tk.Tk()
         self.root.title("Auto Dataprev")
-        self.root.geometry("300x250")
+        self.root.geometry("300x360")
 
         # Frame para los botones
         button_frame = tk.Frame(self.root)
@@ -42,6 +55,16 @@ class AutomationGUI:
         )
         self.stop_button.pack(pady=10)
 
+        # Contadores en vivo
+        metrics_frame = tk.Frame(self.root)
+        metrics_frame.pack(expand=True)
+        self.rate_var = tk.StringVar(value="Procesados/min: -")
+        self.queue_var = tk.StringVar(value="En cola: -")
+        self.cycle_var = tk.StringVar(value="Último ciclo: -")
+        self.errors_var = tk.StringVar(value="Errores: 0")
+        for var in (self.rate_var, self.queue_var, self.cycle_var, self.errors_var):
+            tk.Label(metrics_frame, textvariable=var, anchor="w", width=30).pack()
+
         # Configurar cierre
         self.root.protocol("WM_DELETE_WINDOW", self.hide_window)
 
@@ -75,16 +98,18 @@ class AutomationGUI:
 
     def start_automation(self, icon=None, item=None):
         """Inicia la automatización"""
+        if self.scheduler and self.scheduler.is_running and not self.is_running:
+            logger.info("Esperando a que termine el ciclo en curso")
+            return
         if not self.is_running:
             self.is_running = True
+            self.scheduler = AutomationScheduler(events=self.events)
             self.start_button.config(state=tk.DISABLED)
             self.stop_button.config(state=tk.NORMAL)
 
-            # Iniciar thread de automatización
-            self.automation_thread = threading.Thread(target=self.run_automation)
-            self.automation_thread.daemon = True
-            self.automation_thread.start()
-            print("Script iniciado")
+            # El planificador ejecuta sus ciclos en su propio hilo
+            self.scheduler.start()
+            logger.info("Script iniciado")
 
     def stop_automation(self, icon=None, item=None):
         """Detiene la automatización"""
@@ -92,19 +117,57 @@ class AutomationGUI:
             self.is_running = False
             self.start_button.config(state=tk.NORMAL)
             self.stop_button.config(state=tk.DISABLED)
-            print("Script detenido")
-
-    def run_automation(self):
-        """Función principal de automatización"""
-        while self.is_running:
-            print("Script ejecutándose...")
-            time.sleep(30)
+            # El lote se detiene en la siguiente tanda y se cierran los navegadores
+            self.scheduler.stop()
+            logger.info("Script detenido")
+
+    def poll_events(self):
+        """Vacía la cola de eventos y actualiza los contadores (hilo de Tk)"""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            self.update_metrics(event)
+        self.root.after(self.POLL_MS, self.poll_events)
+
+    def update_metrics(self, event):
+        """Refleja en la ventana un evento de progreso, de fin de ciclo o de parada"""
+        if event["type"] == "stopped":
+            # Una parada de un planificador anterior no afecta al que ya está en marcha
+            if self.is_running and not self.scheduler.is_running:
+                # El planificador terminó por su cuenta: restaurar los botones
+                self.stop_automation()
+        elif event["type"] == "progress":
+            self.rate_var.set(f"Procesados/min: {event['per_minute']:.1f}")
+            self.queue_var.set(f"En cola: {event['pending']}")
+            self.errors_var.set(f"Errores: {self.error_count + event['failed']}")
+        elif event["type"] == "cycle":
+            self.error_count += event["failed"]
+            self.rate_var.set(f"Procesados/min: {event['per_minute']:.1f}")
+            self.queue_var.set("En cola: 0")
+            self.cycle_var.set(f"Último ciclo: {event['seconds']:.1f}s")
+            self.errors_var.set(f"Errores: {self.error_count}")
 
     def quit_app(self, icon=None, item=None):
-        """Cierra la aplicación"""
-        self.stop_automation()
+        """Cierra la aplicación cuando el planificador terminó de limpiar"""
         if icon:
             icon.stop()
+        self.root.after(0, self.stop_automation)
+        # La espera se hace fuera del hilo de Tk para no congelar la ventana
+        threading.Thread(
+            target=self._shutdown, args=(self.scheduler,), name="gui-shutdown", daemon=True
+        ).start()
+
+    def _shutdown(self, scheduler):
+        """Espera a que el planificador cierre navegadores y registro y destruye la ventana"""
+        if scheduler is not None:
+            scheduler.stop(timeout=self.STOP_TIMEOUT_SECONDS)
+            if scheduler.is_running:
+                logger.warning(
+                    f"El planificador no terminó en {self.STOP_TIMEOUT_SECONDS}s; "
+                    "se cierra igualmente"
+                )
         self.root.after(0, self.root.destroy)
 
     def run(self):
@@ -113,6 +176,9 @@ class AutomationGUI:
 
 
 def main():
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
     app = AutomationGUI()
     app.run()
 
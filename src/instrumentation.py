@@ -0,0 +1,168 @@
+import os
+import csv
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (s) de los cubos del histograma; el último recoge el resto
+HISTOGRAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+def percentile(values, fraction):
+    """Percentil por interpolación lineal de una lista ya ordenada."""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _bucket_label(bucket):
+    return "+inf" if bucket == float("inf") else f"<={bucket}"
+
+
+class StepTimer:
+    """Acumula la duración de cada paso de los clientes por nombre.
+
+    Los pasos se miden con ``step()`` (gestor de contexto) o ``timed()``
+    (decorador, también para corrutinas). Al final de la ejecución
+    ``write_report()`` vuelca p50/p95 e histograma por paso en JSON y CSV.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.started_at = time.time()
+
+    def record(self, name, seconds, ok=True):
+        """Registra una medición del paso ``name``."""
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    @contextmanager
+    def step(self, name):
+        """Mide el bloque como una ejecución del paso ``name``."""
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(name, time.monotonic() - start, ok)
+
+    def timed(self, name):
+        """Decorador que mide cada llamada a la función como el paso ``name``."""
+
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.step(name):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.step(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict:
+        """Resumen por paso: llamadas, errores, total, p50, p95, máximo e histograma."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+            errors = dict(self.errors)
+        stats = {}
+        for name, values in samples.items():
+            histogram = dict.fromkeys(map(_bucket_label, HISTOGRAM_BUCKETS), 0)
+            for value in values:
+                bucket = next(bucket for bucket in HISTOGRAM_BUCKETS if value <= bucket)
+                histogram[_bucket_label(bucket)] += 1
+            stats[name] = {
+                "count": len(values),
+                "errors": errors.get(name, 0),
+                "total": sum(values),
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+                "max": values[-1],
+                "histogram": histogram,
+            }
+        return stats
+
+    def write_report(self, directory=None):
+        """Escribe el informe de la ejecución en JSON y CSV y lo devuelve.
+
+        Los ficheros se llaman ``run_<fecha>.json`` y ``run_<fecha>.csv`` y
+        se guardan en ``directory`` (por defecto RUN_REPORT_DIR o ``reports``).
+        """
+        stats = self.stats()
+        if not stats:
+            return None
+        directory = directory or os.getenv("RUN_REPORT_DIR", "reports")
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started_at))
+        base = os.path.join(directory, f"run_{stamp}")
+
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {"started_at": self.started_at, "finished_at": time.time(), "steps": stats},
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+        with open(f"{base}.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["step", "count", "errors", "total_s", "p50_s", "p95_s", "max_s"])
+            for name, step in sorted(stats.items(), key=lambda item: -item[1]["total"]):
+                writer.writerow(
+                    [
+                        name,
+                        step["count"],
+                        step["errors"],
+                        f"{step['total']:.3f}",
+                        f"{step['p50']:.3f}",
+                        f"{step['p95']:.3f}",
+                        f"{step['max']:.3f}",
+                    ]
+                )
+
+        self.log_summary(stats)
+        logger.info(f"Informe de tiempos guardado en {base}.json")
+        return stats
+
+    def log_summary(self, stats=None):
+        """Registra los pasos que más tiempo acumularon."""
+        stats = stats if stats is not None else self.stats()
+        for name, step in sorted(stats.items(), key=lambda item: -item[1]["total"])[:10]:
+            logger.info(
+                f"Paso {name}: {step['count']} llamadas, total {step['total']:.2f}s, "
+                f"p50 {step['p50']:.3f}s, p95 {step['p95']:.3f}s"
+            )
+
+    def reset(self):
+        """Descarta las mediciones y empieza una ejecución nueva."""
+        with self._lock:
+            self.samples = {}
+            self.errors = {}
+            self.started_at = time.time()
+
+
+# Medidor compartido por todos los clientes del proceso
+timer = StepTimer()
+step = timer.step
+timed = timer.timed
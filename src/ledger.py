@@ -0,0 +1,215 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    cpf TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    benefit_number TEXT,
+    dataprev_status TEXT,
+    dataprev_details TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (cpf, report_date)
+);
+CREATE INDEX IF NOT EXISTS idx_processed_updated_at ON processed (updated_at);
+CREATE TABLE IF NOT EXISTS report_watermarks (
+    report TEXT PRIMARY KEY,
+    row_count INTEGER NOT NULL,
+    checksum TEXT,
+    row_hashes TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_UPSERT_BENEFIT = """
+INSERT INTO processed (cpf, report_date, benefit_number, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (cpf, report_date) DO UPDATE SET
+    benefit_number = excluded.benefit_number,
+    updated_at = excluded.updated_at
+"""
+
+_UPSERT_RESULT = """
+INSERT INTO processed (
+    cpf, report_date, benefit_number, dataprev_status, dataprev_details, error,
+    created_at, updated_at
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (cpf, report_date) DO UPDATE SET
+    benefit_number = COALESCE(excluded.benefit_number, benefit_number),
+    dataprev_status = excluded.dataprev_status,
+    dataprev_details = excluded.dataprev_details,
+    error = excluded.error,
+    updated_at = excluded.updated_at
+"""
+
+
+def today():
+    """Fecha del informe en formato ISO, clave del registro."""
+    return time.strftime("%Y-%m-%d")
+
+
+class ProcessedLedger:
+    """Registro persistente de beneficiarios procesados sobre SQLite.
+
+    Sustituye al ``set`` en memoria: sobrevive entre ejecuciones, se consulta
+    por clave primaria (CPF, fecha) y se poda por antigüedad. Un beneficiario
+    se considera terminado cuando tiene un estado de Dataprev registrado.
+    """
+
+    def __init__(self, path=None, retention_days=None):
+        self.path = path or os.getenv("LEDGER_PATH", "ledger.db")
+        self.retention_days = (
+            retention_days
+            if retention_days is not None
+            else int(os.getenv("LEDGER_RETENTION_DAYS", "30"))
+        )
+        self._lock = threading.Lock()
+        self._conn = None
+        with self._lock:
+            self._connection()
+
+    def _connection(self):
+        """Devuelve la conexión abierta; si se cerró, la abre de nuevo.
+
+        Los clientes cierran el registro en ``cleanup`` y pueden volver a
+        iniciar sesión después, así que la conexión se reabre en el siguiente
+        uso. Se llama con ``_lock`` adquirido.
+        """
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def pending(self, cpfs, report_date=None) -> dict:
+        """Filtra en una sola consulta los CPF que todavía no están terminados.
+
+        Devuelve un diccionario CPF -> número de beneficio ya conocido (o
+        None), conservando el orden de ``cpfs``.
+        """
+        cpfs = list(dict.fromkeys(cpfs))
+        if not cpfs:
+            return {}
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT cpf, benefit_number, dataprev_status FROM processed "
+                "WHERE report_date = ? AND cpf IN (SELECT value FROM json_each(?))",
+                (report_date or today(), json.dumps(cpfs)),
+            ).fetchall()
+        known = {cpf: (benefit_number, status) for cpf, benefit_number, status in rows}
+        pending = {}
+        for cpf in cpfs:
+            benefit_number, status = known.get(cpf, (None, None))
+            if status is None:
+                pending[cpf] = benefit_number
+        return pending
+
+    def unfinished(self, report_date=None) -> dict:
+        """CPF con número de beneficio resuelto pero sin verificar en Dataprev."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT cpf, benefit_number FROM processed WHERE report_date = ? "
+                "AND dataprev_status IS NULL AND benefit_number IS NOT NULL",
+                (report_date or today(),),
+            ).fetchall()
+        return dict(rows)
+
+    def get_watermark(self, report) -> dict:
+        """Devuelve la última marca de agua del informe o una vacía."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT row_count, checksum, row_hashes FROM report_watermarks "
+                "WHERE report = ?",
+                (report,),
+            ).fetchone()
+        if row is None:
+            return {"row_count": -1, "checksum": None, "row_hashes": {}}
+        row_count, checksum, row_hashes = row
+        return {
+            "row_count": row_count,
+            "checksum": checksum,
+            "row_hashes": json.loads(row_hashes),
+        }
+
+    def save_watermark(self, report, watermark) -> None:
+        """Guarda la marca de agua del informe (conteo, checksum y hash -> CPF)."""
+        with self._lock, self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO report_watermarks "
+                "(report, row_count, checksum, row_hashes, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    report,
+                    watermark["row_count"],
+                    watermark["checksum"],
+                    json.dumps(watermark["row_hashes"]),
+                    time.time(),
+                ),
+            )
+
+    def record_benefits(self, benefit_numbers, report_date=None) -> None:
+        """Guarda en bloque los números de beneficio resueltos (CPF -> número)."""
+        if not benefit_numbers:
+            return
+        now = time.time()
+        report_date = report_date or today()
+        with self._lock, self._connection() as conn:
+            conn.executemany(
+                _UPSERT_BENEFIT,
+                [
+                    (cpf, report_date, benefit_number, now, now)
+                    for cpf, benefit_number in benefit_numbers.items()
+                ],
+            )
+
+    def record_results(self, results, report_date=None) -> None:
+        """Guarda en bloque los resultados de Dataprev de un lote."""
+        if not results:
+            return
+        now = time.time()
+        report_date = report_date or today()
+        with self._lock, self._connection() as conn:
+            conn.executemany(
+                _UPSERT_RESULT,
+                [
+                    (
+                        result["cpf"],
+                        report_date,
+                        result.get("benefit_number"),
+                        result.get("status"),
+                        result.get("details"),
+                        result.get("error"),
+                        now,
+                        now,
+                    )
+                    for result in results
+                ],
+            )
+
+    def prune(self, retention_days=None) -> int:
+        """Elimina los registros más antiguos que el periodo de retención."""
+        retention_days = retention_days if retention_days is not None else self.retention_days
+        cutoff = time.time() - retention_days * 86400
+        with self._lock, self._connection() as conn:
+            deleted = conn.execute(
+                "DELETE FROM processed WHERE updated_at < ?", (cutoff,)
+            ).rowcount
+        if deleted:
+            logger.info(f"Registro de procesados: {deleted} entradas antiguas eliminadas")
+        return deleted
+
+    def close(self) -> None:
+        """Cierra la conexión con la base de datos; el siguiente uso la reabre."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
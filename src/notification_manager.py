@@ -1,49 +1,361 @@
 import os
+import atexit
+import hashlib
 import logging
+import queue
+import re
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 logger = logging.getLogger(__name__)
 
+CPF_PATTERN = re.compile(r"\b\d{3}\.\d{3}\.\d{3}-\d{2}\b|\b\d{11}\b")
+# CPF listados como máximo por grupo en el resumen
+DIGEST_MAX_CPFS = 50
 
-class NotificationManager:
-    @staticmethod
-    def send_error_notification(subject, error_message):
-        """Envía una notificación por correo cuando ocurre un error."""
+
+def normalize_error(text):
+    """Quita de un mensaje de error lo que cambia entre repeticiones del mismo fallo."""
+    text = CPF_PATTERN.sub("<cpf>", text)
+    text = re.sub(r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{8,}\b", "<hex>", text)
+    text = re.sub(r"\d+", "<n>", text)
+    return " ".join(text.split())
+
+
+def error_fingerprint(subject, message):
+    """Huella del error: asunto y mensaje normalizados."""
+    key = f"{normalize_error(subject)}\n{normalize_error(message)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+
+class ErrorDigest:
+    """Agrupa los errores repetidos por huella dentro de una ventana de tiempo.
+
+    La primera aparición de cada huella se notifica en el momento, hasta
+    ``max_per_window`` correos por ventana; las repeticiones y lo que pase
+    del límite se acumulan y, al cerrar la ventana, ``collect`` devuelve los
+    grupos para un único correo de resumen. Con ``window_seconds`` 0 no se
+    agrupa nada.
+    """
+
+    def __init__(self, window_seconds=None, max_per_window=None):
+        self.window_seconds = (
+            window_seconds
+            if window_seconds is not None
+            else float(os.getenv("NOTIFICATION_WINDOW_SECONDS", "900"))
+        )
+        self.max_per_window = (
+            max_per_window
+            if max_per_window is not None
+            else int(os.getenv("NOTIFICATION_MAX_PER_WINDOW", "10"))
+        )
+        self.window_start = time.time()
+        self.groups = {}
+        self.sent = 0
+
+    @property
+    def enabled(self):
+        return self.window_seconds > 0
+
+    @property
+    def window_end(self):
+        return self.window_start + self.window_seconds if self.enabled else float("inf")
+
+    def add(self, subject, message, timestamp) -> bool:
+        """Registra un error; devuelve True si debe notificarse ya."""
+        if not self.enabled:
+            return True
+        fingerprint = error_fingerprint(subject, message)
+        cpfs = CPF_PATTERN.findall(f"{subject} {message}")
+        group = self.groups.get(fingerprint)
+        if group is not None:
+            group["count"] += 1
+            group["last_seen"] = timestamp
+            group["cpfs"].update(dict.fromkeys(cpfs))
+            return False
+
+        notify = self.sent < self.max_per_window
+        self.sent += notify
+        self.groups[fingerprint] = {
+            "subject": subject,
+            "message": message,
+            "count": 1,
+            "first_seen": timestamp,
+            "last_seen": timestamp,
+            "cpfs": dict.fromkeys(cpfs),
+            "notified": notify,
+        }
+        return notify
+
+    def collect(self, now, force=False):
+        """Cierra la ventana si terminó y devuelve los grupos con avisos sin enviar."""
+        if not self.enabled or (not force and now < self.window_end):
+            return []
+        groups = [
+            group
+            for group in self.groups.values()
+            if group["count"] > 1 or not group["notified"]
+        ]
+        self.window_start = now
+        self.groups = {}
+        self.sent = 0
+        return groups
+
+
+class NotificationSender:
+    """Envía los correos desde un hilo propio reutilizando la conexión SMTP.
+
+    ``enqueue`` solo deja el aviso en una cola en memoria, así que un
+    servidor de correo lento no frena la automatización. El hilo mantiene
+    abierta la sesión SMTP entre mensajes, la vuelve a abrir si el servidor
+    la cortó y la cierra tras SMTP_IDLE_SECONDS sin mensajes. Los errores
+    repetidos se agrupan con ``ErrorDigest`` en un correo de resumen.
+    """
+
+    def __init__(self):
+        # Configuración del servidor SMTP
+        self.smtp_server = os.getenv("SMTP_SERVER")
+        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
+        self.smtp_user = os.getenv("SMTP_USER")
+        self.smtp_password = os.getenv("SMTP_PASSWORD")
+        self.recipient_email = os.getenv("NOTIFICATION_EMAIL")
+        # STARTTLS obligatorio: sin él no se envían credenciales ni mensajes
+        self.starttls = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+        self.idle_seconds = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+        self.digest = ErrorDigest()
+        self.queue = queue.Queue()
+        self.connections = 0
+        self.sent = 0
+        self._smtp = None
+        self._last_sent = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def enqueue(self, subject, error_message):
+        """Encola un aviso y vuelve de inmediato."""
+        if not self._alive():
+            self._start()
+        self.queue.put_nowait((subject, error_message, time.time()))
+
+    def _start(self):
+        with self._lock:
+            if self._alive():
+                return
+            if self._thread is not None:
+                logger.warning("El hilo de notificaciones terminó inesperadamente, se reinicia")
+            self._thread = threading.Thread(
+                target=self._run, name="notification-sender", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if not self._step():
+                    return
+            except Exception as e:
+                # Un error inesperado no puede dejar la cola sin nadie que la atienda
+                logger.error(f"Error inesperado enviando notificaciones: {str(e)}")
+                self._disconnect()
+
+    def _step(self) -> bool:
+        """Atiende un aviso de la cola o el cierre de ventana; False al detenerse."""
+        now = time.time()
+        timeout = self.digest.window_end - now
+        if self._smtp is not None:
+            timeout = min(timeout, self._last_sent + self.idle_seconds - now)
+        try:
+            item = self.queue.get(timeout=min(max(0.01, timeout), self.idle_seconds))
+        except queue.Empty:
+            self._send_digest(time.time())
+            # Sin mensajes pendientes: no mantener la sesión abierta indefinidamente
+            if time.time() - self._last_sent >= self.idle_seconds:
+                self._disconnect()
+            return True
+        try:
+            if item is None:
+                self._send_digest(time.time(), force=True)
+                self._disconnect()
+                return False
+            subject, error_message, timestamp = item
+            self._send_digest(timestamp)
+            if self.digest.add(subject, error_message, timestamp):
+                self._deliver(self._build_message(subject, error_message, timestamp))
+            return True
+        finally:
+            self.queue.task_done()
+
+    def _send_digest(self, now, force=False):
+        groups = self.digest.collect(now, force)
+        if groups:
+            self._deliver(self._build_digest(groups))
+
+    def _new_message(self, subject, body):
+        msg = MIMEMultipart()
+        msg["From"] = self.smtp_user
+        msg["To"] = self.recipient_email
+        msg["Subject"] = f"Error en Automatización Dataprev: {subject}"
+        msg.attach(MIMEText(body, "plain"))
+        return msg
+
+    def _build_message(self, subject, error_message, timestamp):
+        # Cuerpo del mensaje
+        body = f"""
+        Se ha producido un error en la automatización Dataprev:
+
+        Error: {subject}
+        Detalles: {error_message}
+        Fecha: {_format_time(timestamp)}
+
+        Por favor, revise los logs para más información.
+        """
+        return self._new_message(subject, body)
+
+    def _build_digest(self, groups):
+        """Un solo correo con cada error repetido, sus veces y los CPF afectados."""
+        total = sum(group["count"] for group in groups)
+        lines = [
+            "Errores repetidos en la automatización Dataprev agrupados en este resumen:",
+            "",
+        ]
+        for group in sorted(groups, key=lambda group: -group["count"]):
+            cpfs = list(group["cpfs"])
+            lines.append(f"- {group['subject']}: {group['count']} veces")
+            lines.append(
+                f"  Primera vez: {_format_time(group['first_seen'])}, "
+                f"última: {_format_time(group['last_seen'])}"
+            )
+            details = group["message"].splitlines()[0] if group["message"] else ""
+            lines.append(f"  Detalles: {details}")
+            if cpfs:
+                listed = ", ".join(cpfs[:DIGEST_MAX_CPFS])
+                more = len(cpfs) - DIGEST_MAX_CPFS
+                lines.append(
+                    f"  CPF afectados ({len(cpfs)}): {listed}"
+                    + (f" y {more} más" if more > 0 else "")
+                )
+            lines.append("")
+        lines.append("Por favor, revise los logs para más información.")
+        return self._new_message(
+            f"Resumen de {total} errores ({len(groups)} tipos)", "\n".join(lines)
+        )
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                # Si el servidor no anuncia STARTTLS (o alguien lo quitó de la
+                # respuesta) se aborta antes de enviar la contraseña en claro
+                if not smtp.has_extn("starttls"):
+                    raise smtplib.SMTPNotSupportedError(
+                        "El servidor SMTP no ofrece STARTTLS; "
+                        "no se envían credenciales sin cifrar"
+                    )
+                smtp.starttls()
+                smtp.ehlo()
+            # Sin TLS (SMTP_STARTTLS=false) solo se autentica si el servidor lo pide
+            if self.smtp_user and (self.starttls or smtp.has_extn("auth")):
+                smtp.login(self.smtp_user, self.smtp_password)
+        except BaseException:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connections += 1
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
         try:
-            # Configuración del servidor SMTP
-            smtp_server = os.getenv("SMTP_SERVER")
-            smtp_port = int(os.getenv("SMTP_PORT"))
-            smtp_user = os.getenv("SMTP_USER")
-            smtp_password = os.getenv("SMTP_PASSWORD")
-            recipient_email = os.getenv("NOTIFICATION_EMAIL")
-
-            # Crear mensaje
-            msg = MIMEMultipart()
-            msg["From"] = smtp_user
-            msg["To"] = recipient_email
-            msg["Subject"] = f"Error en Automatización Dataprev: {subject}"
-
-            # Cuerpo del mensaje
-            body = f"""
-            Se ha producido un error en la automatización Dataprev:
-
-            Error: {subject}
-            Detalles: {error_message}
-
-            Por favor, revise los logs para más información.
-            """
-            msg.attach(MIMEText(body, "plain"))
-
-            # Enviar correo
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(smtp_user, smtp_password)
-                server.send_message(msg)
-
-            logger.info(f"Notificación de error enviada: {subject}")
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
 
+    def _deliver(self, msg):
+        if not self.smtp_server:
+            logger.error(f"SMTP no configurado, no se envía la notificación: {msg['Subject']}")
+            return
+        # Un segundo intento con conexión nueva si la sesión abierta había caducado
+        for attempt in range(2):
+            try:
+                if self._smtp is None:
+                    self._connect()
+                self._smtp.send_message(msg)
+                self._last_sent = time.time()
+                self.sent += 1
+                logger.info(f"Notificación de error enviada: {msg['Subject']}")
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                if attempt:
+                    logger.error(f"Error enviando notificación: {str(e)}")
+                    # No levantamos la excepción para evitar un ciclo de errores
+
+    def flush(self, timeout=None) -> bool:
+        """Espera a que se envíen los avisos encolados; False si venció ``timeout``."""
+        if self.queue.unfinished_tasks and not self._alive():
+            self._start()
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(
+                lambda: not self.queue.unfinished_tasks, timeout
+            )
+
+    def stop(self, timeout=None):
+        """Envía lo pendiente, cierra la sesión SMTP y termina el hilo."""
+        if not self._alive():
+            self._thread = None
+            return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+class NotificationManager:
+    _sender = None
+    _sender_lock = threading.Lock()
+
+    @classmethod
+    def sender(cls):
+        """Emisor compartido por el proceso, creado con la configuración actual."""
+        with cls._sender_lock:
+            if cls._sender is None:
+                cls._sender = NotificationSender()
+                atexit.register(cls._sender.stop, timeout=10)
+            return cls._sender
+
+    @classmethod
+    def send_error_notification(cls, subject, error_message):
+        """Encola una notificación por correo cuando ocurre un error.
+
+        El envío ocurre en segundo plano; ``flush`` espera a que termine.
+        """
+        try:
+            cls.sender().enqueue(subject, str(error_message))
         except Exception as e:
-            logger.error(f"Error enviando notificación: {str(e)}")
-            # No levantamos la excepción para evitar un ciclo de errores
+            logger.error(f"Error encolando notificación: {str(e)}")
+
+    @classmethod
+    def flush(cls, timeout=None) -> bool:
+        """Espera a que se envíen las notificaciones pendientes."""
+        if cls._sender is None:
+            return True
+        return cls._sender.flush(timeout)
+
+    @classmethod
+    def reset(cls, timeout=None):
+        """Detiene el emisor actual; el siguiente aviso vuelve a leer la configuración."""
+        with cls._sender_lock:
+            sender, cls._sender = cls._sender, None
+        if sender is not None:
+            sender.stop(timeout)
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin que cada etapa reenvía a la siguiente cuando termina
+_DONE = object()
+
+
+@asynccontextmanager
+async def _no_context():
+    yield None
+
+
+class Stage:
+    """Etapa del pipeline: ``workers`` tareas que aplican ``handler`` a su cola.
+
+    ``handler(item, context)`` es una corrutina; lo que devuelve pasa a la
+    siguiente etapa (``None`` descarta el elemento). Si se indica
+    ``context``, cada tarea abre ese gestor de contexto asíncrono al empezar
+    (por ejemplo, una página propia) y recibe su valor en cada llamada.
+    La cola de entrada admite como máximo ``queue_size`` elementos.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=None, context=None):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = queue_size if queue_size else self.workers * 2
+        self.context = context or _no_context
+        self.reset()
+
+    def reset(self):
+        self.processed = 0
+        self.errors = 0
+        # Tiempo trabajando y tiempo esperando a que la siguiente cola tenga sitio
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._finished = 0
+
+    def sample_depth(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    def stats(self, elapsed) -> dict:
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "errors": self.errors,
+            "busy": self.busy,
+            "blocked": self.blocked,
+            "utilization": self.busy / (self.workers * elapsed) if elapsed > 0 else 0.0,
+            "queue_size": self.queue_size,
+            "queue_max": self.max_depth,
+            "queue_mean": (
+                self._depth_total / self._depth_samples if self._depth_samples else 0.0
+            ),
+        }
+
+
+class Pipeline:
+    """Encadena etapas asíncronas con colas acotadas entre ellas.
+
+    Un único lector recorre ``source`` (iterable asíncrono) y alimenta la
+    primera etapa; cada etapa entrega sus resultados a la siguiente. Como las
+    colas están acotadas, una etapa lenta frena a las anteriores hasta el
+    lector. Al terminar, ``stats()`` indica por etapa la utilización de los
+    workers y la profundidad de su cola, para localizar el cuello de botella.
+    """
+
+    def __init__(self, source, stages, source_name="source"):
+        self.source = source
+        self.stages = list(stages)
+        self.reader = Stage(source_name, None, workers=1)
+        # El lector no tiene cola de entrada
+        self.reader.queue_size = 0
+        self.elapsed = 0.0
+        self._queues = []
+
+    def pending(self) -> int:
+        """Elementos esperando en las colas entre etapas."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def run(self) -> dict:
+        """Procesa ``source`` hasta agotarlo y devuelve las estadísticas por etapa."""
+        self.reader.reset()
+        for stage in self.stages:
+            stage.reset()
+        self._queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        start = time.monotonic()
+
+        tasks = [asyncio.ensure_future(self._read())]
+        for index, stage in enumerate(self.stages):
+            tasks.extend(
+                asyncio.ensure_future(self._work(index)) for _ in range(stage.workers)
+            )
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.elapsed = time.monotonic() - start
+        return self.stats()
+
+    async def _put(self, producer, index, item):
+        """Entrega ``item`` a la etapa ``index`` midiendo la espera del productor."""
+        queue = self._queues[index]
+        start = time.monotonic()
+        await queue.put(item)
+        producer.blocked += time.monotonic() - start
+        self.stages[index].sample_depth(queue.qsize())
+
+    async def _read(self):
+        reader = self.reader
+        iterator = self.source.__aiter__()
+        while True:
+            start = time.monotonic()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                reader.busy += time.monotonic() - start
+            reader.processed += 1
+            await self._put(reader, 0, item)
+        for _ in range(self.stages[0].workers):
+            await self._queues[0].put(_DONE)
+
+    async def _work(self, index):
+        stage = self.stages[index]
+        last = index + 1 == len(self.stages)
+        async with stage.context() as context:
+            while True:
+                item = await self._queues[index].get()
+                if item is _DONE:
+                    break
+                start = time.monotonic()
+                try:
+                    result = await stage.handler(item, context)
+                except Exception as e:
+                    stage.errors += 1
+                    logger.error(f"Error en la etapa {stage.name}: {str(e)}")
+                    continue
+                else:
+                    stage.processed += 1
+                finally:
+                    stage.busy += time.monotonic() - start
+                if result is not None and not last:
+                    await self._put(stage, index + 1, result)
+
+        stage._finished += 1
+        if stage._finished == stage.workers and not last:
+            for _ in range(self.stages[index + 1].workers):
+                await self._queues[index + 1].put(_DONE)
+
+    def stats(self) -> dict:
+        """Estadísticas por etapa, empezando por el lector de la fuente."""
+        return {
+            stage.name: stage.stats(self.elapsed) for stage in [self.reader] + self.stages
+        }
+
+    def log_stats(self, stats=None):
+        """Registra la utilización y las colas de cada etapa y el cuello de botella."""
+        stats = stats if stats is not None else self.stats()
+        for name, stage in stats.items():
+            logger.info(
+                f"Etapa {name}: {stage['workers']} workers, {stage['processed']} elementos, "
+                f"utilización {stage['utilization']:.0%}, cola media "
+                f"{stage['queue_mean']:.1f}/{stage['queue_size']} (máx. {stage['queue_max']}), "
+                f"bloqueada {stage['blocked']:.1f}s"
+            )
+        if stats:
+            bottleneck = max(stats, key=lambda name: stats[name]["utilization"])
+            logger.info(f"Cuello de botella: etapa {bottleneck}")
@@ -0,0 +1,100 @@
+import os
+import logging
+import time
+from src.instrumentation import timer
+
+logger = logging.getLogger(__name__)
+
+# APEX usa jQuery para todas sus peticiones AJAX; sin jQuery basta con el DOM listo
+_APEX_IDLE_JS = """() => {
+    if (document.readyState === "loading") {
+        return false;
+    }
+    if (window.apex && apex.jQuery) {
+        return apex.jQuery.active === 0;
+    }
+    return true;
+}"""
+
+
+class ReadinessWaiter:
+    """Espera señales concretas de la página en lugar de pausas fijas.
+
+    Cada espera tiene un timeout acotado y queda registrada en ``timings``
+    con su duración real, para saber cuánto tiempo se pierde en cada paso.
+    """
+
+    def __init__(self, page, default_timeout=None):
+        self.page = page
+        self.default_timeout = default_timeout or int(
+            os.getenv("READY_TIMEOUT_MS", "15000")
+        )
+        self.timings = []
+
+    def _run(self, name, wait, timeout):
+        """Ejecuta una espera y registra su duración."""
+        timeout = timeout or self.default_timeout
+        start = time.monotonic()
+        ok = False
+        try:
+            result = wait(timeout)
+            ok = True
+            return result
+        finally:
+            elapsed = time.monotonic() - start
+            self.timings.append({"name": name, "seconds": elapsed, "ok": ok})
+            timer.record(f"espera.{name}", elapsed, ok)
+            logger.debug(
+                f"Espera '{name}' {'completada' if ok else 'fallida'} en {elapsed:.3f}s"
+            )
+
+    def selector(self, name, selector, state="visible", timeout=None):
+        """Espera a que un selector alcance el estado indicado."""
+        return self._run(
+            name,
+            lambda t: self.page.wait_for_selector(selector, state=state, timeout=t),
+            timeout,
+        )
+
+    def attribute(self, name, selector, attribute, value, timeout=None):
+        """Espera a que un elemento tenga un atributo con el valor indicado."""
+        return self.selector(
+            name, f'{selector}[{attribute}="{value}"]', state="attached", timeout=timeout
+        )
+
+    def apex_idle(self, name="apex inactivo", timeout=None):
+        """Espera a que APEX no tenga peticiones AJAX pendientes."""
+        return self._run(
+            name,
+            lambda t: self.page.wait_for_function(_APEX_IDLE_JS, timeout=t),
+            timeout,
+        )
+
+    def total_seconds(self):
+        """Devuelve el tiempo total invertido en esperas."""
+        return sum(timing["seconds"] for timing in self.timings)
+
+    def reset(self):
+        """Descarta las mediciones acumuladas."""
+        self.timings = []
+
+
+class AsyncReadinessWaiter(ReadinessWaiter):
+    """Versión de ``ReadinessWaiter`` para páginas de ``playwright.async_api``."""
+
+    async def _run(self, name, wait, timeout):
+        """Ejecuta una espera asíncrona y registra su duración."""
+        timeout = timeout or self.default_timeout
+        start = time.monotonic()
+        ok = False
+        try:
+            result = await wait(timeout)
+            ok = True
+            return result
+        finally:
+            elapsed = time.monotonic() - start
+            self.timings.append({"name": name, "seconds": elapsed, "ok": ok})
+            timer.record(f"espera.{name}", elapsed, ok)
+            logger.debug(
+                f"Espera '{name}' {'completada' if ok else 'fallida'} en {elapsed:.3f}s"
+            )
@@ -0,0 +1,83 @@
+import os
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """Reintenta un paso concreto con back-off exponencial y jitter.
+
+    Entre intentos espera un tiempo aleatorio entre 0 y
+    ``base_delay * 2 ** intento`` (como máximo ``max_delay``) y llama a
+    ``recover`` para devolver el cliente a un estado conocido, por ejemplo
+    reautenticando si la sesión caducó. Solo se repite el paso que falló,
+    no la ejecución completa.
+    """
+
+    def __init__(self, attempts=None, base_delay=None, max_delay=None):
+        self.attempts = max(
+            1, attempts if attempts is not None else int(os.getenv("RETRY_ATTEMPTS", "3"))
+        )
+        self.base_delay = (
+            base_delay
+            if base_delay is not None
+            else float(os.getenv("RETRY_BASE_SECONDS", "1"))
+        )
+        self.max_delay = (
+            max_delay
+            if max_delay is not None
+            else float(os.getenv("RETRY_MAX_SECONDS", "30"))
+        )
+
+    def delay(self, attempt) -> float:
+        """Espera antes del reintento ``attempt`` (0 = primer reintento)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, *args, name=None, recover=None, **kwargs):
+        """Llama a ``func`` reintentando hasta ``attempts`` veces si lanza una excepción."""
+        name = name or func.__name__
+        for attempt in range(self.attempts):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt + 1 >= self.attempts:
+                    raise
+                wait = self.delay(attempt)
+                logger.warning(
+                    f"Fallo en {name} (intento {attempt + 1}/{self.attempts}): {str(e)}; "
+                    f"reintentando en {wait:.1f}s"
+                )
+                time.sleep(wait)
+                if recover:
+                    try:
+                        recover()
+                    except Exception as recover_error:
+                        logger.error(
+                            f"No se pudo recuperar tras el fallo en {name}: {str(recover_error)}"
+                        )
+
+    async def call_async(self, func, *args, name=None, recover=None, **kwargs):
+        """Versión de ``call`` para corrutinas; ``recover`` también es una corrutina."""
+        name = name or func.__name__
+        for attempt in range(self.attempts):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if attempt + 1 >= self.attempts:
+                    raise
+                wait = self.delay(attempt)
+                logger.warning(
+                    f"Fallo en {name} (intento {attempt + 1}/{self.attempts}): {str(e)}; "
+                    f"reintentando en {wait:.1f}s"
+                )
+                await asyncio.sleep(wait)
+                if recover:
+                    try:
+                        await recover()
+                    except Exception as recover_error:
+                        logger.error(
+                            f"No se pudo recuperar tras el fallo en {name}: {str(recover_error)}"
+                        )
@@ -0,0 +1,276 @@
+import os
+import logging
+import threading
+import time
+from datetime import datetime
+import schedule
+from src.batch_processor import run_cycle
+from src.browser_manager import BrowserManager
+from src.dataprev_client import DataprevClient
+from src.erp_client import ERPClient
+from src.instrumentation import timer
+from src.notification_manager import NotificationManager
+from src.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+def parse_business_hours(value):
+    """Convierte "08:00-18:00" en (inicio, fin); una cadena vacía es todo el día."""
+    if not value:
+        return None
+    start, end = (
+        datetime.strptime(part.strip(), "%H:%M").time() for part in value.split("-")
+    )
+    return start, end
+
+
+def parse_business_days(value):
+    """Convierte "1-5" o "1,3,5" (ISO, lunes = 1) en un conjunto de días."""
+    if not value:
+        return set(range(1, 8))
+    days = set()
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = (int(day) for day in part.split("-"))
+            days.update(range(first, last + 1))
+        elif part:
+            days.add(int(part))
+    return days
+
+
+class AutomationScheduler:
+    """Ejecuta ciclos periódicos con los navegadores y sesiones ya abiertos.
+
+    Los clientes se crean en el primer ciclo y se reutilizan en los
+    siguientes; solo se cierran al detener el planificador, fuera del horario
+    configurado o tras un error. Un ciclo que coincide con otro todavía en
+    curso se omite, y los ciclos vacíos alargan el intervalo hasta
+    ``max_backoff_minutes``.
+
+    Todas las llamadas a Playwright ocurren en el hilo que ejecuta ``run``,
+    ya que ``sync_api`` no admite compartir objetos entre hilos. Si se pasa
+    ``events``, el progreso se publica en esa cola para otros hilos (la GUI).
+    """
+
+    def __init__(
+        self,
+        interval_minutes=None,
+        business_hours=None,
+        business_days=None,
+        max_backoff_minutes=None,
+        batch_size=None,
+        events=None,
+        clock=None,
+    ):
+        self.interval_minutes = (
+            interval_minutes
+            if interval_minutes is not None
+            else int(os.getenv("SCHEDULE_INTERVAL_MINUTES", "30"))
+        )
+        self.business_hours = parse_business_hours(
+            business_hours
+            if business_hours is not None
+            else os.getenv("SCHEDULE_BUSINESS_HOURS", "")
+        )
+        self.business_days = parse_business_days(
+            business_days
+            if business_days is not None
+            else os.getenv("SCHEDULE_BUSINESS_DAYS", "")
+        )
+        self.max_backoff_minutes = (
+            max_backoff_minutes
+            if max_backoff_minutes is not None
+            else int(os.getenv("SCHEDULE_MAX_BACKOFF_MINUTES", "120"))
+        )
+        self.batch_size = (
+            batch_size if batch_size is not None else int(os.getenv("BATCH_SIZE", "0"))
+        )
+        self.poll_seconds = 1
+        # Cola opcional (queue.Queue) donde se publican progreso, fin de ciclo y parada
+        self.events = events
+        # Hora local actual; se inyecta en las pruebas
+        self.clock = clock or datetime.now
+
+        self.scheduler = schedule.Scheduler()
+        self.stop_event = threading.Event()
+        self._cycle_lock = threading.Lock()
+        self._thread = None
+
+        self.browser_manager = None
+        self.erp_client = None
+        self.dataprev_client = None
+
+        self.empty_cycles = 0
+        self.current_interval = self.interval_minutes
+        self.last_summary = None
+        self.last_cycle_seconds = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def in_business_hours(self, now=None) -> bool:
+        """Indica si ``now`` cae dentro de los días y el horario configurados."""
+        now = now or self.clock()
+        if now.isoweekday() not in self.business_days:
+            return False
+        if self.business_hours is None:
+            return True
+        start, end = self.business_hours
+        return start <= now.time() < end
+
+    def next_interval(self) -> int:
+        """Intervalo (min) hasta el próximo ciclo según los ciclos vacíos seguidos."""
+        interval = self.interval_minutes * 2 ** self.empty_cycles
+        return min(interval, max(self.max_backoff_minutes, self.interval_minutes))
+
+    def _ensure_clients(self):
+        """Crea y autentica los clientes, o comprueba las sesiones ya abiertas."""
+        if self.erp_client is None:
+            logger.info("Iniciando navegadores y sesiones del planificador")
+            self.browser_manager = BrowserManager()
+            self.erp_client = ERPClient(browser_manager=self.browser_manager)
+            self.dataprev_client = DataprevClient(browser_manager=self.browser_manager)
+            self.erp_client.ledger.prune()
+            retry = RetryPolicy()
+            retry.call(self.erp_client.login, name="erp.login")
+            retry.call(self.dataprev_client.login, name="dataprev.login")
+            return
+
+        # Recargar la página detecta sesiones expiradas en el servidor
+        for client in (self.erp_client, self.dataprev_client):
+            client.page.reload(wait_until="domcontentloaded")
+            client.ensure_session()
+
+    def _close_clients(self):
+        """Cierra las sesiones y libera el navegador compartido."""
+        for client in (self.erp_client, self.dataprev_client):
+            if client:
+                client.logout()
+        if self.erp_client:
+            # El cliente se recrea en el siguiente ciclo con una conexión nueva
+            self.erp_client.ledger.close()
+        self.erp_client = None
+        self.dataprev_client = None
+        self.browser_manager = None
+
+    def run_cycle(self):
+        """Ejecuta un ciclo salvo que otro siga en curso o esté fuera de horario."""
+        if not self._cycle_lock.acquire(blocking=False):
+            logger.warning("El ciclo anterior sigue en curso, se omite este ciclo")
+            return None
+        try:
+            if not self.in_business_hours():
+                logger.info("Fuera del horario configurado, se omite el ciclo")
+                # No mantener el navegador abierto fuera de horario
+                self._close_clients()
+                return None
+
+            start = time.monotonic()
+            timer.reset()
+            try:
+                self._ensure_clients()
+                summary = run_cycle(
+                    self.erp_client,
+                    self.dataprev_client,
+                    batch_size=self.batch_size,
+                    stop_event=self.stop_event,
+                    progress=self._publish_progress,
+                )
+            except Exception as e:
+                logger.error(f"Error en el ciclo programado: {str(e)}")
+                NotificationManager.send_error_notification(
+                    "Error en el ciclo programado", str(e)
+                )
+                self.last_cycle_seconds = time.monotonic() - start
+                self._publish_cycle(None, error=str(e))
+                # El siguiente ciclo empieza con navegador y sesiones nuevos
+                self._close_clients()
+                return None
+            finally:
+                timer.write_report()
+
+            self.last_cycle_seconds = time.monotonic() - start
+            self._publish_cycle(summary)
+            self.last_summary = summary
+            self.empty_cycles = 0 if summary else self.empty_cycles + 1
+            self._reschedule()
+            return summary
+        finally:
+            self._cycle_lock.release()
+
+    def _publish(self, event):
+        if self.events is not None:
+            self.events.put(event)
+
+    def _publish_progress(self, snapshot):
+        self._publish({"type": "progress", **snapshot})
+
+    def _publish_cycle(self, summary, error=None):
+        """Publica la duración y los contadores del ciclo terminado."""
+        self._publish(
+            {
+                "type": "cycle",
+                "seconds": self.last_cycle_seconds,
+                "processed": summary["processed"] if summary else 0,
+                "failed": (summary["failed"] if summary else 0) + (1 if error else 0),
+                "per_minute": summary["per_minute"] if summary else 0.0,
+                "error": error,
+            }
+        )
+
+    def _reschedule(self):
+        """Ajusta el intervalo del trabajo programado si cambió el back-off."""
+        interval = self.next_interval()
+        if interval == self.current_interval and self.scheduler.jobs:
+            return
+        self.scheduler.clear()
+        self.scheduler.every(interval).minutes.do(self.run_cycle)
+        self.current_interval = interval
+        logger.info(f"Próximo ciclo en {interval} minutos")
+
+    def run(self):
+        """Bucle bloqueante: un ciclo inmediato y luego uno por intervalo."""
+        self.empty_cycles = 0
+        self.current_interval = self.interval_minutes
+        self.scheduler.clear()
+        self.scheduler.every(self.interval_minutes).minutes.do(self.run_cycle)
+        logger.info(
+            f"Planificador iniciado: cada {self.interval_minutes} minutos "
+            f"(back-off máximo {self.max_backoff_minutes} minutos)"
+        )
+        try:
+            self.run_cycle()
+            while not self.stop_event.is_set():
+                self.scheduler.run_pending()
+                self.stop_event.wait(self.poll_seconds)
+        finally:
+            self.scheduler.clear()
+            self._close_clients()
+            logger.info("Planificador detenido")
+            self._publish({"type": "stopped"})
+
+    def start(self) -> bool:
+        """Lanza ``run`` en un hilo propio; devuelve False si ya estaba en marcha."""
+        if self.is_running:
+            logger.warning("El planificador ya está en ejecución")
+            return False
+        # Se limpia aquí y no en ``run`` para no perder un ``stop`` inmediato
+        self.stop_event.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="automation-scheduler", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=None) -> None:
+        """Pide la parada; el ciclo en curso termina antes de cerrar los clientes.
+
+        Con ``timeout`` espera como máximo esos segundos a que el hilo termine.
+        """
+        self.stop_event.set()
+        if timeout is not None and self.is_running:
+            if self._thread is not threading.current_thread():
+                self._thread.join(timeout)
@@ -0,0 +1,66 @@
+import os
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Guarda en disco el ``storage_state`` autenticado de un sistema.
+
+    Cada sistema (``erp``, ``dataprev``) tiene su propio archivo; una sesión
+    más antigua que ``ttl`` segundos se considera caducada y no se carga.
+    """
+
+    def __init__(self, system, directory=None, ttl=None):
+        self.system = system
+        self.directory = directory or os.getenv("SESSION_DIR", ".sessions")
+        self.ttl = ttl if ttl is not None else int(os.getenv("SESSION_TTL_MINUTES", "120")) * 60
+        self.enabled = os.getenv("SESSION_CACHE", "true").lower() == "true"
+        self.path = os.path.join(self.directory, f"{system}.json")
+
+    def load(self):
+        """Devuelve el storage_state guardado o None si no existe o caducó."""
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        try:
+            age = time.time() - os.path.getmtime(self.path)
+            if age > self.ttl:
+                logger.info(f"Sesión guardada de {self.system} caducada ({age / 60:.0f} min)")
+                self.clear()
+                return None
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error leyendo la sesión guardada de {self.system}: {str(e)}")
+            return None
+
+    def save(self, state):
+        """Guarda el storage_state de forma atómica.
+
+        El archivo contiene las cookies de la sesión autenticada, así que solo
+        puede leerlo el usuario del proceso (0600, en un directorio 0700).
+        """
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            # Un temporal que ya existía conserva sus permisos al abrirse
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+            logger.info(f"Sesión de {self.system} guardada en {self.path}")
+        except Exception as e:
+            logger.error(f"Error guardando la sesión de {self.system}: {str(e)}")
+
+    def clear(self):
+        """Elimina la sesión guardada."""
+        try:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        except Exception as e:
+            logger.error(f"Error eliminando la sesión de {self.system}: {str(e)}")
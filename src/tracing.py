@@ -0,0 +1,305 @@
+import os
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import shutil
+import tempfile
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def _slug(text):
+    return "".join(char if char.isalnum() else "_" for char in text)[:60]
+
+
+def _timestamp():
+    return time.strftime("%Y%m%d_%H%M%S")
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+class _TraceBuffer:
+    """Estado común de las versiones síncrona y asíncrona del grabador.
+
+    Cada paso de un cliente es un fragmento (chunk) de la traza de Playwright
+    del contexto. Solo se conservan en un directorio temporal los últimos
+    TRACE_KEEP_STEPS fragmentos; cuando un paso falla se copian a
+    ``TRACE_DIR/<fecha>_<cliente>_<paso>/`` y se borran las carpetas más
+    antiguas hasta que TRACE_DIR ocupe menos de TRACE_MAX_MB.
+    """
+
+    def __init__(self, context, client_name):
+        self.context = context
+        self.client_name = client_name
+        self.enabled = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+        self.keep_steps = max(1, int(os.getenv("TRACE_KEEP_STEPS", "5")))
+        self.directory = os.getenv("TRACE_DIR", "traces")
+        self.max_bytes = int(float(os.getenv("TRACE_MAX_MB", "200")) * 1024 * 1024)
+        self.ring = deque()
+        self.started = False
+        self._spool = None
+        self._sequence = 0
+
+    def _chunk_path(self, name):
+        self._sequence += 1
+        return os.path.join(self._spool, f"{self._sequence:06d}_{_slug(name)}.zip")
+
+    def _keep(self, path):
+        self.ring.append(path)
+        while len(self.ring) > self.keep_steps:
+            evicted = self.ring.popleft()
+            if os.path.exists(evicted):
+                os.remove(evicted)
+
+    def _flush(self, step_name, error):
+        """Copia los fragmentos retenidos a una carpeta con fecha."""
+        target = os.path.join(
+            self.directory, f"{_timestamp()}_{self.client_name}_{_slug(step_name)}"
+        )
+        os.makedirs(target, exist_ok=True)
+        for index, path in enumerate(self.ring):
+            if os.path.exists(path):
+                name = os.path.basename(path).split("_", 1)[1]
+                shutil.copy(path, os.path.join(target, f"{index:02d}_{name}"))
+        with open(os.path.join(target, "error.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{step_name}: {error}\n")
+        self._enforce_cap(target)
+        logger.error(
+            f"Traza de los últimos {len(self.ring)} pasos guardada en {target} "
+            f"(ver con: playwright show-trace <fichero>.zip)"
+        )
+
+    def _enforce_cap(self, keep):
+        """Borra las trazas más antiguas mientras TRACE_DIR supere el tamaño máximo."""
+        folders = sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, name))
+        )
+        sizes = {folder: _directory_size(folder) for folder in folders}
+        total = sum(sizes.values())
+        for folder in folders:
+            if total <= self.max_bytes or folder == keep:
+                break
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= sizes[folder]
+
+    def _discard_spool(self):
+        if self._spool:
+            shutil.rmtree(self._spool, ignore_errors=True)
+        self._spool = None
+        self.ring.clear()
+
+
+class TraceRecorder(_TraceBuffer):
+    """Búfer circular de trazas de Playwright para un contexto síncrono."""
+
+    def __init__(self, context, client_name):
+        super().__init__(context, client_name)
+        # Paso que abrió el fragmento en curso y fallo ocurrido dentro de él
+        self._active = None
+        self._failed = None
+
+    def start(self):
+        if not self.enabled or self.started:
+            return
+        self._spool = tempfile.mkdtemp(prefix=f"trace_{self.client_name}_")
+        self.context.tracing.start(screenshots=True, snapshots=True)
+        self.started = True
+
+    @contextmanager
+    def step(self, name):
+        """Graba el bloque como un fragmento; si falla, vuelca los últimos pasos."""
+        if not self.started or self._active is not None:
+            # Paso anidado: forma parte del fragmento del paso exterior
+            try:
+                yield
+            except Exception as e:
+                if self._active is not None and self._failed is None:
+                    self._failed = (name, e)
+                raise
+            return
+
+        self.context.tracing.start_chunk(title=name)
+        self._active = name
+        self._failed = None
+        try:
+            yield
+        except Exception as e:
+            self._failed = self._failed or (name, e)
+            raise
+        finally:
+            self._active = None
+            self._finish_chunk(name)
+
+    def fail(self, name, error):
+        """Marca como fallido el paso en curso por un error que se capturó.
+
+        Para los pasos que recogen los errores de cada elemento en lugar de
+        propagarlos: al cerrar el fragmento se vuelcan los últimos pasos.
+        """
+        if self._active is not None and self._failed is None:
+            self._failed = (name, error)
+
+    def _finish_chunk(self, name):
+        try:
+            path = self._chunk_path(name)
+            self.context.tracing.stop_chunk(path=path)
+            self._keep(path)
+            if self._failed is not None:
+                self._flush(*self._failed)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la traza del paso {name}: {str(e)}")
+        finally:
+            self._failed = None
+
+    def stop(self):
+        """Detiene la grabación y descarta los fragmentos retenidos."""
+        if not self.started:
+            return
+        self.started = False
+        try:
+            self.context.tracing.stop()
+        except Exception as e:
+            logger.debug(f"No se pudo detener la traza: {str(e)}")
+        finally:
+            self._discard_spool()
+
+
+class AsyncTraceRecorder(_TraceBuffer):
+    """Búfer circular de trazas de Playwright para un contexto asíncrono.
+
+    Playwright solo admite un fragmento a la vez por contexto, así que los
+    pasos de tareas concurrentes que se solapan comparten el fragmento
+    abierto, que se cierra cuando termina el último de ellos. Cada tarea
+    lleva su propio paso en una ``ContextVar``: el fallo de un paso se
+    atribuye a ese paso y vuelca el fragmento aunque otro paso lo abriera.
+    """
+
+    def __init__(self, context, client_name):
+        super().__init__(context, client_name)
+        # Estado del paso exterior de la tarea actual: {"name", "failed"}
+        self._step = contextvars.ContextVar(f"trace_step_{client_name}", default=None)
+        # Pasos dentro del fragmento abierto y fallos ocurridos en ellos
+        self._participants = 0
+        self._chunk_name = None
+        self._failures = []
+        # Serializa la apertura y el cierre de fragmentos, no los pasos
+        self._chunk_lock = asyncio.Lock()
+
+    async def start(self):
+        if not self.enabled or self.started:
+            return
+        self._spool = tempfile.mkdtemp(prefix=f"trace_{self.client_name}_")
+        await self.context.tracing.start(screenshots=True, snapshots=True)
+        self.started = True
+
+    @asynccontextmanager
+    async def step(self, name):
+        """Graba el bloque como un fragmento; si falla, vuelca los últimos pasos."""
+        state = self._step.get()
+        if not self.started or state is not None:
+            # Paso anidado en la misma tarea: forma parte de su paso exterior
+            try:
+                yield
+            except Exception as e:
+                if state is not None and state["failed"] is None:
+                    state["failed"] = (name, e)
+                raise
+            return
+
+        state = {"name": name, "failed": None}
+        token = self._step.set(state)
+        async with self._chunk_lock:
+            if self._participants == 0:
+                self._chunk_name = name
+                self._failures = []
+                await self.context.tracing.start_chunk(title=name)
+            self._participants += 1
+        try:
+            yield
+        except Exception as e:
+            state["failed"] = state["failed"] or (name, e)
+            raise
+        finally:
+            self._step.reset(token)
+            async with self._chunk_lock:
+                self._participants -= 1
+                if state["failed"] is not None:
+                    self._failures.append(state["failed"])
+                if self._participants == 0:
+                    await self._finish_chunk(self._chunk_name)
+
+    def fail(self, name, error):
+        """Marca como fallido el paso en curso de esta tarea por un error capturado."""
+        state = self._step.get()
+        if state is not None and state["failed"] is None:
+            state["failed"] = (name, error)
+
+    async def _finish_chunk(self, name):
+        try:
+            path = self._chunk_path(name)
+            await self.context.tracing.stop_chunk(path=path)
+            self._keep(path)
+            if self._failures:
+                self._flush(*self._failures[0])
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la traza del paso {name}: {str(e)}")
+        finally:
+            self._failures = []
+
+    async def stop(self):
+        """Detiene la grabación y descarta los fragmentos retenidos."""
+        if not self.started:
+            return
+        self.started = False
+        try:
+            await self.context.tracing.stop()
+        except Exception as e:
+            logger.debug(f"No se pudo detener la traza: {str(e)}")
+        finally:
+            self._discard_spool()
+
+
+def traced(name):
+    """Decorador de métodos de cliente: graba la llamada como el paso ``name``.
+
+    Usa el grabador ``self.tracer`` del cliente; sin grabador llama a la
+    función sin más.
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                tracer = getattr(self, "tracer", None)
+                if tracer is None:
+                    return await func(self, *args, **kwargs)
+                async with tracer.step(name):
+                    return await func(self, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self, "tracer", None)
+            if tracer is None:
+                return func(self, *args, **kwargs)
+            with tracer.step(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,482 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import html
+import logging
+import secrets
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Servidores locales que imitan las páginas del ERP (Oracle APEX) y de Dataprev
+# con los mismos selectores que usan los clientes, para medir sin tocar
+# producción. El número de filas y la latencia por petición son configurables.
+
+ERP_COOKIE = "erp_session"
+DATAPREV_COOKIE = "dataprev_session"
+
+ERP_LOGIN_HTML = """<!DOCTYPE html>
+<html><head><title>ERP - login</title></head><body>
+<form method="post" action="/login">
+  <input id="P101_USERNAME" name="username">
+  <input id="P101_PASSWORD" name="password" type="password">
+  <button id="B224579857434482981" type="submit">Entrar</button>
+</form>
+</body></html>"""
+
+# Cabecera común: menú lateral con el árbol Dataprev -> Beneficiarios
+ERP_CHROME_HTML = """<style>
+  #t_TreeNav[aria-hidden="true"], #t_TreeNav_2.collapsed, .modal-dialog.hidden {
+    display: none;
+  }
+</style>
+<ul id="224579043665482962"><li>usuario</li></ul>
+<a id="t_MenuNav_0" href="#">Menú</a>
+<button id="t_Button_navControl" aria-expanded="false" onclick="
+  this.setAttribute('aria-expanded', 'true');
+  document.getElementById('t_TreeNav').setAttribute('aria-hidden', 'false');
+">Navegación</button>
+<div class="a-TreeView" id="t_TreeNav" aria-hidden="true">
+  <ul>
+    <li id="t_TreeNav_1"
+        onclick="document.getElementById('t_TreeNav_2').classList.remove('collapsed')">
+      <span class="a-TreeView-toggle">+</span> Dataprev
+      <ul><li id="t_TreeNav_2" class="collapsed"
+              onclick="event.stopPropagation(); location.href = '/report'">Beneficiarios</li></ul>
+    </li>
+  </ul>
+</div>
+<button id="logout-button" onclick="location.href = '/logout'">Salir</button>"""
+
+ERP_REPORT_SCRIPT = """<div class="modal-dialog hidden">
+  <span id="P73_NUMERO_BENEFICIO_DISPLAY"></span>
+  <button class="close" onclick="this.parentNode.classList.add('hidden')">x</button>
+</div>
+<script>
+  function openDialog(button) {
+    const modal = document.querySelector('.modal-dialog');
+    document.getElementById('P73_NUMERO_BENEFICIO_DISPLAY').innerText = button.dataset.benefit;
+    modal.classList.remove('hidden');
+  }
+</script>"""
+
+DATAPREV_LOGIN_HTML = """<!DOCTYPE html>
+<html><head><title>Dataprev - login</title></head><body>
+<form method="post" action="/login">
+  <input name="username">
+  <input name="password" type="password">
+  <button type="submit">Entrar</button>
+</form>
+</body></html>"""
+
+DATAPREV_DASHBOARD_HTML = """<!DOCTYPE html>
+<html><head><title>Dataprev</title></head><body>
+<div class="dashboard-container">
+  <a href="/consulta">Consulta</a>
+  <a href="/logout">Salir</a>
+</div>
+</body></html>"""
+
+DATAPREV_QUERY_HTML = """<!DOCTYPE html>
+<html><head><title>Dataprev - consulta</title></head><body>
+<div class="dashboard-container"><a href="/logout">Salir</a></div>
+<form method="post" action="/consulta">
+  <input name="cpf">
+  <input name="benefit_number">
+  <button type="submit">Consultar</button>
+</form>
+</body></html>"""
+
+DATAPREV_RESULT_HTML = """<!DOCTYPE html>
+<html><head><title>Dataprev - resultado</title></head><body>
+<div class="dashboard-container"><a href="/logout">Salir</a></div>
+<div class="benefit-status">{status}</div>
+<div class="benefit-details">CPF {cpf} - benefício {benefit_number}</div>
+</body></html>"""
+
+
+# Opciones del selector de filas por página del informe
+ERP_ROWS_PER_PAGE_OPTIONS = (15, 50, 100, 1000)
+
+
+def make_cpf(index):
+    """CPF ficticio y único para la fila ``index``."""
+    digits = f"{index:011d}"
+    return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+
+
+def make_benefit_number(index):
+    """Número de beneficio ficticio de la fila ``index``."""
+    return str(1000000000 + index)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Servidor HTTP con sesiones por cookie, latencia y caducidad opcionales."""
+
+    daemon_threads = True
+    cookie_name = None
+
+    def __init__(self, handler, latency_ms=0, session_ttl=None, port=0):
+        super().__init__(("127.0.0.1", port), handler)
+        self.latency = latency_ms / 1000
+        self.session_ttl = session_ttl
+        self.sessions = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}/"
+
+    def new_session(self):
+        token = secrets.token_hex(8)
+        with self._lock:
+            self.sessions[token] = time.monotonic()
+        return token
+
+    def valid_session(self, token):
+        with self._lock:
+            created = self.sessions.get(token)
+        if created is None:
+            return False
+        return self.session_ttl is None or time.monotonic() - created < self.session_ttl
+
+    def end_session(self, token):
+        with self._lock:
+            self.sessions.pop(token, None)
+
+    def expire_sessions(self):
+        """Invalida todas las sesiones, como si hubieran caducado en el servidor."""
+        with self._lock:
+            self.sessions.clear()
+
+    def start(self):
+        """Atiende peticiones en un hilo en segundo plano."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Base de los manejadores: latencia, cookies y respuestas HTML."""
+
+    def _begin(self):
+        with self.server._lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        self.route = url.path
+        self.query = parse_qs(url.query)
+
+    def _session(self):
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == self.server.cookie_name and self.server.valid_session(value):
+                return value
+        return None
+
+    def _form(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        return {
+            key: values[0]
+            for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()
+        }
+
+    def _html(self, body):
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _redirect(self, location, cookie=None):
+        self.send_response(303)
+        self.send_header("Location", location)
+        if cookie is not None:
+            self.send_header("Set-Cookie", f"{self.server.cookie_name}={cookie}; Path=/")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _login(self):
+        form = self._form()
+        if form.get("username") and form.get("password"):
+            self._redirect("/", cookie=self.server.new_session())
+        else:
+            self._redirect("/login")
+
+    def _logout(self):
+        session = self._session()
+        if session:
+            self.server.end_session(session)
+        self._redirect("/login", cookie="")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ERPHandler(StandInHandler):
+    """Páginas del ERP: login, inicio, informe de beneficiarios y diálogo."""
+
+    def do_GET(self):
+        self._begin()
+        session = self._session()
+        if self.route == "/logout":
+            return self._logout()
+        if self.route == "/login" or session is None:
+            return self._html(ERP_LOGIN_HTML)
+        if self.route == "/report":
+            return self._html(self._report_html(session))
+        if self.route == "/f" and "p" in self.query:
+            return self._html(self._dialog_html())
+        return self._html(f"<!DOCTYPE html><html><body>{ERP_CHROME_HTML}</body></html>")
+
+    def do_POST(self):
+        self._begin()
+        if self.route == "/login":
+            return self._login()
+        self.send_error(404)
+
+    def _report_html(self, session):
+        today = time.strftime("%d/%m/%Y")
+        page_size = int(self.query.get("rows", [self.server.page_size])[0])
+        page = int(self.query.get("page", ["1"])[0])
+        first = (page - 1) * page_size
+        last = min(first + page_size, self.server.rows)
+        rows = []
+        for index in range(first, last):
+            cpf = make_cpf(index)
+            dialog_url = f"f?p=100:73:{session}::NO::P73_CPF:{index}"
+            rows.append(
+                f'<tr><td><button id="dialog_{index}" data-url="{dialog_url}" '
+                f'data-benefit="{make_benefit_number(index)}" onclick="openDialog(this)">'
+                f"Ver</button></td><td></td><td></td><td></td><td>{cpf}</td>"
+                f"<td></td><td></td><td></td><td>{today}</td></tr>"
+            )
+        return (
+            f"<!DOCTYPE html><html><body>{ERP_CHROME_HTML}"
+            f'<table id="36052098998664950_orig"><tbody>{"".join(rows)}</tbody></table>'
+            f"{self._pagination_html(page_size, page, last)}"
+            f"{ERP_REPORT_SCRIPT}</body></html>"
+        )
+
+    def _pagination_html(self, page_size, page, last):
+        """Selector de filas por página y enlace "siguiente" como en APEX."""
+        options = "".join(
+            f'<option value="{size}"{" selected" if size == page_size else ""}>{size}</option>'
+            for size in ERP_ROWS_PER_PAGE_OPTIONS
+        )
+        html_parts = [
+            f'<select id="36052098998664950_row_select" '
+            f"onchange=\"location.href = '/report?rows=' + this.value\">{options}</select>"
+        ]
+        if last < self.server.rows:
+            next_url = f"/report?rows={page_size}&amp;page={page + 1}"
+            if self.server.pagination_links:
+                html_parts.append(
+                    f'<a class="t-Report-paginationLink t-Report-paginationLink--next" '
+                    f'href="{next_url}">Siguiente</a>'
+                )
+            else:
+                # Paginación por JavaScript, sin URL que se pueda precargar
+                html_parts.append(
+                    f'<a class="t-Report-paginationLink t-Report-paginationLink--next" '
+                    f"href=\"#\" onclick=\"location.href = '{next_url}'; return false;\">"
+                    f"Siguiente</a>"
+                )
+        return "".join(html_parts)
+
+    def _dialog_html(self):
+        # p=100:73:<sesión>::NO::P73_CPF:<fila>
+        index = int(self.query["p"][0].rsplit(":", 1)[-1])
+        return (
+            "<!DOCTYPE html><html><body>"
+            f'<span id="P73_NUMERO_BENEFICIO_DISPLAY">{make_benefit_number(index)}</span>'
+            "</body></html>"
+        )
+
+
+class DataprevHandler(StandInHandler):
+    """Páginas de Dataprev: login, panel, formulario de consulta y resultado."""
+
+    def do_GET(self):
+        self._begin()
+        session = self._session()
+        if self.route == "/logout":
+            return self._logout()
+        if self.route == "/login" or session is None:
+            return self._html(DATAPREV_LOGIN_HTML)
+        if self.route == "/consulta":
+            return self._html(DATAPREV_QUERY_HTML)
+        return self._html(DATAPREV_DASHBOARD_HTML)
+
+    def do_POST(self):
+        self._begin()
+        if self.route == "/login":
+            return self._login()
+        if self.route == "/consulta":
+            if self._session() is None:
+                return self._redirect("/login")
+            form = self._form()
+            return self._html(
+                DATAPREV_RESULT_HTML.format(
+                    status="Ativo",
+                    cpf=html.escape(form.get("cpf", "")),
+                    benefit_number=html.escape(form.get("benefit_number", "")),
+                )
+            )
+        self.send_error(404)
+
+
+class StandInERP(StandInServer):
+    cookie_name = ERP_COOKIE
+
+    def __init__(
+        self,
+        rows=100,
+        latency_ms=0,
+        session_ttl=None,
+        port=0,
+        page_size=15,
+        pagination_links=True,
+    ):
+        super().__init__(ERPHandler, latency_ms=latency_ms, session_ttl=session_ttl, port=port)
+        self.rows = rows
+        # Filas por página iniciales, como el valor por defecto de APEX
+        self.page_size = page_size
+        # False: el enlace "siguiente" solo navega por JavaScript (href="#")
+        self.pagination_links = pagination_links
+
+
+class StandInDataprev(StandInServer):
+    cookie_name = DATAPREV_COOKIE
+
+    def __init__(self, latency_ms=0, session_ttl=None, port=0):
+        super().__init__(
+            DataprevHandler, latency_ms=latency_ms, session_ttl=session_ttl, port=port
+        )
+
+
+class SMTPHandler(StreamRequestHandler):
+    """Diálogo SMTP mínimo: EHLO, MAIL, RCPT, DATA, NOOP, RSET y QUIT."""
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("utf-8"))
+
+    def handle(self):
+        self.server.opened(self.connection)
+        try:
+            self._reply("220 standin ESMTP")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode("utf-8").strip().split(" ", 1)[0].upper()
+                if command in ("EHLO", "HELO"):
+                    self._reply("250-standin")
+                    self._reply("250 8BITMIME")
+                elif command in ("MAIL", "RCPT", "NOOP", "RSET"):
+                    self._reply("250 OK")
+                elif command == "DATA":
+                    self._reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data = self.rfile.readline()
+                        if not data or data in (b".\r\n", b".\n"):
+                            break
+                        lines.append(data)
+                    if self.server.latency:
+                        time.sleep(self.server.latency)
+                    self.server.received(b"".join(lines).decode("utf-8"))
+                    self._reply("250 OK")
+                elif command == "QUIT":
+                    self._reply("221 Bye")
+                    return
+                else:
+                    self._reply("502 Command not implemented")
+        except OSError:
+            return
+        finally:
+            self.server.closed(self.connection)
+
+
+class StandInSMTP(ThreadingTCPServer):
+    """Servidor SMTP local que guarda los mensajes recibidos en ``messages``.
+
+    No anuncia STARTTLS ni AUTH, así que el emisor debe usarse con
+    ``SMTP_STARTTLS=false``. ``drop_connections`` corta las sesiones
+    abiertas, como un servidor que cierra conexiones inactivas.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency_ms=0, port=0):
+        super().__init__(("127.0.0.1", port), SMTPHandler)
+        self.latency = latency_ms / 1000
+        self.messages = []
+        self.connections = 0
+        self._open = set()
+        self._lock = threading.Lock()
+
+    def opened(self, connection):
+        with self._lock:
+            self.connections += 1
+            self._open.add(connection)
+
+    def closed(self, connection):
+        with self._lock:
+            self._open.discard(connection)
+
+    def received(self, message):
+        with self._lock:
+            self.messages.append(message)
+
+    def drop_connections(self):
+        """Cierra todas las sesiones SMTP abiertas."""
+        with self._lock:
+            connections = list(self._open)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        """Atiende peticiones en un hilo en segundo plano."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Servidores locales que imitan el ERP y Dataprev"
+    )
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--erp-port", type=int, default=8001)
+    parser.add_argument("--dataprev-port", type=int, default=8002)
+    args = parser.parse_args()
+
+    erp = StandInERP(rows=args.rows, latency_ms=args.latency_ms, port=args.erp_port).start()
+    dataprev = StandInDataprev(latency_ms=args.latency_ms, port=args.dataprev_port).start()
+    logger.info(f"ERP simulado en {erp.url} con {args.rows} filas")
+    logger.info(f"Dataprev simulado en {dataprev.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        erp.shutdown()
+        dataprev.shutdown()
+
+
+if __name__ == "__main__":
+    # Configuración de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    main()
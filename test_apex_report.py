@@ -0,0 +1,82 @@
+from src.apex_report_client import ApexReportClient
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "ORA_WWV_APP_100=ORA_WWV-abc123"
+CSV_BODY = (
+    "CPF;Nome;Data;Número Benefício\n"
+    "111.111.111-11;Maria;18/10/2026;1234567890\n"
+    "222.222.222-22;João;17/10/2026;\n"
+)
+
+
+class StubApexHandler(BaseHTTPRequestHandler):
+    """Servidor APEX mínimo que sirve el informe en CSV si la cookie es válida."""
+
+    def do_GET(self):
+        if self.headers.get("Cookie") != SESSION_COOKIE or ":CSV:" not in self.path:
+            body = b"<html><body>login</body></html>"
+            content_type = "text/html"
+        else:
+            body = CSV_BODY.encode("utf-8")
+            content_type = "text/csv; charset=utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubApexHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _client(server, cookie_value):
+    host, port = server.server_address
+    cookies = [{"name": "ORA_WWV_APP_100", "value": cookie_value, "domain": host}]
+    return ApexReportClient(
+        f"http://{host}:{port}/ords/", "100", "987654", cookies, page_id="36"
+    )
+
+
+def test_apex_report_csv():
+    server = _start_stub()
+    try:
+        records = _client(server, "ORA_WWV-abc123").fetch_records()
+        logger.info(f"Registros obtenidos: {records}")
+        assert records == [
+            {"cpf": "111.111.111-11", "date": "18/10/2026", "benefit_number": "1234567890"},
+            {"cpf": "222.222.222-22", "date": "17/10/2026", "benefit_number": None},
+        ]
+    finally:
+        server.shutdown()
+
+
+def test_apex_report_expired_session():
+    server = _start_stub()
+    try:
+        _client(server, "expirada").fetch_records()
+    except Exception as e:
+        logger.info(f"Sesión expirada detectada: {str(e)}")
+    else:
+        raise AssertionError("Se esperaba un error con la sesión expirada")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    # Configuración de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    test_apex_report_csv()
+    test_apex_report_expired_session()
@@ -0,0 +1,432 @@
+from src.batch_processor import process_batch, process_batch_async
+from src.erp_client import (
+    EXTRACT_ROWS_JS,
+    FRESH_REPORT_TBODY_SELECTOR,
+    MARK_STALE_JS,
+    MAX_ROWS_PER_PAGE_JS,
+    NEXT_PAGE_JS,
+    NEXT_PAGE_SELECTOR,
+    ERPClient,
+)
+from src.ledger import ProcessedLedger
+from src.notification_manager import NotificationManager
+import asyncio
+import threading
+import time
+import pytest
+
+
+class FakeSender:
+    """Emisor que anota los avisos en lugar de arrancar el hilo de envío SMTP."""
+
+    def __init__(self):
+        self.sent = []
+
+    def enqueue(self, subject, error_message):
+        self.sent.append((subject, error_message))
+
+    def flush(self, timeout=None):
+        return True
+
+    def stop(self, timeout=None):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def notifications(monkeypatch):
+    """Sustituye el emisor compartido; se restaura al terminar cada prueba."""
+    sender = FakeSender()
+    monkeypatch.setattr(NotificationManager, "_sender", sender)
+    return sender.sent
+
+
+class FakeLedger:
+    def __init__(self):
+        self.results = []
+
+    def record_results(self, results):
+        self.results.extend(results)
+
+
+class FakeERP:
+    def __init__(self):
+        self.ledger = FakeLedger()
+
+    def get_benefit_numbers(self, beneficiaries):
+        return {beneficiary["cpf"]: f"NB{beneficiary['cpf']}" for beneficiary in beneficiaries}
+
+    async def process_beneficiary_details(self, beneficiary):
+        return {"cpf": beneficiary["cpf"], "benefit_number": f"NB{beneficiary['cpf']}"}
+
+    def recover(self):
+        pass
+
+
+class FakeDataprev:
+    """Dataprev lento: anota cuántos beneficiarios se habían leído en cada consulta."""
+
+    def __init__(self, extracted):
+        self.extracted = extracted
+        self.seen_extracted = []
+        self.context = self
+
+    def check_benefits(self, items):
+        self.seen_extracted.append(self.extracted[0])
+        return [{"cpf": cpf, "benefit_number": number, "status": "Ativo"} for cpf, number in items]
+
+    async def new_page(self):
+        return FakePage()
+
+    async def check_benefit(self, cpf, benefit_number, page=None):
+        self.seen_extracted.append(self.extracted[0])
+        await asyncio.sleep(0)
+        return {"cpf": cpf, "benefit_number": benefit_number, "status": "Ativo"}
+
+    def recover(self):
+        pass
+
+
+class FakePage:
+    async def close(self):
+        pass
+
+
+class FakeReportPage:
+    """Informe APEX paginado por AJAX: todas las páginas se muestran en la misma pestaña.
+
+    Los botones de los diálogos solo existen en la página del informe que
+    está cargada, y tras ``goto`` la tabla del informe deja de existir.
+    """
+
+    url = "https://erp.example.com/ords/f?p=100:10:12345"
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.number = 0
+        self.dialog = None
+        self.navigations = []
+        self.dialog_pages = {}
+        self.table = FakeTable(self)
+
+    def is_closed(self):
+        return False
+
+    def close(self):
+        pass
+
+    def query_selector(self, selector):
+        return None
+
+    def evaluate(self, script, arg=None):
+        if script == NEXT_PAGE_JS:
+            return {"exists": self.number + 1 < len(self.pages), "url": None}
+        assert script == MAX_ROWS_PER_PAGE_JS
+        return None
+
+    def click(self, selector):
+        if selector == NEXT_PAGE_SELECTOR:
+            self.number += 1
+        elif selector == ".modal-dialog .close":
+            self.dialog = None
+        else:
+            rows = {row[0]: row for row in self.pages[self.number]}
+            dialog_id = selector.lstrip("#")
+            if dialog_id not in rows:
+                raise Exception(f"Elemento {selector} no encontrado")
+            self.dialog = f"NB{rows[dialog_id][1]}"
+            self.dialog_pages[rows[dialog_id][1]] = self.number
+
+    def goto(self, url, **kwargs):
+        self.navigations.append(url)
+        self.table = None
+
+
+class FakeContext:
+    """Contexto que abre pestañas nuevas en la página inicial del ERP."""
+
+    def __init__(self):
+        self.opened = []
+
+    def new_page(self):
+        page = FakeReportPage([[]])
+        self.opened.append(page)
+        return page
+
+    def close(self):
+        pass
+
+
+class FakeTable:
+    def __init__(self, page):
+        self.page = page
+
+    def evaluate(self, script, arg=None):
+        if self.page.table is not self:
+            raise Exception("La tabla del informe ya no está en la página")
+        if script == EXTRACT_ROWS_JS:
+            return self.page.pages[self.page.number]
+        assert script == MARK_STALE_JS
+
+
+class FakeElement:
+    def __init__(self, text):
+        self.text = text
+
+    def inner_text(self):
+        return self.text
+
+
+class FakeWaiter:
+    default_timeout = 1000
+
+    def __init__(self, page):
+        self.page = page
+
+    def selector(self, name, selector, state="visible", timeout=None):
+        if selector == FRESH_REPORT_TBODY_SELECTOR:
+            return self.page.table
+        if "P73_NUMERO_BENEFICIO_DISPLAY" in selector:
+            return FakeElement(self.page.dialog)
+        return None
+
+    def apex_idle(self, name="apex inactivo", timeout=None):
+        pass
+
+
+def _report_client(tmp_path, pages):
+    """ERPClient real sobre un informe simulado de varias páginas."""
+    client = ERPClient(ledger=ProcessedLedger(str(tmp_path / "ledger.db")))
+    client.page = FakeReportPage(pages)
+    client.context = FakeContext()
+    client.waiter = FakeWaiter(client.page)
+    return client
+
+
+def _report_pages(pages, rows_per_page, dialog_urls=False):
+    today = time.strftime("%d/%m/%Y")
+    return [
+        [
+            [
+                f"dialog{cpf}",
+                str(cpf),
+                today,
+                f"f?p=100:73:12345::NO::P73_CPF:{cpf}" if dialog_urls else None,
+            ]
+            for cpf in range(number * rows_per_page, (number + 1) * rows_per_page)
+        ]
+        for number in range(pages)
+    ]
+
+
+def _report(total, extracted):
+    for index in range(total):
+        extracted[0] += 1
+        yield {"cpf": str(index), "dialog_id": None}
+
+
+async def _areport(total, extracted):
+    for beneficiary in _report(total, extracted):
+        yield beneficiary
+
+
+def test_process_batch_reads_report_lazily(monkeypatch):
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "4")
+    monkeypatch.setenv("BENEFICIARY_BUFFER", "8")
+    extracted = [0]
+    erp, dataprev = FakeERP(), FakeDataprev(extracted)
+
+    summary = process_batch(erp, dataprev, _report(100, extracted))
+
+    assert summary["total"] == summary["processed"] == 100
+    # Nunca hay más de un búfer leído por delante de Dataprev
+    for checked, seen in enumerate(dataprev.seen_extracted):
+        assert seen <= checked * 4 + 8
+    assert len(erp.ledger.results) == 100
+
+
+def test_process_batch_stop_and_limit(monkeypatch):
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "4")
+    monkeypatch.setenv("BENEFICIARY_BUFFER", "8")
+    extracted = [0]
+    stop_event = threading.Event()
+    stop_event.set()
+    summary = process_batch(
+        FakeERP(), FakeDataprev(extracted), _report(100, extracted), stop_event=stop_event
+    )
+    # La parada se comprueba antes de cada lectura: no se llega a abrir el informe
+    assert summary["processed"] == summary["total"] == 0
+    assert summary["deferred"] == [] and extracted[0] == 0
+
+    extracted = [0]
+    summary = process_batch(
+        FakeERP(), FakeDataprev(extracted), _report(100, extracted), batch_size=10
+    )
+    assert summary["total"] == summary["processed"] == 10
+    # Al llegar al límite se pide un elemento más para saber si el informe terminó
+    assert extracted[0] == 11
+
+
+class ModalERP(FakeERP):
+    """ERP sin números en el informe: cada beneficiario necesita su consulta de detalle."""
+
+    def __init__(self, stop_event, stop_after):
+        super().__init__()
+        self.stop_event = stop_event
+        self.stop_after = stop_after
+        self.lookups = []
+
+    def get_benefit_numbers(self, beneficiaries):
+        return {}
+
+    def process_beneficiary_details(self, beneficiary):
+        self.lookups.append(beneficiary["cpf"])
+        if len(self.lookups) == self.stop_after:
+            self.stop_event.set()
+        return {"cpf": beneficiary["cpf"], "benefit_number": f"NB{beneficiary['cpf']}"}
+
+
+def test_process_batch_stops_between_detail_lookups(monkeypatch):
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "4")
+    monkeypatch.setenv("BENEFICIARY_BUFFER", "8")
+    extracted = [0]
+    stop_event = threading.Event()
+    erp = ModalERP(stop_event, stop_after=2)
+
+    summary = process_batch(
+        erp, FakeDataprev(extracted), _report(100, extracted), stop_event=stop_event
+    )
+
+    # Los dos resueltos terminan; el resto de la tanda y del búfer quedan aplazados
+    assert erp.lookups == ["0", "1"]
+    assert [result["cpf"] for result in summary["results"]] == ["0", "1"]
+    assert summary["deferred"] == [str(index) for index in range(2, 8)]
+    assert summary["total"] == extracted[0] == 8
+
+
+def _finite_report(total, finished):
+    """Informe que, como ``iter_beneficiaries``, deja la marca de agua al agotarse."""
+    for index in range(total):
+        yield {"cpf": str(index), "dialog_id": None}
+    finished.append(True)
+
+
+async def _afinite_report(total, finished):
+    for beneficiary in _finite_report(total, finished):
+        yield beneficiary
+
+
+@pytest.mark.parametrize("total, exhausted", [(9, True), (10, True), (11, False)])
+def test_batch_size_detects_the_end_of_the_report(monkeypatch, total, exhausted):
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "4")
+    monkeypatch.setenv("BENEFICIARY_BUFFER", "8")
+    extracted = [0]
+    finished = []
+    summary = process_batch(
+        FakeERP(), FakeDataprev(extracted), _finite_report(total, finished), batch_size=10
+    )
+    assert summary["processed"] == min(total, 10)
+    assert bool(finished) is exhausted
+
+    finished = []
+    summary = asyncio.run(
+        process_batch_async(
+            FakeERP(), FakeDataprev(extracted), _afinite_report(total, finished), batch_size=10
+        )
+    )
+    assert summary["processed"] == min(total, 10)
+    assert bool(finished) is exhausted
+
+
+def test_process_batch_async_backpressure(monkeypatch):
+    monkeypatch.setenv("ERP_DIALOG_CONCURRENCY", "2")
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "2")
+    monkeypatch.setenv("PIPELINE_QUEUE_SIZE", "2")
+    extracted = [0]
+    erp, dataprev = FakeERP(), FakeDataprev(extracted)
+
+    summary = asyncio.run(process_batch_async(erp, dataprev, _areport(50, extracted)))
+
+    assert summary["total"] == summary["processed"] == 50
+    # Dos colas de 2 + dos workers por etapa + el lector esperando para encolar
+    for checked, seen in enumerate(dataprev.seen_extracted):
+        assert seen <= checked + 2 + 2 + 2 + 2 + 1
+    stages = summary["stages"]
+    assert list(stages) == ["erp.extraction", "erp.resolve", "dataprev.check", "ledger.record"]
+    assert stages["dataprev.check"]["processed"] == 50
+    assert stages["erp.resolve"]["queue_max"] <= 2
+
+
+def test_process_batch_async_defers_everything_not_started(monkeypatch):
+    monkeypatch.setenv("ERP_DIALOG_CONCURRENCY", "2")
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "2")
+    monkeypatch.setenv("PIPELINE_QUEUE_SIZE", "4")
+    extracted = [0]
+    stop_event = threading.Event()
+    dataprev = FakeDataprev(extracted)
+    check_benefit = dataprev.check_benefit
+
+    async def check_and_stop(cpf, benefit_number, page=None):
+        stop_event.set()
+        return await check_benefit(cpf, benefit_number, page=page)
+
+    dataprev.check_benefit = check_and_stop
+    summary = asyncio.run(
+        process_batch_async(FakeERP(), dataprev, _areport(50, extracted), stop_event=stop_event)
+    )
+
+    processed = [result["cpf"] for result in summary["results"]]
+    # Las colas llevaban varios beneficiarios leídos: ninguno se pierde ni se repite
+    assert len(summary["deferred"]) > 1
+    assert sorted(processed + summary["deferred"], key=int) == [
+        str(index) for index in range(summary["total"])
+    ]
+    assert summary["total"] == extracted[0] < 50
+
+
+def test_modal_rows_are_read_on_their_report_page(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "4")
+    monkeypatch.setenv("BENEFICIARY_BUFFER", "8")
+    client = _report_client(tmp_path, _report_pages(3, 5))
+    report = client.page
+
+    summary = process_batch(
+        client, FakeDataprev([0]), client._stream_beneficiaries(report.table)
+    )
+
+    # El búfer lee por delante de la tanda, pero cada diálogo se abre en su página
+    assert summary["total"] == summary["processed"] == 15
+    assert report.dialog_pages == {str(cpf): cpf // 5 for cpf in range(15)}
+    assert {result["benefit_number"] for result in summary["results"]} == {
+        f"NB{cpf}" for cpf in range(15)
+    }
+    client.ledger.close()
+
+
+def test_failed_detail_lookup_does_not_break_the_report(notifications, monkeypatch, tmp_path):
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "4")
+    monkeypatch.setenv("BENEFICIARY_BUFFER", "8")
+    monkeypatch.setenv("RETRY_BASE_SECONDS", "0")
+    client = _report_client(tmp_path, _report_pages(3, 5, dialog_urls=True))
+    report = client.page
+    failures = {"6": 1}
+
+    def read_dialog_pages(beneficiaries):
+        for beneficiary in beneficiaries:
+            if failures.get(beneficiary["cpf"]):
+                failures[beneficiary["cpf"]] -= 1
+                raise Exception("Timeout abriendo el diálogo")
+        numbers = {beneficiary["cpf"]: f"NB{beneficiary['cpf']}" for beneficiary in beneficiaries}
+        return numbers, False
+
+    monkeypatch.setattr(client, "_read_dialog_pages", read_dialog_pages)
+    summary = process_batch(
+        client, FakeDataprev([0]), client._stream_beneficiaries(report.table)
+    )
+
+    # El fallo se recupera sin mover la página del informe, que se lee entera
+    assert summary["total"] == summary["processed"] == 15
+    assert summary["failed"] == 0 and notifications == []
+    assert report.navigations == []
+    assert len(client.context.opened) == 1
+    assert not client._report_open
+    client.ledger.close()
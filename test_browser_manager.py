@@ -0,0 +1,30 @@
+from src import browser_manager
+import os
+import subprocess
+import sys
+import pytest
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="requiere /proc (Linux)")
+def test_resident_memory_without_psutil_counts_children(monkeypatch):
+    monkeypatch.setattr(browser_manager, "psutil", None)
+    before = browser_manager.resident_memory_mb()
+    assert before > 0
+
+    # Un intérprete hijo ocupa varios MB, como el driver y Chrome
+    child = subprocess.Popen(
+        [sys.executable, "-c", "import sys; print('listo', flush=True); sys.stdin.read()"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        child.stdout.readline()
+        assert browser_manager.resident_memory_mb() > before + 1
+    finally:
+        child.communicate()
+
+
+def test_resident_memory_is_unavailable_without_sources(monkeypatch):
+    monkeypatch.setattr(browser_manager, "psutil", None)
+    monkeypatch.setattr(browser_manager.os.path, "isdir", lambda path: False)
+    assert browser_manager.resident_memory_mb() is None
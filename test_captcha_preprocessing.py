@@ -0,0 +1,59 @@
+from src.captcha_solver import (
+    UPSCALE,
+    adaptive_threshold,
+    otsu_threshold,
+    preprocess_variants,
+    remove_lines,
+    vote,
+)
+from PIL import Image, ImageDraw
+import io
+import numpy as np
+
+
+def _captcha_bytes():
+    image = Image.new("L", (120, 40), 230)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 8, 30, 32), fill=20)
+    draw.line((0, 20, 119, 20), fill=40, width=1)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_otsu_threshold_splits_bimodal_image():
+    gray = np.concatenate([np.full(500, 30.0), np.full(500, 220.0)]).reshape(20, 50)
+    assert 30 <= otsu_threshold(gray) < 220
+
+
+def test_remove_lines_keeps_characters():
+    ink = np.zeros((20, 40), dtype=bool)
+    ink[10, :] = True
+    ink[3:17, 5:9] = True
+    cleaned = remove_lines(ink)
+    assert cleaned[3:17, 5:9].all()
+    assert not cleaned[10, 20:].any()
+
+
+def test_adaptive_threshold_finds_dark_block():
+    gray = np.full((30, 30), 200.0)
+    gray[10:20, 10:20] = 40
+    ink = adaptive_threshold(gray)
+    assert ink[12:18, 12:18].all()
+    assert not ink[0:5, 0:5].any()
+
+
+def test_preprocess_variants_binarize_and_upscale():
+    variants = dict(preprocess_variants(_captcha_bytes()))
+    assert list(variants) == ["otsu", "otsu_sin_lineas", "adaptativo", "contraste"]
+    clean = np.asarray(variants["otsu_sin_lineas"])
+    assert clean.shape == (40 * UPSCALE, 120 * UPSCALE)
+    # El bloque queda en negro y la línea horizontal se borra fuera de él
+    assert clean[20 * UPSCALE, 25 * UPSCALE] == 0
+    assert clean[20 * UPSCALE, 80 * UPSCALE] == 255
+
+
+def test_vote_returns_confidence():
+    assert vote(["AB12", "AB12", "A812", ""]) == ("AB12", 0.5)
+    assert vote(["XY", "YX"]) == ("XY", 0.5)
+    assert vote(["", ""]) == ("", 0.0)
@@ -0,0 +1,177 @@
+from src import captcha_solver
+from src.captcha_solver import CaptchaSolver, TesseractBatchEngine, TesserocrEngine
+import random
+import threading
+import time
+import types
+import pytest
+
+
+class FakeTessAPI:
+    """Imita ``tesserocr.PyTessBaseAPI``: el texto reconocido es la propia imagen."""
+
+    created = []
+
+    def __init__(self, psm=None):
+        self.psm = psm
+        self.variables = {}
+        self.image = None
+        self.ended = False
+        FakeTessAPI.created.append(self)
+
+    def SetVariable(self, name, value):
+        self.variables[name] = value
+
+    def SetImage(self, image):
+        self.image = image
+
+    def GetUTF8Text(self):
+        return f"{self.image}\n"
+
+    def End(self):
+        self.ended = True
+
+
+@pytest.fixture
+def fake_tesserocr(monkeypatch):
+    FakeTessAPI.created = []
+    monkeypatch.setattr(
+        captcha_solver, "tesserocr", types.SimpleNamespace(PyTessBaseAPI=FakeTessAPI)
+    )
+    return FakeTessAPI
+
+
+def test_auto_engine_prefers_tesserocr(fake_tesserocr):
+    solver = CaptchaSolver(workers=3)
+    engine = solver.engine
+    assert isinstance(engine, TesserocrEngine)
+    # El motor se crea una vez y se reutiliza
+    assert solver.engine is engine
+    assert len(fake_tesserocr.created) == 3
+    assert all(api.psm == 7 for api in fake_tesserocr.created)
+    assert fake_tesserocr.created[0].variables == {
+        "tessedit_char_whitelist": captcha_solver.DEFAULT_WHITELIST
+    }
+    solver.close()
+
+
+def test_engine_selection_without_tesserocr(monkeypatch):
+    monkeypatch.setattr(captcha_solver, "tesserocr", None)
+    solver = CaptchaSolver(workers=2)
+    assert isinstance(solver.engine, TesseractBatchEngine)
+    solver.close()
+
+    with pytest.raises(RuntimeError):
+        CaptchaSolver(engine="tesserocr").engine
+
+
+def test_cli_engine_can_be_forced(fake_tesserocr, monkeypatch):
+    monkeypatch.setenv("CAPTCHA_ENGINE", "cli")
+    solver = CaptchaSolver(workers=2)
+    assert isinstance(solver.engine, TesseractBatchEngine)
+    assert fake_tesserocr.created == []
+    solver.close()
+
+
+def test_solve_batch_keeps_input_order(fake_tesserocr, monkeypatch):
+    # Cada captcha produce variantes con su propio texto; las del primero no coinciden
+    def variants(image):
+        if image == b"a1":
+            return [("otsu", "A1"), ("otsu_sin_lineas", "XX"), ("adaptativo", "A1")]
+        return [(name, image.decode().upper()) for name in ("otsu", "adaptativo")]
+
+    monkeypatch.setattr(captcha_solver, "preprocess_variants", variants)
+    solver = CaptchaSolver(workers=4)
+    images = [f"c{index}".encode() for index in range(20)] + [b"a1"]
+
+    answers = solver.solve_batch_with_confidence(images)
+
+    assert [text for text, _ in answers] == [f"C{index}" for index in range(20)] + ["A1"]
+    assert answers[0][1] == 1.0
+    assert answers[-1][1] == pytest.approx(2 / 3)
+    assert solver.solve(b"z9") == "Z9"
+    solver.close()
+
+
+def test_batch_engine_keeps_order_when_groups_finish_out_of_order(monkeypatch):
+    engine = TesseractBatchEngine(captcha_solver.DEFAULT_WHITELIST, 7, workers=4)
+    rng = random.Random(7)
+
+    def recognize_group(images):
+        time.sleep(rng.uniform(0, 0.02))
+        return [f"{image}\n" for image in images]
+
+    monkeypatch.setattr(engine, "_recognize_group", recognize_group)
+    images = list(range(37))
+    assert engine.recognize(images) == [f"{image}\n" for image in images]
+    engine.close()
+
+
+def test_batch_engine_never_splits_the_variants_of_a_captcha(monkeypatch):
+    engine = TesseractBatchEngine(captcha_solver.DEFAULT_WHITELIST, 7, workers=4)
+    calls = []
+    lock = threading.Lock()
+
+    def recognize_group(images):
+        with lock:
+            calls.append(list(images))
+        return [f"{image}\n" for image in images]
+
+    monkeypatch.setattr(engine, "_recognize_group", recognize_group)
+
+    # Un captcha suelto con sus cuatro variantes: una sola invocación de tesseract
+    single = [["0a", "0b", "0c", "0d"]]
+    assert engine.recognize_captchas(single) == [["0a\n", "0b\n", "0c\n", "0d\n"]]
+    assert calls == [single[0]]
+
+    # Diez captchas con cuatro workers: cuatro invocaciones con captchas enteros
+    calls.clear()
+    groups = [[f"{index}{variant}" for variant in "abcd"] for index in range(10)]
+    result = engine.recognize_captchas(groups)
+    assert result == [[f"{image}\n" for image in group] for group in groups]
+    assert len(calls) == 4
+    for call in calls:
+        assert len(call) % 4 == 0
+        assert len({image[:-1] for image in call}) == len(call) // 4
+    engine.close()
+
+
+def test_psm_zero_is_not_treated_as_unset(fake_tesserocr, monkeypatch):
+    monkeypatch.setenv("CAPTCHA_PSM", "7")
+    for psm, expected in ((0, 0), (None, 7)):
+        solver = CaptchaSolver(psm=psm, workers=1)
+        assert solver.psm == expected
+        solver.close()
+
+
+def test_close_releases_the_engine(fake_tesserocr):
+    solver = CaptchaSolver(workers=2)
+    engine = solver.engine
+    solver.close()
+
+    assert all(api.ended for api in fake_tesserocr.created)
+    assert solver._engine is None
+    # Después de cerrar, el siguiente uso crea un motor nuevo
+    assert solver.engine is not engine
+    assert len(fake_tesserocr.created) == 4
+    solver.close()
+    # Cerrar dos veces no falla
+    solver.close()
+
+
+def test_tesserocr_engine_is_safe_across_threads(fake_tesserocr):
+    engine = TesserocrEngine(captcha_solver.DEFAULT_WHITELIST, 7, workers=2)
+    results = {}
+
+    def run(index):
+        results[index] = engine.recognize([f"{index}-{n}" for n in range(10)])
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for index in range(4):
+        assert results[index] == [f"{index}-{n}\n" for n in range(10)]
+    engine.close()
@@ -0,0 +1,50 @@
+from src.async_dataprev_client import AsyncDataprevClient
+import asyncio
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+
+    async def new_page(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+
+def test_failed_recovery_only_fails_its_own_item(monkeypatch):
+    monkeypatch.setenv("RETRY_BASE_SECONDS", "0")
+    client = AsyncDataprevClient()
+    client.context = FakeContext()
+    checked = []
+
+    async def check_benefit(cpf, benefit_number, page=None):
+        checked.append(cpf)
+        if cpf == "2":
+            raise RuntimeError("página cerrada")
+        await asyncio.sleep(0.01)
+        return {"cpf": cpf, "benefit_number": benefit_number, "status": "Ativo"}
+
+    async def ensure_session(page=None):
+        raise RuntimeError("no se pudo iniciar sesión")
+
+    monkeypatch.setattr(client, "check_benefit", check_benefit)
+    monkeypatch.setattr(client, "ensure_session", ensure_session)
+
+    results = asyncio.run(
+        client.check_benefits([("1", "NB1"), ("2", "NB2"), ("3", "NB3")], retries=2)
+    )
+
+    # Las consultas que ya terminaron se conservan; la fallida no se reintenta sin sesión
+    assert [result["status"] for result in results] == ["Ativo", None, "Ativo"]
+    assert results[1]["error"] == "página cerrada"
+    assert checked.count("2") == 1
+    assert all(page.closed for page in client.context.pages)
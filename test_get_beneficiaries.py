@@ -6,11 +6,6 @@ import logging
 import signal
 import time
 
-# Configuración de logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-
 logger = logging.getLogger(__name__)
 client = None
 
@@ -84,6 +79,11 @@ def test_get_beneficiaries():
 
 
 if __name__ == "__main__":
+    # Configuración de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
     # Configurar el manejador de señales
     signal.signal(signal.SIGINT, signal_handler)
     test_get_beneficiaries()
@@ -0,0 +1,87 @@
+from src import ledger as ledger_module
+from src.erp_client import ERPClient
+from src.ledger import ProcessedLedger
+import pytest
+
+DAY = "2026-01-05"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ProcessedLedger(str(tmp_path / "ledger.db"), retention_days=30)
+    yield ledger
+    ledger.close()
+
+
+def test_pending_skips_finished_cpfs(ledger):
+    ledger.record_benefits({"111": "B1", "222": "B2"}, report_date=DAY)
+    ledger.record_results([{"cpf": "222", "status": "ok", "details": "{}"}], report_date=DAY)
+
+    pending = ledger.pending(["333", "111", "222", "333"], report_date=DAY)
+
+    # Conserva el orden, quita duplicados y devuelve el número de beneficio conocido
+    assert list(pending.items()) == [("333", None), ("111", "B1")]
+    assert ledger.pending([], report_date=DAY) == {}
+    # El registro es por fecha: otro día el CPF terminado vuelve a estar pendiente
+    assert ledger.pending(["222"], report_date="2026-01-06") == {"222": None}
+
+
+def test_unfinished_lists_resolved_but_unverified_cpfs(ledger):
+    ledger.record_benefits({"111": "B1", "222": "B2"}, report_date=DAY)
+    ledger.record_results(
+        [
+            {"cpf": "222", "status": "ok"},
+            {"cpf": "333", "status": None, "error": "sin número de beneficio"},
+        ],
+        report_date=DAY,
+    )
+
+    assert ledger.unfinished(report_date=DAY) == {"111": "B1"}
+    assert ledger.unfinished(report_date="2026-01-06") == {}
+
+
+def test_record_results_keeps_the_known_benefit_number(ledger):
+    ledger.record_benefits({"111": "B1"}, report_date=DAY)
+    ledger.record_results([{"cpf": "111", "status": None, "error": "timeout"}], report_date=DAY)
+    # Un fallo no borra el número ya resuelto y el CPF sigue pendiente
+    assert ledger.pending(["111"], report_date=DAY) == {"111": "B1"}
+
+    ledger.record_results(
+        [{"cpf": "111", "benefit_number": "B1", "status": "ok", "details": "{}"}],
+        report_date=DAY,
+    )
+    assert ledger.pending(["111"], report_date=DAY) == {}
+    assert ledger.unfinished(report_date=DAY) == {}
+
+
+def test_prune_removes_entries_older_than_the_retention(ledger, monkeypatch):
+    now = 1_800_000_000.0
+    monkeypatch.setattr(ledger_module.time, "time", lambda: now - 31 * 86400)
+    ledger.record_benefits({"111": "B1"}, report_date="2025-12-01")
+    monkeypatch.setattr(ledger_module.time, "time", lambda: now - 29 * 86400)
+    ledger.record_benefits({"222": "B2"}, report_date="2025-12-03")
+    monkeypatch.setattr(ledger_module.time, "time", lambda: now)
+
+    assert ledger.prune() == 1
+    assert ledger.pending(["111"], report_date="2025-12-01") == {"111": None}
+    assert ledger.pending(["222"], report_date="2025-12-03") == {"222": "B2"}
+    assert ledger.prune(retention_days=0) == 1
+
+
+def test_closed_ledger_reopens_on_next_use(ledger):
+    ledger.record_benefits({"111": "B1"}, report_date=DAY)
+    ledger.close()
+    ledger.close()
+    assert ledger._conn is None
+
+    assert ledger.pending(["111"], report_date=DAY) == {"111": "B1"}
+    assert ledger._conn is not None
+
+
+def test_client_cleanup_closes_the_ledger(ledger):
+    client = ERPClient(ledger=ledger)
+    ledger.pending(["111"], report_date=DAY)
+
+    client.cleanup()
+
+    assert ledger._conn is None
@@ -0,0 +1,163 @@
+from src.notification_manager import ErrorDigest, NotificationManager, error_fingerprint
+from standin_server import StandInSMTP
+import email
+import email.policy
+import logging
+import threading
+import time
+import pytest
+
+logger = logging.getLogger(__name__)
+
+
+def _parse(message):
+    return email.message_from_string(message, policy=email.policy.default)
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = StandInSMTP(latency_ms=20).start()
+    host, port = server.server_address
+    monkeypatch.setenv("SMTP_SERVER", host)
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_USER", "automatizacion@example.com")
+    monkeypatch.setenv("SMTP_PASSWORD", "secreto")
+    monkeypatch.setenv("NOTIFICATION_EMAIL", "soporte@example.com")
+    # El servidor local no ofrece TLS
+    monkeypatch.setenv("SMTP_STARTTLS", "false")
+    # Sin agrupación salvo que la prueba la active
+    monkeypatch.setenv("NOTIFICATION_WINDOW_SECONDS", "0")
+    NotificationManager.reset()
+    try:
+        yield server
+    finally:
+        NotificationManager.reset(timeout=5)
+        server.shutdown()
+        server.server_close()
+
+
+def test_notifications_are_queued_and_share_one_connection(smtp_server):
+    start = time.perf_counter()
+    for index in range(20):
+        NotificationManager.send_error_notification(f"Error {index}", "detalle")
+    enqueue_seconds = time.perf_counter() - start
+    # El servidor tarda 20 ms por mensaje; encolar no espera por él
+    logger.info(f"Encolar 20 avisos: {enqueue_seconds * 1e6 / 20:.0f} µs por aviso")
+    assert enqueue_seconds < 0.2
+
+    assert NotificationManager.flush(timeout=10)
+    assert len(smtp_server.messages) == 20
+    message = _parse(smtp_server.messages[0])
+    assert message["Subject"] == "Error en Automatización Dataprev: Error 0"
+    assert smtp_server.connections == 1
+
+
+def test_notifications_reconnect_after_server_drop(smtp_server):
+    NotificationManager.send_error_notification("Primero", "detalle")
+    assert NotificationManager.flush(timeout=10)
+    smtp_server.drop_connections()
+    time.sleep(0.1)
+
+    NotificationManager.send_error_notification("Segundo", "detalle")
+    assert NotificationManager.flush(timeout=10)
+    assert len(smtp_server.messages) == 2
+    assert smtp_server.connections == 2
+
+
+def test_sender_survives_unexpected_errors(smtp_server, monkeypatch):
+    sender = NotificationManager.sender()
+    build_message = sender._build_message
+    calls = []
+
+    def flaky_build_message(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("fallo inesperado al construir el mensaje")
+        return build_message(*args)
+
+    monkeypatch.setattr(sender, "_build_message", flaky_build_message)
+    NotificationManager.send_error_notification("Primero", "detalle")
+    NotificationManager.send_error_notification("Segundo", "detalle")
+    assert NotificationManager.flush(timeout=10)
+
+    # El primer aviso se pierde pero el hilo sigue atendiendo la cola
+    assert len(smtp_server.messages) == 1
+    assert _parse(smtp_server.messages[0])["Subject"].endswith("Segundo")
+    assert sender._thread.is_alive()
+
+
+def test_dead_sender_thread_is_restarted(smtp_server):
+    sender = NotificationManager.sender()
+    # Hilo que ya terminó, como si hubiera muerto por un error
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    sender._thread = dead
+
+    NotificationManager.send_error_notification("Tras reinicio", "detalle")
+    assert NotificationManager.flush(timeout=10)
+    assert len(smtp_server.messages) == 1
+    assert sender._thread is not dead and sender._thread.is_alive()
+
+
+def test_server_without_starttls_is_refused(smtp_server, monkeypatch):
+    monkeypatch.setenv("SMTP_STARTTLS", "true")
+    NotificationManager.reset()
+    NotificationManager.send_error_notification("Error", "detalle")
+    assert NotificationManager.flush(timeout=10)
+
+    # La sesión se abre pero se corta antes de autenticar o enviar nada
+    assert smtp_server.messages == []
+    assert NotificationManager.sender().sent == 0
+    assert smtp_server.connections == 2
+
+
+def test_error_fingerprint_ignores_cpf_and_numbers():
+    first = error_fingerprint(
+        "Error procesando beneficiario 123.456.789-00", "Timeout 30000ms exceeded"
+    )
+    second = error_fingerprint(
+        "Error procesando beneficiario 987.654.321-99", "Timeout 5000ms exceeded"
+    )
+    assert first == second
+    assert first != error_fingerprint("Error procesando beneficiario 1", "Sesión expirada")
+
+
+def test_error_digest_groups_repeats_and_rate_limits():
+    digest = ErrorDigest(window_seconds=60, max_per_window=2)
+    digest.window_start = 0
+    assert digest.add("Error procesando beneficiario 111.111.111-11", "caído", 1)
+    assert not digest.add("Error procesando beneficiario 222.222.222-22", "caído", 2)
+    assert digest.add("Error en el ciclo programado", "caído", 3)
+    # Tercer tipo de error en la ventana: supera el límite y va al resumen
+    assert not digest.add("Error leyendo el informe", "caído", 4)
+
+    assert digest.collect(30) == []
+    groups = digest.collect(61)
+    assert len(groups) == 2
+    repeated = next(group for group in groups if group["count"] == 2)
+    assert list(repeated["cpfs"]) == ["111.111.111-11", "222.222.222-22"]
+    assert (repeated["first_seen"], repeated["last_seen"]) == (1, 2)
+    # Ventana nueva: el error vuelve a notificarse en el momento
+    assert digest.add("Error en el ciclo programado", "caído", 62)
+
+
+def test_error_storm_sends_one_email_and_one_digest(smtp_server, monkeypatch):
+    monkeypatch.setenv("NOTIFICATION_WINDOW_SECONDS", "600")
+    NotificationManager.reset()
+    for index in range(200):
+        NotificationManager.send_error_notification(
+            f"Error procesando beneficiario {index:03d}.000.000-00", "ERP no disponible"
+        )
+    assert NotificationManager.flush(timeout=10)
+    assert len(smtp_server.messages) == 1
+
+    # Al detenerse se envía el resumen de la ventana en curso
+    NotificationManager.reset(timeout=10)
+    assert len(smtp_server.messages) == 2
+    digest = _parse(smtp_server.messages[1])
+    assert digest["Subject"] == "Error en Automatización Dataprev: Resumen de 200 errores (1 tipos)"
+    body = digest.get_payload()[0].get_content()
+    assert "200 veces" in body
+    assert "CPF afectados (200): 000.000.000-00, 001.000.000-00" in body
+    assert "y 150 más" in body
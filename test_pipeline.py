@@ -0,0 +1,59 @@
+from src.pipeline import Pipeline, Stage
+import asyncio
+
+
+async def _numbers(count):
+    for number in range(count):
+        yield number
+
+
+def test_pipeline_stats_show_bottleneck():
+    results = []
+
+    async def fast(item, _):
+        return item * 2
+
+    async def slow(item, _):
+        await asyncio.sleep(0.01)
+        return None if item % 10 == 0 else item
+
+    async def sink(item, _):
+        results.append(item)
+
+    pipeline = Pipeline(
+        _numbers(40),
+        [Stage("fast", fast, workers=2), Stage("slow", slow, workers=2), Stage("sink", sink)],
+    )
+    stats = asyncio.run(pipeline.run())
+    pipeline.log_stats(stats)
+
+    # Los múltiplos de 5 se descartan en la etapa lenta (item * 2 % 10 == 0)
+    assert sorted(results) == [n * 2 for n in range(40) if n % 5]
+    assert stats["source"]["processed"] == 40
+    assert stats["slow"]["utilization"] > stats["fast"]["utilization"]
+    # La etapa lenta llena su cola y frena a la anterior
+    assert stats["slow"]["queue_max"] == stats["slow"]["queue_size"]
+    assert stats["fast"]["blocked"] > 0
+
+
+def test_pipeline_counts_errors_and_opens_worker_context():
+    opened = []
+
+    class Context:
+        async def __aenter__(self):
+            opened.append(True)
+            return len(opened)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def handler(item, context):
+        if item == 3:
+            raise ValueError("fallo")
+        return context
+
+    pipeline = Pipeline(_numbers(6), [Stage("work", handler, workers=3, context=Context)])
+    stats = asyncio.run(pipeline.run())
+    assert len(opened) == 3
+    assert stats["work"]["processed"] == 5
+    assert stats["work"]["errors"] == 1
@@ -0,0 +1,106 @@
+from standin_server import StandInERP, make_cpf
+from src.erp_client import (
+    ERPClient,
+    exclude_from_watermark,
+    incremental_watermark,
+    merge_report_pages,
+)
+from src.ledger import ProcessedLedger
+import logging
+import os
+import tempfile
+import pytest
+
+logger = logging.getLogger(__name__)
+
+EMPTY_WATERMARK = {"row_count": 0, "checksum": None, "row_hashes": {}}
+
+
+def test_merge_report_pages():
+    pages = [
+        {
+            "row_count": 2,
+            "checksum": "a",
+            "unchanged": False,
+            "hashes": ["h1", "h2"],
+            "rows": [["d1", "c1", "f", None, "h1"]],
+        },
+        {
+            "row_count": 1,
+            "checksum": "b",
+            "unchanged": False,
+            "hashes": ["h3"],
+            "rows": [["d3", "c3", "f", None, "h3"]],
+        },
+    ]
+    merged = merge_report_pages(pages, EMPTY_WATERMARK)
+    assert merged["row_count"] == 3
+    assert merged["hashes"] == ["h1", "h2", "h3"]
+    assert [row[1] for row in merged["rows"]] == ["c1", "c3"]
+    assert not merged["unchanged"]
+
+    # Con la marca de agua del propio informe paginado no hay cambios
+    watermark = {"row_count": 3, "checksum": merged["checksum"], "row_hashes": {}}
+    assert merge_report_pages(pages, watermark)["unchanged"]
+    # Una sola página se devuelve tal cual
+    assert merge_report_pages(pages[:1], EMPTY_WATERMARK) is pages[0]
+
+
+def test_incremental_watermark():
+    previous = {"row_count": 2, "checksum": "a", "row_hashes": {"h1": "c1", "h2": "c2"}}
+    # Sin cambios se conserva la marca de agua anterior
+    unchanged = {"row_count": 2, "checksum": "a", "unchanged": True, "hashes": [], "rows": []}
+    assert incremental_watermark(unchanged, previous, {}) is previous
+
+    # h2 desaparece, h1 se conserva con su CPF y h3 es nueva
+    result = {
+        "row_count": 2,
+        "checksum": "b",
+        "unchanged": False,
+        "hashes": ["h1", "h3"],
+        "rows": [["d3", "c3", "f", None, "h3"]],
+    }
+    assert incremental_watermark(result, previous, {"h3": "c3"}) == {
+        "row_count": 2,
+        "checksum": "b",
+        "row_hashes": {"h1": "c1", "h3": "c3"},
+    }
+    # Partiendo de una marca vacía, los hashes sin CPF conocido quedan a None
+    assert incremental_watermark(result, EMPTY_WATERMARK, {"h3": "c3"})["row_hashes"] == {
+        "h1": None,
+        "h3": "c3",
+    }
+
+
+def test_exclude_from_watermark():
+    row_hashes = {"h1": "c1", "h2": "c2", "h3": "c1"}
+    watermark = {"row_count": 3, "checksum": "a", "row_hashes": dict(row_hashes)}
+    assert exclude_from_watermark(watermark, []) is watermark
+
+    excluded = exclude_from_watermark(watermark, ["c1"])
+    # Todas las filas del CPF salen y el checksum se anula para forzar la extracción
+    assert excluded == {"row_count": 3, "checksum": None, "row_hashes": {"h2": "c2"}}
+    assert watermark["row_hashes"] == row_hashes
+
+
+@pytest.mark.parametrize("pagination_links", [True, False])
+def test_get_beneficiaries_paginated(pagination_links, monkeypatch):
+    """Extrae las 5000 filas del ERP simulado a través de todas sus páginas."""
+    server = StandInERP(rows=5000, pagination_links=pagination_links).start()
+    with tempfile.TemporaryDirectory() as directory:
+        monkeypatch.setenv("ERP_URL", server.url)
+        monkeypatch.setenv("ERP_USER", "test")
+        monkeypatch.setenv("ERP_PASSWORD", "test")
+        monkeypatch.setenv("SESSION_CACHE", "false")
+        client = ERPClient(ledger=ProcessedLedger(os.path.join(directory, "ledger.db")))
+        try:
+            try:
+                client.login()
+            except Exception as e:
+                pytest.skip(f"No se pudo iniciar el navegador: {str(e)}")
+            beneficiaries = client.get_beneficiaries()
+            assert [b["cpf"] for b in beneficiaries] == [make_cpf(i) for i in range(5000)]
+            logger.info(f"ERP simulado atendió {server.requests} peticiones")
+        finally:
+            client.cleanup()
+            server.shutdown()
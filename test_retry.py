@@ -0,0 +1,216 @@
+from src import retry
+from src.batch_processor import process_batch
+from src.ledger import ProcessedLedger
+from src.notification_manager import NotificationManager
+from src.retry import RetryPolicy
+import asyncio
+import random
+import threading
+import pytest
+
+
+class FakeSender:
+    """Emisor que anota los avisos en lugar de arrancar el hilo de envío SMTP."""
+
+    def __init__(self):
+        self.sent = []
+
+    def enqueue(self, subject, error_message):
+        self.sent.append((subject, error_message))
+
+    def flush(self, timeout=None):
+        return True
+
+    def stop(self, timeout=None):
+        pass
+
+
+@pytest.fixture
+def notifications(monkeypatch):
+    """Sustituye el emisor compartido; se restaura al terminar la prueba."""
+    sender = FakeSender()
+    monkeypatch.setattr(NotificationManager, "_sender", sender)
+    return sender.sent
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """Sustituye las esperas por anotaciones y fija la semilla del jitter."""
+    events = []
+
+    async def async_sleep(seconds):
+        events.append(("sleep", seconds))
+
+    monkeypatch.setattr(retry, "random", random.Random(7))
+    monkeypatch.setattr(retry.time, "sleep", lambda seconds: events.append(("sleep", seconds)))
+    monkeypatch.setattr(retry.asyncio, "sleep", async_sleep)
+    return events
+
+
+def _flaky(events, failures, result="ok"):
+    """Función que falla ``failures`` veces antes de devolver ``result``."""
+    calls = [0]
+
+    def func():
+        calls[0] += 1
+        events.append(("call", calls[0]))
+        if calls[0] <= failures:
+            raise RuntimeError(f"fallo {calls[0]}")
+        return result
+
+    return func
+
+
+def test_delay_stays_within_the_back_off_bounds(events):
+    policy = RetryPolicy(attempts=3, base_delay=1, max_delay=5)
+    delays = [policy.delay(attempt) for attempt in range(10) for _ in range(50)]
+
+    for index, delay in enumerate(delays):
+        assert 0 <= delay <= min(5, 2 ** (index // 50))
+    # El tope se alcanza y el jitter reparte las esperas por todo el intervalo
+    assert max(delays) > 4.5 and min(delays) < 0.5
+
+    retry.random.seed(7)
+    assert [policy.delay(attempt) for attempt in range(10) for _ in range(50)] == delays
+
+
+def test_call_recovers_between_attempts(events):
+    policy = RetryPolicy(attempts=3, base_delay=1, max_delay=30)
+    func = _flaky(events, failures=2)
+
+    assert policy.call(func, recover=lambda: events.append(("recover",))) == "ok"
+
+    assert [event[0] for event in events] == [
+        "call", "sleep", "recover", "call", "sleep", "recover", "call",
+    ]
+    assert 0 <= events[1][1] <= 1 and 0 <= events[4][1] <= 2
+
+
+def test_call_gives_up_after_the_last_attempt(events):
+    policy = RetryPolicy(attempts=4, base_delay=1, max_delay=30)
+    func = _flaky(events, failures=10)
+
+    def recover():
+        events.append(("recover",))
+        raise RuntimeError("la sesión no se pudo recuperar")
+
+    with pytest.raises(RuntimeError, match="fallo 4"):
+        policy.call(func, recover=recover)
+
+    kinds = [event[0] for event in events]
+    # Un fallo de ``recover`` no interrumpe los reintentos; tras el último no se espera
+    assert kinds.count("call") == 4
+    assert kinds.count("sleep") == kinds.count("recover") == 3
+    assert kinds[-1] == "call"
+
+
+def test_attempts_never_drop_below_one(events, monkeypatch):
+    monkeypatch.setenv("RETRY_ATTEMPTS", "0")
+    policy = RetryPolicy()
+    assert policy.attempts == 1
+
+    with pytest.raises(RuntimeError):
+        policy.call(_flaky(events, failures=1), recover=lambda: events.append(("recover",)))
+    assert events == [("call", 1)]
+
+
+def test_call_async_recovers_between_attempts(events):
+    policy = RetryPolicy(attempts=3, base_delay=1, max_delay=30)
+    func = _flaky(events, failures=2, result="async")
+
+    async def step():
+        return func()
+
+    async def recover():
+        events.append(("recover",))
+
+    assert asyncio.run(policy.call_async(step, recover=recover)) == "async"
+    assert [event[0] for event in events] == [
+        "call", "sleep", "recover", "call", "sleep", "recover", "call",
+    ]
+
+    events.clear()
+    failing = _flaky(events, failures=10)
+
+    async def failing_step():
+        return failing()
+
+    with pytest.raises(RuntimeError, match="fallo 3"):
+        asyncio.run(policy.call_async(failing_step, recover=recover))
+    assert [event[0] for event in events].count("recover") == 2
+
+
+class LedgerERP:
+    """ERP simulado sobre un registro real: solo resuelve los CPF sin número."""
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.resolved = []
+
+    def get_benefit_numbers(self, beneficiaries):
+        missing = [b["cpf"] for b in beneficiaries if not b.get("benefit_number")]
+        self.resolved.extend(missing)
+        self.ledger.record_benefits({cpf: f"NB{cpf}" for cpf in missing})
+        return {
+            beneficiary["cpf"]: beneficiary.get("benefit_number") or f"NB{beneficiary['cpf']}"
+            for beneficiary in beneficiaries
+        }
+
+    def recover(self):
+        pass
+
+
+class FlakyDataprev:
+    """Dataprev que deja de responder a partir de la consulta ``fail_from``."""
+
+    def __init__(self, fail_from=None):
+        self.fail_from = fail_from
+        self.checked = []
+
+    def check_benefits(self, items):
+        if self.fail_from is not None and len(self.checked) >= self.fail_from:
+            raise RuntimeError("Dataprev no responde")
+        self.checked.extend(cpf for cpf, _ in items)
+        return [{"cpf": cpf, "benefit_number": number, "status": "Ativo"} for cpf, number in items]
+
+    def recover(self):
+        pass
+
+
+def _pending_report(ledger, cpfs):
+    """Como ``iter_beneficiaries``: solo los CPF que el registro no da por terminados."""
+    for cpf, benefit_number in ledger.pending(cpfs).items():
+        yield {"cpf": cpf, "dialog_id": None, "benefit_number": benefit_number}
+
+
+def test_interrupted_batch_resumes_from_the_ledger(events, notifications, monkeypatch, tmp_path):
+    monkeypatch.setenv("DATAPREV_CONCURRENCY", "4")
+    monkeypatch.setenv("RETRY_ATTEMPTS", "2")
+    ledger = ProcessedLedger(str(tmp_path / "ledger.db"))
+    cpfs = [str(index) for index in range(12)]
+
+    # Primera ejecución: Dataprev cae en la segunda tanda y el lote se detiene tras ella
+    stop_event = threading.Event()
+    erp, dataprev = LedgerERP(ledger), FlakyDataprev(fail_from=4)
+    summary = process_batch(
+        erp,
+        dataprev,
+        _pending_report(ledger, cpfs),
+        stop_event=stop_event,
+        progress=lambda progress: stop_event.set() if progress["failed"] else None,
+    )
+    assert summary["processed"] == 4 and summary["failed"] == 4
+    assert len(summary["deferred"]) == 4
+    assert dataprev.checked == cpfs[:4]
+    assert [subject for subject, _ in notifications] == [
+        f"Error procesando beneficiario {cpf}" for cpf in cpfs[4:8]
+    ]
+
+    # Segunda ejecución: no repite los terminados ni vuelve a resolver números ya guardados
+    erp, dataprev = LedgerERP(ledger), FlakyDataprev()
+    summary = process_batch(erp, dataprev, _pending_report(ledger, cpfs))
+    assert summary["processed"] == 8 and summary["failed"] == 0
+    assert dataprev.checked == cpfs[4:]
+    assert erp.resolved == cpfs[8:]
+    assert ledger.pending(cpfs) == {}
+    ledger.close()
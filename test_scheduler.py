@@ -0,0 +1,134 @@
+from src import scheduler as scheduler_module
+from src.scheduler import AutomationScheduler, parse_business_days
+from datetime import datetime
+import queue
+import pytest
+
+# 2026-01-05 es lunes
+MONDAY = datetime(2026, 1, 5)
+
+
+class Clock:
+    """Reloj inyectable: devuelve la hora fijada en ``now``."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def cycles(monkeypatch, tmp_path):
+    """Sustituye el ciclo real por resúmenes predefinidos y anota cada llamada."""
+    monkeypatch.setenv("RUN_REPORT_DIR", str(tmp_path / "reports"))
+    monkeypatch.setattr(AutomationScheduler, "_ensure_clients", lambda self: None)
+    calls = []
+    results = []
+
+    def run_cycle(erp_client, dataprev_client, **kwargs):
+        calls.append(kwargs)
+        return results.pop(0) if results else None
+
+    monkeypatch.setattr(scheduler_module, "run_cycle", run_cycle)
+    return calls, results
+
+
+def _summary(processed):
+    return {"processed": processed, "failed": 0, "per_minute": 1.0}
+
+
+def test_parse_business_days():
+    assert parse_business_days("") == set(range(1, 8))
+    assert parse_business_days("1-5") == {1, 2, 3, 4, 5}
+    assert parse_business_days("1, 3,5-6") == {1, 3, 5, 6}
+
+
+def test_next_interval_doubles_up_to_the_ceiling():
+    scheduler = AutomationScheduler(interval_minutes=30, max_backoff_minutes=100)
+    intervals = []
+    for empty_cycles in range(5):
+        scheduler.empty_cycles = empty_cycles
+        intervals.append(scheduler.next_interval())
+    assert intervals == [30, 60, 100, 100, 100]
+
+    # Un techo menor que el intervalo base no lo acorta
+    scheduler = AutomationScheduler(interval_minutes=30, max_backoff_minutes=10)
+    scheduler.empty_cycles = 3
+    assert scheduler.next_interval() == 30
+
+
+@pytest.mark.parametrize(
+    "now, expected",
+    [
+        (MONDAY.replace(hour=7, minute=59), False),
+        (MONDAY.replace(hour=8), True),
+        (MONDAY.replace(hour=17, minute=59), True),
+        (MONDAY.replace(hour=18), False),
+        (datetime(2026, 1, 9, 12), True),
+        (datetime(2026, 1, 10, 12), False),
+        (datetime(2026, 1, 11, 12), False),
+    ],
+)
+def test_in_business_hours_uses_the_injected_clock(now, expected):
+    scheduler = AutomationScheduler(
+        business_hours="08:00-18:00", business_days="1-5", clock=Clock(now)
+    )
+    assert scheduler.in_business_hours() is expected
+    # Una hora explícita tiene prioridad sobre el reloj
+    assert scheduler.in_business_hours(MONDAY.replace(hour=12))
+
+
+def test_cycle_is_skipped_outside_business_days(cycles):
+    calls, _ = cycles
+    clock = Clock(datetime(2026, 1, 10, 12))
+    scheduler = AutomationScheduler(business_days="1-5", clock=clock)
+
+    assert scheduler.run_cycle() is None
+    assert calls == []
+
+    clock.now = MONDAY.replace(hour=12)
+    scheduler.run_cycle()
+    assert len(calls) == 1
+
+
+def test_empty_cycles_back_off_and_a_busy_one_resets(cycles):
+    calls, results = cycles
+    events = queue.Queue()
+    scheduler = AutomationScheduler(
+        interval_minutes=10, max_backoff_minutes=40, clock=Clock(MONDAY), events=events
+    )
+
+    results.extend([None, None, None, _summary(3)])
+    intervals = []
+    for _ in range(4):
+        scheduler.run_cycle()
+        intervals.append(scheduler.current_interval)
+
+    assert intervals == [20, 40, 40, 10]
+    assert scheduler.empty_cycles == 0
+    assert [job.interval for job in scheduler.scheduler.jobs] == [10]
+    cycle_events = [events.get_nowait() for _ in range(events.qsize())]
+    assert [event["processed"] for event in cycle_events] == [0, 0, 0, 3]
+
+
+def test_start_and_stop_run_in_their_own_thread(cycles):
+    calls, _ = cycles
+    events = queue.Queue()
+    scheduler = AutomationScheduler(clock=Clock(MONDAY), events=events)
+    scheduler.poll_seconds = 0.01
+
+    assert scheduler.start()
+    assert not scheduler.start()
+    scheduler.stop(timeout=5)
+
+    assert not scheduler.is_running
+    assert len(calls) == 1
+    kinds = [events.get_nowait()["type"] for _ in range(events.qsize())]
+    # La GUI restaura sus botones con el evento de parada
+    assert kinds == ["cycle", "stopped"]
+
+    # Una parada pedida justo después de arrancar no se pierde, y se puede volver a arrancar
+    assert scheduler.start()
+    scheduler.stop(timeout=5)
+    assert not scheduler.is_running
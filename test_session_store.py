@@ -0,0 +1,43 @@
+from src.session_store import SessionStore
+import os
+import stat
+import pytest
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="permisos POSIX")
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_saved_session_is_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("SESSION_CACHE", "true")
+    old_umask = os.umask(0o022)
+    try:
+        store = SessionStore("erp", directory=str(tmp_path / "sessions"))
+        # Un temporal abandonado con permisos amplios no se reutiliza tal cual
+        os.makedirs(store.directory, mode=0o700)
+        with open(f"{store.path}.tmp", "w") as f:
+            f.write("{}")
+        os.chmod(f"{store.path}.tmp", 0o644)
+
+        store.save({"cookies": [{"name": "ORA_WWV_APP_100", "value": "secreto"}]})
+    finally:
+        os.umask(old_umask)
+
+    assert _mode(store.directory) == 0o700
+    assert _mode(store.path) == 0o600
+    assert store.load() == {"cookies": [{"name": "ORA_WWV_APP_100", "value": "secreto"}]}
+
+
+def test_store_directory_is_created_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("SESSION_CACHE", "true")
+    old_umask = os.umask(0o022)
+    try:
+        store = SessionStore("dataprev", directory=str(tmp_path / "sessions"))
+        store.save({"cookies": []})
+    finally:
+        os.umask(old_umask)
+
+    assert _mode(store.directory) == 0o700
+    assert _mode(store.path) == 0o600
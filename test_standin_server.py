@@ -0,0 +1,92 @@
+from standin_server import StandInDataprev, StandInERP, make_benefit_number, make_cpf
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, build_opener
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+def _opener():
+    return build_opener(HTTPCookieProcessor(CookieJar()))
+
+
+def _get(opener, url, data=None):
+    body = urlencode(data).encode("utf-8") if data is not None else None
+    with opener.open(url, data=body, timeout=5) as response:
+        return response.geturl(), response.read().decode("utf-8")
+
+
+def test_standin_erp_report_and_dialog():
+    server = StandInERP(rows=25, page_size=25).start()
+    try:
+        opener = _opener()
+        _, page = _get(opener, urljoin(server.url, "/report"))
+        assert 'id="P101_USERNAME"' in page
+
+        url, page = _get(
+            opener, urljoin(server.url, "/login"), {"username": "u", "password": "p"}
+        )
+        assert "login" not in url
+        assert 'id="224579043665482962"' in page and 'id="t_TreeNav_2"' in page
+
+        url, page = _get(opener, urljoin(server.url, "/report"))
+        assert 'id="36052098998664950_orig"' in page
+        assert page.count("<tr>") == 25
+        assert make_cpf(24) in page
+
+        dialog_url = re.search(r'data-url="(f\?p=[^"]+)"', page).group(1)
+        _, dialog = _get(opener, urljoin(url, dialog_url))
+        assert f'id="P73_NUMERO_BENEFICIO_DISPLAY">{make_benefit_number(0)}<' in dialog
+        logger.info(f"ERP simulado atendió {server.requests} peticiones")
+    finally:
+        server.shutdown()
+
+
+def test_standin_erp_report_pagination():
+    server = StandInERP(rows=5000).start()
+    try:
+        opener = _opener()
+        _get(opener, urljoin(server.url, "/login"), {"username": "u", "password": "p"})
+        url, page = _get(opener, urljoin(server.url, "/report"))
+        assert page.count("<tr>") == 15
+        assert 'id="36052098998664950_row_select"' in page
+
+        # Recorrer el informe con el máximo de filas siguiendo el enlace "siguiente"
+        url = urljoin(server.url, "/report?rows=1000")
+        cpfs = []
+        pages = 0
+        while url:
+            url, page = _get(opener, url)
+            pages += 1
+            cpfs.extend(re.findall(r"<td>(\d{3}\.\d{3}\.\d{3}-\d{2})</td>", page))
+            link = re.search(r'paginationLink--next" href="([^"]+)"', page)
+            url = urljoin(url, link.group(1).replace("&amp;", "&")) if link else None
+        assert pages == 5
+        assert cpfs == [make_cpf(index) for index in range(5000)]
+    finally:
+        server.shutdown()
+
+
+def test_standin_dataprev_query_and_expiry():
+    server = StandInDataprev().start()
+    try:
+        opener = _opener()
+        _, page = _get(opener, urljoin(server.url, "/login"), {"username": "u", "password": "p"})
+        assert 'class="dashboard-container"' in page
+
+        _, page = _get(
+            opener,
+            urljoin(server.url, "/consulta"),
+            {"cpf": make_cpf(1), "benefit_number": make_benefit_number(1)},
+        )
+        assert 'class="benefit-status">Ativo<' in page
+        assert make_benefit_number(1) in page
+
+        # Tras caducar la sesión el servidor vuelve a pedir el login
+        server.expire_sessions()
+        _, page = _get(opener, urljoin(server.url, "/consulta"))
+        assert 'name="username"' in page
+    finally:
+        server.shutdown()
@@ -0,0 +1,314 @@
+from src.dataprev_client import DataprevClient
+from src.erp_client import ERPClient
+from src.ledger import ProcessedLedger
+from src.tracing import AsyncTraceRecorder, TraceRecorder, traced
+import asyncio
+import os
+import types
+import pytest
+
+
+class FakeTracing:
+    """Imita ``context.tracing``: cada fragmento se guarda como un fichero de ``size`` bytes."""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.chunks = []
+        self.open_chunk = None
+        self.stopped = False
+
+    def start(self, **kwargs):
+        self.options = kwargs
+
+    def start_chunk(self, title=None):
+        assert self.open_chunk is None, "Playwright solo admite un fragmento a la vez"
+        self.open_chunk = title
+
+    def stop_chunk(self, path=None):
+        with open(path, "wb") as f:
+            f.write(b"x" * self.size)
+        self.chunks.append(self.open_chunk)
+        self.open_chunk = None
+
+    def stop(self):
+        self.stopped = True
+
+
+class AsyncFakeTracing(FakeTracing):
+    async def start(self, **kwargs):
+        super().start(**kwargs)
+
+    async def start_chunk(self, title=None):
+        super().start_chunk(title)
+
+    async def stop_chunk(self, path=None):
+        super().stop_chunk(path)
+
+    async def stop(self):
+        super().stop()
+
+
+class FakeContext:
+    def __init__(self, tracing):
+        self.tracing = tracing
+
+
+class FakeDialogPage:
+    """Página de diálogo del ERP que nunca llega a mostrar el número de beneficio."""
+
+    url = "https://erp.example.com/ords/f?p=100:73:12345"
+
+    def __init__(self):
+        self.closed = False
+
+    def goto(self, url, **kwargs):
+        pass
+
+    def wait_for_selector(self, selector, **kwargs):
+        raise TimeoutError(f"Tiempo agotado esperando {selector}")
+
+    def query_selector(self, selector):
+        return None
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDialogContext(FakeContext):
+    def new_page(self):
+        return FakeDialogPage()
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    @traced("cliente.ok")
+    def ok(self):
+        return "ok"
+
+    @traced("cliente.falla")
+    def fail(self):
+        self.ok()
+        raise RuntimeError("selector no encontrado")
+
+
+@pytest.fixture
+def trace_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("TRACE_ENABLED", "true")
+    monkeypatch.setenv("TRACE_KEEP_STEPS", "3")
+    monkeypatch.setenv("TRACE_DIR", str(tmp_path / "traces"))
+    monkeypatch.setenv("TRACE_MAX_MB", "200")
+    return tmp_path / "traces"
+
+
+def _flushed(directory):
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def test_successful_steps_keep_only_the_ring(trace_env):
+    tracing = FakeTracing()
+    recorder = TraceRecorder(FakeContext(tracing), "erp")
+    recorder.start()
+    client = FakeClient(recorder)
+
+    for _ in range(10):
+        assert client.ok() == "ok"
+
+    assert tracing.options == {"screenshots": True, "snapshots": True}
+    assert len(tracing.chunks) == 10
+    assert len(recorder.ring) == 3
+    assert len(os.listdir(recorder._spool)) == 3
+    # Sin fallos no se escribe nada en TRACE_DIR
+    assert _flushed(trace_env) == []
+
+    spool = recorder._spool
+    recorder.stop()
+    assert tracing.stopped
+    assert not os.path.exists(spool)
+
+
+def test_failure_flushes_the_last_steps(trace_env):
+    tracing = FakeTracing()
+    recorder = TraceRecorder(FakeContext(tracing), "erp")
+    recorder.start()
+    client = FakeClient(recorder)
+
+    for _ in range(5):
+        client.ok()
+    with pytest.raises(RuntimeError):
+        client.fail()
+
+    # El paso anidado queda dentro del fragmento del paso que falla
+    assert tracing.chunks[-1] == "cliente.falla"
+    folders = _flushed(trace_env)
+    assert len(folders) == 1 and folders[0].endswith("_erp_cliente_falla")
+    files = sorted(os.listdir(trace_env / folders[0]))
+    assert files == [
+        "00_cliente_ok.zip",
+        "01_cliente_ok.zip",
+        "02_cliente_falla.zip",
+        "error.txt",
+    ]
+    assert "selector no encontrado" in (trace_env / folders[0] / "error.txt").read_text()
+    recorder.stop()
+
+
+def test_flushed_traces_stay_under_the_size_cap(trace_env, monkeypatch):
+    # Fragmentos de 1 MB: los volcados ocupan 1, 2, 3 y 3 MB y el límite es 7 MB
+    monkeypatch.setenv("TRACE_MAX_MB", "7")
+    tracing = FakeTracing(size=1024 * 1024)
+    recorder = TraceRecorder(FakeContext(tracing), "dataprev")
+    recorder.start()
+    client = FakeClient(recorder)
+
+    stamps = iter(f"20260101_0000{second:02d}" for second in range(10))
+    monkeypatch.setattr("src.tracing._timestamp", lambda: next(stamps))
+    for _ in range(4):
+        with pytest.raises(RuntimeError):
+            client.fail()
+
+    folders = _flushed(trace_env)
+    assert folders == [
+        "20260101_000002_dataprev_cliente_falla",
+        "20260101_000003_dataprev_cliente_falla",
+    ]
+    recorder.stop()
+
+
+def test_disabled_recorder_does_not_trace(trace_env, monkeypatch):
+    monkeypatch.setenv("TRACE_ENABLED", "false")
+    tracing = FakeTracing()
+    recorder = TraceRecorder(FakeContext(tracing), "erp")
+    recorder.start()
+    client = FakeClient(recorder)
+
+    with pytest.raises(RuntimeError):
+        client.fail()
+    assert tracing.chunks == []
+    assert _flushed(trace_env) == []
+
+
+def test_async_overlapping_steps_share_one_chunk(trace_env):
+    tracing = AsyncFakeTracing()
+    recorder = AsyncTraceRecorder(FakeContext(tracing), "erp")
+
+    async def scenario():
+        await recorder.start()
+
+        async def step(name, delay, fail=False):
+            async with recorder.step(name):
+                await asyncio.sleep(delay)
+                if fail:
+                    raise RuntimeError("diálogo sin beneficio")
+
+        results = await asyncio.gather(
+            step("erp.dialog_read", 0.05, fail=True),
+            step("erp.dialog_read", 0.01, fail=True),
+            return_exceptions=True,
+        )
+        await recorder.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # Playwright solo admite un fragmento abierto: el segundo paso va dentro del primero
+    assert tracing.chunks == ["erp.dialog_read"]
+    assert len(_flushed(trace_env)) == 1
+    assert tracing.stopped
+
+
+@pytest.mark.parametrize("owner_delay, worker_delay", [(0.05, 0.01), (0.01, 0.05)])
+def test_async_failure_of_a_joined_step_is_flushed(trace_env, owner_delay, worker_delay):
+    tracing = AsyncFakeTracing()
+    recorder = AsyncTraceRecorder(FakeContext(tracing), "dataprev")
+
+    async def scenario():
+        await recorder.start()
+
+        async def step(name, delay, fail=False):
+            async with recorder.step(name):
+                await asyncio.sleep(delay)
+                if fail:
+                    raise RuntimeError("consulta sin respuesta")
+
+        async def worker():
+            # Se une al fragmento abierto por el primer paso
+            await asyncio.sleep(0.001)
+            await step("dataprev.worker", worker_delay, fail=True)
+
+        results = await asyncio.gather(
+            step("dataprev.owner", owner_delay), worker(), return_exceptions=True
+        )
+        await recorder.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert results[0] is None and isinstance(results[1], RuntimeError)
+    # Un solo fragmento, que sigue abierto hasta que termina el último paso
+    assert tracing.chunks == ["dataprev.owner"]
+    folders = _flushed(trace_env)
+    assert len(folders) == 1 and folders[0].endswith("_dataprev_dataprev_worker")
+    error = (trace_env / folders[0] / "error.txt").read_text()
+    assert error.startswith("dataprev.worker: consulta sin respuesta")
+
+
+def test_caught_errors_can_mark_the_step_failed(trace_env):
+    tracing = FakeTracing()
+    recorder = TraceRecorder(FakeContext(tracing), "dataprev")
+    recorder.start()
+
+    with recorder.step("dataprev.check_benefits"):
+        recorder.fail("dataprev.check_benefits", RuntimeError("página cerrada"))
+        recorder.fail("dataprev.check_benefits", RuntimeError("segundo error"))
+
+    folders = _flushed(trace_env)
+    assert len(folders) == 1
+    assert "página cerrada" in (trace_env / folders[0] / "error.txt").read_text()
+    # Fuera de un paso no hay fragmento que volcar
+    recorder.fail("dataprev.check_benefits", RuntimeError("sin paso"))
+    assert len(_flushed(trace_env)) == 1
+    recorder.stop()
+
+
+def test_caught_dialog_page_errors_flush_the_trace(trace_env, tmp_path):
+    tracing = FakeTracing()
+    client = ERPClient(ledger=ProcessedLedger(str(tmp_path / "ledger.db")))
+    client.context = FakeDialogContext(tracing)
+    client.waiter = types.SimpleNamespace(default_timeout=1000)
+    client.tracer = TraceRecorder(client.context, "erp")
+    client.tracer.start()
+
+    results, expired = client._read_dialog_pages(
+        [{"cpf": "1", "dialog_url": "f?p=100:73:12345::NO::P73_CPF:1"}]
+    )
+
+    # El error se recoge sin propagarse, pero la traza del paso se vuelca igualmente
+    assert results == {} and not expired
+    folders = _flushed(trace_env)
+    assert len(folders) == 1 and folders[0].endswith("_erp_erp_dialog_pages")
+    client.cleanup()
+
+
+def test_caught_dataprev_errors_flush_the_batch_trace(trace_env, monkeypatch):
+    monkeypatch.setenv("DATAPREV_URL", "https://dataprev.example.com")
+    tracing = FakeTracing()
+    client = DataprevClient()
+    client.context = FakeDialogContext(tracing)
+    client.page = FakeDialogPage()
+    client.tracer = TraceRecorder(client.context, "dataprev")
+    client.tracer.start()
+
+    results = client.check_benefits([("1", "NB1"), ("2", "NB2")], retries=0)
+
+    assert [result["status"] for result in results] == [None, None]
+    assert all(result["error"] for result in results)
+    folders = _flushed(trace_env)
+    assert len(folders) == 1 and folders[0].endswith("_dataprev_dataprev_check_benefits")
+    client.cleanup()